@@ -1,20 +1,39 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, WebSocket, WebSocketDisconnect
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import suppress
+from typing import List, Optional, Dict, Any, AsyncGenerator
 from pydantic import BaseModel
+import asyncio
 import uuid
 import json
 
-from app.services.bedrock_client import BedrockClient
+from app.services.bedrock_client import BedrockClient, FALLBACK_RESPONSE
 from app.services.retrieval import retrieve_relevant_chunks
+from app.services.prefetch import RetrievalPrefetcher
+from app.services import conversation_store
+from app.services.conversation_store import store_messages
 from app.models.conversation import Message, Conversation
+from app.utils.admission import acquire_slot, AdmissionSlot, ServiceOverloadedError
+from app.utils.resilience import set_deadline
+from app.utils.config import get_settings
 
 router = APIRouter()
+settings = get_settings()
+
+async def save_exchange(conversation_id: str, query: str, response: str, contexts: Optional[List[Dict[str, Any]]]):
+    """Store a turn, unless generation failed"""
+    # The apology is no answer, and later prompts must not see it as one
+    if response.endswith(FALLBACK_RESPONSE):
+        return
+    await store_messages(conversation_id, query, response, contexts)
 
 class QueryRequest(BaseModel):
     query: str
     conversation_id: Optional[str] = None
     knowledge_base_ids: Optional[List[str]] = None
     model_params: Optional[Dict[str, Any]] = None
+    stream: bool = False  # Respond with Server-Sent Events
 
 class ConversationRequest(BaseModel):
     title: Optional[str] = None
@@ -23,12 +42,29 @@ class ConversationRequest(BaseModel):
 @router.post("/query")
 async def query(
     request: QueryRequest,
-    background_tasks: BackgroundTasks,
+    http_request: Request,
 ):
-    """Process a query using RAG approach"""
+    """Process a query using RAG approach.
+
+    Clients that send ``stream: true`` or ``Accept: text/event-stream`` get
+    Server-Sent Events: a ``sources`` event once retrieval is done, ``token``
+    events as Bedrock generates, then ``done``.
+    """
     # Generate a new conversation ID if not provided
     conversation_id = request.conversation_id or str(uuid.uuid4())
+    streaming = request.stream or "text/event-stream" in http_request.headers.get("accept", "")
+    
+    # Initialize Bedrock client with model parameters; an unknown model is rejected up front
+    try:
+        client = BedrockClient(request.model_params or {})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
+    # The slot is held until the response is complete, including streaming
+    slot = await acquire_slot("interactive", http_request)
+    handed_off = False
+    # Bounds retrieval and generation; a stream only has to start within it
+    set_deadline(settings.REQUEST_DEADLINE_SECONDS)
     try:
         # Retrieve relevant context from knowledge base(s)
         contexts = await retrieve_relevant_chunks(
@@ -36,8 +72,15 @@ async def query(
             knowledge_base_ids=request.knowledge_base_ids,
         )
         
-        # Initialize Bedrock client with model parameters
-        client = BedrockClient(request.model_params or {})
+        if streaming:
+            # The stream releases the slot when it finishes
+            handed_off = True
+            return StreamingResponse(
+                stream_query_events(http_request, request, conversation_id, contexts, client, slot),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                background=BackgroundTask(slot.release),
+            )
         
         # Generate response using the context and query
         response = await client.generate_response(
@@ -46,14 +89,8 @@ async def query(
             conversation_id=conversation_id,
         )
         
-        # Store messages in the background
-        background_tasks.add_task(
-            store_messages,
-            conversation_id,
-            request.query,
-            response,
-            contexts,
-        )
+        # Stored before answering, so the next turn sees it on any worker
+        await save_exchange(conversation_id, request.query, response, contexts)
         
         return {
             "conversation_id": conversation_id,
@@ -61,56 +98,136 @@ async def query(
             "sources": [ctx["source"] for ctx in contexts] if contexts else [],
         }
         
+    except ServiceOverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not handed_off:
+            slot.release()
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_query_events(
+    http_request: Request,
+    request: QueryRequest,
+    conversation_id: str,
+    contexts: List[Dict[str, Any]],
+    client: BedrockClient,
+    slot: AdmissionSlot,
+) -> AsyncGenerator[str, None]:
+    """Yield sources, then tokens as they arrive, with keepalives while Bedrock is quiet.
+
+    Stops generation when the client disconnects. Tokens are only pulled from
+    Bedrock as fast as the client reads them.
+    """
+    yield sse_event("sources", {
+        "conversation_id": conversation_id,
+        "sources": [ctx["source"] for ctx in contexts] if contexts else [],
+    })
+    
+    tokens = client.generate_response_stream(
+        query=request.query,
+        contexts=contexts,
+        conversation_id=conversation_id,
+    )
+    next_token = None
+    parts = []
+    try:
+        while True:
+            if next_token is None:
+                next_token = asyncio.ensure_future(tokens.__anext__())
+            done, _ = await asyncio.wait({next_token}, timeout=settings.SSE_KEEPALIVE_SECONDS)
+            if await http_request.is_disconnected():
+                return
+            if not done:
+                # SSE comment lines keep proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            
+            try:
+                token = next_token.result()
+            except StopAsyncIteration:
+                next_token = None
+                break
+            except ServiceOverloadedError as e:
+                next_token = None
+                yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+                return
+            next_token = None
+            parts.append(token)
+            yield sse_event("token", {"text": token})
+        
+        # Stored before "done", so the next turn sees it on any worker
+        await save_exchange(conversation_id, request.query, "".join(parts), contexts)
+        yield sse_event("done", {"conversation_id": conversation_id})
+    finally:
+        if next_token is not None:
+            next_token.cancel()
+            with suppress(BaseException):
+                await next_token
+        await tokens.aclose()
+        slot.release()
 
 @router.post("/conversations")
 async def create_conversation(request: ConversationRequest):
     """Create a new conversation"""
-    conversation_id = str(uuid.uuid4())
-    # Store in database (implementation omitted)
-    return {"id": conversation_id, "title": request.title or "New Conversation"}
+    conversation = Conversation(
+        title=request.title or "New Conversation",
+        knowledge_base_ids=request.knowledge_base_ids,
+    )
+    await conversation_store.create_conversation(conversation)
+    return {"id": conversation.id, "title": conversation.title}
 
 @router.get("/conversations")
-async def list_conversations(skip: int = 0, limit: int = 20):
-    """List user's conversations"""
-    # This would query the database for the user's conversations
-    return {
-        "items": [
-            {"id": "1", "title": "Sample Conversation", "last_message": "Hello, how can I help?", "updated_at": "2023-01-01T00:00:00Z"},
-        ],
-        "total": 1
-    }
+async def list_conversations(cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100)):
+    """List conversations, most recently active first.
+
+    Pass ``next_cursor`` from a response as ``cursor`` to get the next page.
+    """
+    try:
+        items, next_cursor = await conversation_store.list_conversations(cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.get("/conversations/{conversation_id}")
-async def get_conversation(conversation_id: str):
-    """Get conversation by ID including messages"""
-    # Query conversation from database
-    return {
-        "id": conversation_id,
-        "title": "Sample Conversation",
-        "messages": [
-            {"role": "user", "content": "Hello", "timestamp": "2023-01-01T00:00:00Z"},
-            {"role": "assistant", "content": "Hello, how can I help?", "timestamp": "2023-01-01T00:00:01Z"},
-        ],
-    }
+async def get_conversation(
+    conversation_id: str,
+    before: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+):
+    """Get a conversation with its newest messages.
+
+    Messages are in chronological order; pass ``next_cursor`` as ``before``
+    to page back through older messages.
+    """
+    conversation = await conversation_store.get_conversation(conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    messages, next_cursor = await conversation_store.list_messages(conversation_id, before, limit)
+    return {**conversation, "messages": messages, "next_cursor": next_cursor}
 
 @router.delete("/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str):
     """Delete a conversation"""
-    # Delete implementation
+    if not await conversation_store.delete_conversation(conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
     return {"success": True, "message": f"Conversation {conversation_id} deleted"}
 
-async def store_messages(conversation_id: str, query: str, response: str, contexts: List[dict]):
-    """Background task to store messages in the database"""
-    # Store user message, system response, and context references in the database
-    # Implementation would depend on your database choice
-    pass
-
 # WebSocket endpoint for real-time conversation
 @router.websocket("/ws/{conversation_id}")
 async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
+    """Answer queries over a websocket.
+
+    Besides queries, clients may send ``{"type": "prefetch", "query": ...}``
+    with the draft while the user types; retrieval then runs ahead, and a
+    query matching the last draft reuses its results.
+    """
     await websocket.accept()
+    prefetcher = RetrievalPrefetcher(websocket)
     try:
         # Set up Bedrock client
         client = BedrockClient({})
@@ -120,19 +237,39 @@ async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
             data = await websocket.receive_text()
             request_data = json.loads(data)
             
-            # Process the query with RAG
-            contexts = await retrieve_relevant_chunks(
-                query=request_data["query"],
-                knowledge_base_ids=request_data.get("knowledge_base_ids"),
-            )
+            if request_data.get("type") == "prefetch":
+                if settings.PREFETCH_ENABLED:
+                    prefetcher.prefetch(request_data.get("query") or "", request_data.get("knowledge_base_ids"))
+                continue
             
-            # Stream responses if supported
-            for chunk in await client.generate_response_stream(
-                query=request_data["query"],
-                contexts=contexts,
-                conversation_id=conversation_id,
-            ):
-                await websocket.send_text(json.dumps({"chunk": chunk}))
+            # Each message takes an interactive admission slot like an HTTP query
+            try:
+                slot = await acquire_slot("interactive", websocket)
+                set_deadline(settings.REQUEST_DEADLINE_SECONDS)
+                try:
+                    # Process the query with RAG, unless it was retrieved while being typed
+                    contexts = await prefetcher.take(request_data["query"], request_data.get("knowledge_base_ids"))
+                    if contexts is None:
+                        contexts = await retrieve_relevant_chunks(
+                            query=request_data["query"],
+                            knowledge_base_ids=request_data.get("knowledge_base_ids"),
+                        )
+                    
+                    # Stream responses if supported
+                    parts = []
+                    async for chunk in client.generate_response_stream(
+                        query=request_data["query"],
+                        contexts=contexts,
+                        conversation_id=conversation_id,
+                    ):
+                        parts.append(chunk)
+                        await websocket.send_text(json.dumps({"chunk": chunk}))
+                    await save_exchange(conversation_id, request_data["query"], "".join(parts), contexts)
+                finally:
+                    slot.release()
+            except ServiceOverloadedError as e:
+                await websocket.send_text(json.dumps({"error": str(e), "retry_after": e.retry_after}))
+                continue
             
             # Send completion message
             await websocket.send_text(json.dumps({"complete": True}))
@@ -140,3 +277,5 @@ async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
     except WebSocketDisconnect:
         # Handle disconnect
         pass
+    finally:
+        prefetcher.cancel()
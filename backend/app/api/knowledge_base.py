@@ -1,14 +1,22 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query
 from fastapi.responses import JSONResponse
 from typing import List, Optional
+import asyncio
 import os
 import shutil
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 import uuid
-from app.services.document_processor import process_document
+from app.services.document_processor import process_document, reprocess_documents
+from app.services.extraction import check_chunking
+from app.services import vector_store, document_lifecycle
+from app.services.vector_store import list_chunk_indexes, get_document_metadata
+from app.services.reindex import start_reindex, load_job, list_jobs, rollback_chunk_index
 from app.services.url_processor import extract_from_url
+from app.services.retrieval import retrieve_relevant_chunks_batch
 from app.models.knowledge_base import Document, DocumentMetadata
 from app.utils.config import get_settings
+from app.utils.admission import admit, ServiceOverloadedError
+from app.utils.resilience import set_deadline
 
 router = APIRouter()
 settings = get_settings()
@@ -18,85 +26,227 @@ class UrlRequest(BaseModel):
     title: Optional[str] = None
     tags: Optional[List[str]] = None
 
-@router.post("/upload")
+class ReprocessRequest(BaseModel):
+    document_ids: Optional[List[str]] = None  # All documents, as a background reindex job, when omitted
+    chunk_size: Optional[int] = Field(None, gt=0)
+    overlap: Optional[int] = Field(None, ge=0)
+
+    @model_validator(mode="after")
+    def validate_chunking(self):
+        check_chunking(self.chunk_size, self.overlap)
+        return self
+
+@router.post("/upload", dependencies=[Depends(admit("bulk"))])
 async def upload_documents(
     files: List[UploadFile] = File(...),
     tags: Optional[str] = Form(None),
 ):
     """Upload documents to the knowledge base"""
-    results = []
     tags_list = tags.split(",") if tags else []
     
-    for file in files:
-        # Validate file extension
-        ext = os.path.splitext(file.filename)[1][1:].lower()
-        if ext not in settings.ALLOWED_EXTENSIONS:
-            results.append({"filename": file.filename, "success": False, "error": "File type not allowed"})
-            continue
-            
-        # Generate unique filename
-        unique_filename = f"{uuid.uuid4().hex}_{file.filename}"
-        file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
-        
-        # Save file
-        try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        except Exception as e:
-            results.append({"filename": file.filename, "success": False, "error": str(e)})
-            continue
+    # Process files concurrently up to the configured limit; gather keeps the
+    # results in the same order as the uploaded files
+    semaphore = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
+    
+    async def process_upload(file: UploadFile) -> dict:
+        async with semaphore:
+            return await save_and_process_upload(file, tags_list)
+    
+    return await asyncio.gather(*(process_upload(file) for file in files))
+
+async def save_and_process_upload(file: UploadFile, tags_list: List[str]) -> dict:
+    """Save one uploaded file and run it through the ingestion pipeline"""
+    # Validate file extension
+    ext = os.path.splitext(file.filename)[1][1:].lower()
+    if ext not in settings.ALLOWED_EXTENSIONS:
+        return {"filename": file.filename, "success": False, "error": "File type not allowed"}
         
-        # Process document
-        try:
-            doc_id = await process_document(file_path, file.filename, tags_list)
-            results.append({"filename": file.filename, "success": True, "id": doc_id})
-        except Exception as e:
-            # Clean up the file if processing failed
-            os.remove(file_path)
-            results.append({"filename": file.filename, "success": False, "error": str(e)})
+    # Generate unique filename
+    unique_filename = f"{uuid.uuid4().hex}_{file.filename}"
+    file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
+    
+    # Save file
+    try:
+        with open(file_path, "wb") as buffer:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
+    except Exception as e:
+        return {"filename": file.filename, "success": False, "error": str(e)}
     
-    return results
+    # Process document
+    try:
+        doc_id = await process_document(file_path, file.filename, tags_list)
+        return {"filename": file.filename, "success": True, "id": doc_id}
+    except Exception as e:
+        # Clean up the file if processing failed
+        os.remove(file_path)
+        return {"filename": file.filename, "success": False, "error": str(e)}
 
-@router.post("/url")
+@router.post("/url", dependencies=[Depends(admit("bulk"))])
 async def add_url(request: UrlRequest):
     """Add content from URL to the knowledge base"""
     try:
         doc_id = await extract_from_url(request.url, request.title, request.tags or [])
         return {"success": True, "id": doc_id, "url": request.url}
+    except ServiceOverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/reprocess", dependencies=[Depends(admit("bulk"))])
+async def reprocess(request: ReprocessRequest):
+    """Re-chunk and re-embed documents from their extracted-text artifacts.
+
+    Without document IDs the whole corpus is re-chunked by a background
+    reindex job into a new index version; poll it at /index/reindex/{id}.
+    """
+    if not request.document_ids:
+        try:
+            job = await start_reindex(
+                chunk_size=settings.CHUNK_SIZE if request.chunk_size is None else request.chunk_size,
+                overlap=request.overlap,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return {"job": job}
+    
+    results = await reprocess_documents(request.document_ids, request.chunk_size, request.overlap)
+    return {
+        "total": len(results),
+        "succeeded": sum(1 for result in results if result["success"]),
+        "results": results,
+    }
+
+class RetrievalQuery(BaseModel):
+    query: str
+    knowledge_base_ids: Optional[List[str]] = None
+    top_k: int = Field(5, ge=1, le=settings.RETRIEVE_MAX_TOP_K)
+
+class BatchRetrieveRequest(BaseModel):
+    queries: List[RetrievalQuery]
+
+@router.post("/retrieve/batch", dependencies=[Depends(admit("bulk"))])
+async def retrieve_batch(request: BatchRetrieveRequest):
+    """Retrieve chunks for many queries with one embedding batch and one _msearch"""
+    if len(request.queries) > settings.RETRIEVE_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.RETRIEVE_BATCH_MAX_QUERIES} queries per batch",
+        )
+    set_deadline(settings.REQUEST_DEADLINE_SECONDS)
+    results = await retrieve_relevant_chunks_batch([query.model_dump() for query in request.queries])
+    return {
+        "results": [
+            {"query": query.query, "chunks": chunks}
+            for query, chunks in zip(request.queries, results)
+        ]
+    }
+
+class ReindexRequest(BaseModel):
+    embedding_provider: Optional[str] = None
+    embedding_model: Optional[str] = None
+    chunk_size: Optional[int] = Field(None, gt=0)  # Re-chunk from artifacts when set
+    overlap: Optional[int] = Field(None, ge=0)
+    max_chunks_per_sec: Optional[float] = Field(None, ge=0)
+
+    @model_validator(mode="after")
+    def validate_chunking(self):
+        if self.chunk_size is not None or self.overlap is not None:
+            check_chunking(self.chunk_size, self.overlap)
+        return self
+
+@router.get("/index")
+async def get_index_versions():
+    """List chunk index versions and the one the alias points to"""
+    return {"indexes": await list_chunk_indexes(), "jobs": list_jobs()}
+
+@router.post("/index/reindex")
+async def reindex(request: ReindexRequest):
+    """Start a background reindex into a new index version"""
+    try:
+        return await start_reindex(
+            embedding_provider=request.embedding_provider,
+            embedding_model=request.embedding_model,
+            chunk_size=request.chunk_size,
+            overlap=request.overlap,
+            max_chunks_per_sec=request.max_chunks_per_sec,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/index/reindex/{job_id}")
+async def get_reindex_job(job_id: str):
+    """Get reindex job progress"""
+    job = load_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Reindex job not found")
+    return job
+
+@router.post("/index/rollback")
+async def rollback_index():
+    """Point the chunk alias back at the previous index version"""
+    try:
+        return {"success": True, "index": await rollback_chunk_index()}
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 @router.get("/documents")
 async def list_documents(
     search: Optional[str] = None,
     tags: Optional[List[str]] = Query(None),
-    skip: int = 0,
-    limit: int = 100,
+    type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    facets: bool = True,
 ):
-    """List documents in the knowledge base with optional filtering"""
-    # This would be implemented to query the document metadata from the database
-    # For now, just return a mock response
-    return {
-        "items": [
-            {"id": "1", "title": "Sample Document", "type": "pdf", "tags": ["sample"], "created_at": "2023-01-01T00:00:00Z"},
-        ],
-        "total": 1
-    }
+    """List documents, newest first, with title search and tag/type filters.
+
+    Pass ``next_cursor`` from a response as ``cursor`` to get the next page.
+    The first page also carries tag and type facet counts.
+    """
+    try:
+        return await vector_store.list_documents(
+            search=search,
+            tags=tags,
+            doc_type=type,
+            cursor=cursor,
+            limit=limit,
+            include_facets=facets,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/documents/{doc_id}")
 async def get_document(doc_id: str):
     """Get document metadata by ID"""
-    # This would query the document from the database
-    return {"id": doc_id, "title": "Sample Document", "type": "pdf", "tags": ["sample"], "created_at": "2023-01-01T00:00:00Z"}
+    metadata = await get_document_metadata(doc_id)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return metadata
 
-@router.delete("/documents/{doc_id}")
+@router.delete("/documents/{doc_id}", status_code=202)
 async def delete_document(doc_id: str):
-    """Delete document from knowledge base"""
-    # Delete document implementation
-    return {"success": True, "message": f"Document {doc_id} deleted"}
+    """Delete a document and, in the background, all of its chunks.
+
+    The document disappears from listings and search immediately; poll
+    ``/documents/{doc_id}/deletion`` for chunk deletion progress.
+    """
+    status = await document_lifecycle.delete_document(doc_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return status
+
+@router.get("/documents/{doc_id}/deletion")
+async def get_document_deletion(doc_id: str):
+    """Progress of a document deletion"""
+    status = await document_lifecycle.get_deletion_status(doc_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No deletion in progress for this document")
+    return status
 
 @router.post("/documents/{doc_id}/tags")
 async def update_document_tags(doc_id: str, tags: List[str]):
-    """Update document tags"""
-    # Update tags implementation
-    return {"success": True, "id": doc_id, "tags": tags}
+    """Replace document tags, in its metadata and in every chunk"""
+    result = await document_lifecycle.update_document_tags(doc_id, tags)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"success": True, **result}
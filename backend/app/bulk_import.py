@@ -0,0 +1,301 @@
+"""Offline bulk import of documents, without going through the HTTP API.
+
+Walks directories and zip archives and runs every supported file through
+the same extract, dedup, embed and index stages as uploads. Files move
+through the stages concurrently, so extraction of one file overlaps
+embedding and indexing of others. A checkpoint manifest (SQLite) records
+each file's outcome; rerunning the same command skips finished files and
+cleanly re-imports files that were interrupted or failed.
+
+Usage (from the backend directory):
+
+    python -m app.bulk_import /corpus/reports /corpus/archive.zip --tags corpus
+    python -m app.bulk_import /corpus --manifest /data/corpus-import.sqlite3 --files-in-flight 32
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Import files and zip archives into the DeepTalk knowledge base")
+    parser.add_argument("paths", nargs="+", help="Files, directories or zip archives to import")
+    parser.add_argument("--tags", default="", help="Comma-separated tags for every imported document")
+    parser.add_argument("--manifest", default="bulk-import.sqlite3", help="Checkpoint manifest used to resume")
+    parser.add_argument("--files-in-flight", type=int, default=0,
+                        help="Files moving through the pipeline at once, 0 = 4 per extraction process")
+    parser.add_argument("--extract-workers", type=int, help="Extraction processes (PROCESS_POOL_WORKERS)")
+    parser.add_argument("--embed-concurrency", type=int, help="Concurrent embedding batches (EMBED_CONCURRENCY)")
+    parser.add_argument("--index-concurrency", type=int, help="Concurrent bulk requests (INDEX_CONCURRENCY)")
+    parser.add_argument("--dry-run", action="store_true", help="List what would be imported and exit")
+    return parser.parse_args(argv)
+
+def configure_environment(args: argparse.Namespace):
+    """Apply stage limits through settings; must run before importing the app"""
+    overrides = {
+        "PROCESS_POOL_WORKERS": args.extract_workers,
+        "EMBED_CONCURRENCY": args.embed_concurrency,
+        "INDEX_CONCURRENCY": args.index_concurrency,
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            os.environ[name] = str(value)
+
+class ImportSource:
+    """A file to import: a path on disk, or a member of a zip archive"""
+    __slots__ = ("key", "path", "member", "filename", "size", "mtime")
+
+    def __init__(self, path: str, size: int, mtime: float, member: Optional[str] = None):
+        self.path = path
+        self.member = member
+        self.key = f"{path}!{member}" if member else path
+        self.filename = os.path.basename(member or path)
+        self.size = size
+        self.mtime = mtime
+
+def discover_sources(paths: List[str], extensions: List[str]) -> List[ImportSource]:
+    """Supported files under the given paths, in a stable order"""
+    extensions = {extension.lower() for extension in extensions}
+    sources: List[ImportSource] = []
+
+    def supported(name: str) -> bool:
+        return os.path.splitext(name)[1][1:].lower() in extensions
+
+    def add_file(path: str):
+        if path.lower().endswith(".zip"):
+            add_archive(path)
+        elif supported(path):
+            stat = os.stat(path)
+            sources.append(ImportSource(path, stat.st_size, stat.st_mtime))
+
+    def add_archive(path: str):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and supported(info.filename):
+                    mtime = datetime(*info.date_time).timestamp()
+                    sources.append(ImportSource(path, info.file_size, mtime, member=info.filename))
+
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    add_file(os.path.join(root, name))
+        else:
+            add_file(path)
+    return sources
+
+class ImportManifest:
+    """Checkpoint of every file's import state, keyed by path (and zip member).
+
+    A file is recorded as "started" with its document ID before it is
+    indexed, so a rerun can tell an interrupted import apart from one that
+    never began and re-import it under the same ID.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                source TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                status TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                chunks INTEGER,
+                error TEXT,
+                updated_at TEXT NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        rows = self.conn.execute("SELECT source, size, mtime, status, doc_id FROM files")
+        return {
+            source: {"size": size, "mtime": mtime, "status": status, "doc_id": doc_id}
+            for source, size, mtime, status, doc_id in rows
+        }
+
+    def record(self, source: ImportSource, status: str, doc_id: str, chunks: Optional[int] = None, error: Optional[str] = None):
+        self.conn.execute(
+            """INSERT OR REPLACE INTO files (source, size, mtime, status, doc_id, chunks, error, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (source.key, source.size, source.mtime, status, doc_id, chunks, error, datetime.now().isoformat()),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+class ImportProgress:
+    """Counters of a running import, rendered as one live status line"""
+
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.imported = 0
+        self.failed = 0
+        self.chunks = 0
+        self.bytes = 0
+        self.start = time.perf_counter()
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.start
+        return {
+            "files": self.total,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "chunks": self.chunks,
+            "seconds": elapsed,
+            "files_per_sec": self.imported / elapsed if elapsed else 0.0,
+            "chunks_per_sec": self.chunks / elapsed if elapsed else 0.0,
+            "mb_per_sec": self.bytes / elapsed / 1e6 if elapsed else 0.0,
+        }
+
+    def render(self) -> str:
+        stats = self.summary()
+        finished = self.imported + self.failed + self.skipped
+        remaining = self.total - finished
+        eta = remaining / stats["files_per_sec"] if stats["files_per_sec"] else 0.0
+        return (
+            f"{finished}/{self.total} files ({self.skipped} skipped, {self.failed} failed) | "
+            f"{stats['files_per_sec']:.1f} files/s | {stats['chunks_per_sec']:.0f} chunks/s | "
+            f"{stats['mb_per_sec']:.2f} MB/s | ETA {eta:.0f}s"
+        )
+
+    async def report(self, interval: float = 1.0):
+        """Print the status line until cancelled; redraws in place on a terminal"""
+        interactive = sys.stderr.isatty()
+        while True:
+            await asyncio.sleep(interval)
+            line = self.render()
+            print(f"\r{line}" if interactive else line, end="" if interactive else "\n", file=sys.stderr, flush=True)
+
+def stage_member(source: ImportSource, staging_dir: str) -> str:
+    """Copy a zip member to the staging directory so the extraction workers can read it"""
+    target = os.path.join(staging_dir, f"{os.urandom(8).hex()}_{source.filename}")
+    with zipfile.ZipFile(source.path) as archive, archive.open(source.member) as member, open(target, "wb") as out:
+        shutil.copyfileobj(member, out)
+    return target
+
+async def import_source(
+    source: ImportSource,
+    previous: Optional[Dict[str, Any]],
+    manifest: ImportManifest,
+    tags: List[str],
+    staging_dir: str,
+    progress: ImportProgress,
+):
+    """Import one file, recording the outcome in the manifest"""
+    from app.services.dedup import stop_matching_document
+    from app.services.document_processor import document_lock, ingest_file, retire_old_chunks
+
+    # Files seen before keep their document ID, so a re-import replaces
+    # whatever an interrupted or outdated run left behind
+    doc_id = previous["doc_id"] if previous else str(uuid.uuid4())
+    manifest.record(source, "started", doc_id)
+    file_path = source.path
+    try:
+        if source.member:
+            file_path = await asyncio.to_thread(stage_member, source, staging_dir)
+        async with document_lock(doc_id):
+            old_chunk_ids = await stop_matching_document(doc_id) if previous else []
+            document = await ingest_file(file_path, source.filename, tags, doc_id=doc_id)
+        if previous:
+            # Chunks from the earlier attempt, once other documents' duplicates of them are indexed
+            await retire_old_chunks(doc_id, old_chunk_ids, keep_ids=[chunk.id for chunk in document.chunks])
+    except Exception as e:
+        progress.failed += 1
+        manifest.record(source, "failed", doc_id, error=str(e))
+        return
+    finally:
+        if source.member and file_path != source.path and os.path.exists(file_path):
+            os.remove(file_path)
+
+    progress.imported += 1
+    progress.chunks += document.metadata.chunk_count or 0
+    progress.bytes += source.size
+    manifest.record(source, "done", doc_id, chunks=document.metadata.chunk_count)
+
+async def run_import(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.services import document_processor
+    from app.services.extraction import check_chunking
+    from app.utils.config import get_settings
+
+    settings = get_settings()
+    # CHUNK_SIZE and CHUNK_OVERLAP come from the environment here
+    check_chunking(None, None)
+    tags = [tag.strip() for tag in args.tags.split(",") if tag.strip()]
+    sources = await asyncio.to_thread(discover_sources, args.paths, settings.ALLOWED_EXTENSIONS)
+
+    manifest = ImportManifest(args.manifest)
+    previous = manifest.load()
+
+    pending = []
+    for source in sources:
+        entry = previous.get(source.key)
+        unchanged = entry and entry["size"] == source.size and entry["mtime"] == source.mtime
+        if unchanged and entry["status"] == "done":
+            continue
+        pending.append((source, entry))
+
+    if args.dry_run:
+        for source, entry in pending:
+            print(f"{'re-import' if entry else 'import'}\t{source.key}")
+        manifest.close()
+        return {"files": len(sources), "pending": len(pending)}
+
+    progress = ImportProgress(len(sources), skipped=len(sources) - len(pending))
+    in_flight = args.files_in_flight or 4 * (settings.PROCESS_POOL_WORKERS or os.cpu_count() or 1)
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+
+    async def worker(staging_dir: str):
+        while not queue.empty():
+            source, entry = queue.get_nowait()
+            await import_source(source, entry, manifest, tags, staging_dir, progress)
+
+    reporter = asyncio.create_task(progress.report())
+    try:
+        with tempfile.TemporaryDirectory(prefix="deeptalk-import-") as staging_dir:
+            await asyncio.gather(*(worker(staging_dir) for _ in range(min(in_flight, len(pending)) or 1)))
+    finally:
+        reporter.cancel()
+        manifest.close()
+        if document_processor._process_pool is not None:
+            document_processor._process_pool.shutdown()
+
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+    print(progress.render(), file=sys.stderr)
+    return progress.summary()
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    try:
+        summary = asyncio.run(run_import(args))
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    for name, value in summary.items():
+        print(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
+    if summary.get("failed"):
+        print(f"{summary['failed']} files failed; rerun the same command to retry them", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
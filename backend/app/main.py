@@ -1,11 +1,86 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from starlette.routing import Match
+from prometheus_client import CollectorRegistry, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+from contextlib import asynccontextmanager
 import os
+import logging
+import time
+import fcntl
 
 from app.api import knowledge_base, conversation
+from app.services.reindex import resume_reindex_jobs
+from app.services.document_lifecycle import resume_document_deletions
+from app.services.conversation_store import close_message_writer
+from app.services.embedding import get_embedding_spec, warmup_embeddings
+from app.services.rerank import warmup_reranker
+from app.services.vector_store import get_active_embedding_spec
+from app.utils.config import get_settings
+from app.utils.admission import ServiceOverloadedError
+from app.utils.metrics import (
+    REQUEST_LATENCY,
+    REQUESTS_IN_FLIGHT,
+    current_endpoint,
+    request_timings,
+    server_timing_header,
+)
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+async def warm_up_backends():
+    """Load the live embedding model (and reranker) and create clients before serving traffic"""
+    try:
+        spec = await get_active_embedding_spec()
+    except Exception:
+        logger.exception("Reading the live embedding model failed, warming up the configured one")
+        spec = get_embedding_spec()
+    try:
+        await warmup_embeddings(spec["provider"], spec["model"])
+    except Exception:
+        logger.exception("Embedding warmup failed")
+    if settings.RERANK_ENABLED:
+        try:
+            await warmup_reranker()
+        except Exception:
+            logger.exception("Reranker warmup failed")
+
+# Open while this process owns background jobs; the lock is released when it exits
+_background_jobs_lock = None
+
+def acquire_background_jobs_lock() -> bool:
+    """Whether this worker should resume background jobs; only one worker gets the lock"""
+    global _background_jobs_lock
+    lock_dir = os.path.dirname(settings.BACKGROUND_JOBS_LOCK_PATH)
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+    lock_file = open(settings.BACKGROUND_JOBS_LOCK_PATH, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _background_jobs_lock = lock_file
+    return True
 
-app = FastAPI(title="DeepTalk API", description="Knowledge-base powered conversational AI")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.EMBEDDING_WARMUP:
+        await warm_up_backends()
+    # Pick up reindex jobs and document deletions interrupted by a restart,
+    # in one worker only so they do not run twice
+    if acquire_background_jobs_lock():
+        await resume_reindex_jobs()
+        await resume_document_deletions()
+    yield
+    # Write out conversation messages still waiting in the write-behind queue
+    await close_message_writer()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+app = FastAPI(title="DeepTalk API", description="Knowledge-base powered conversational AI", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -16,6 +91,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Label stage metrics with the route and report stage timings in Server-Timing"""
+    endpoint = route_template(request)
+    endpoint_token = current_endpoint.set(endpoint)
+    timings = []
+    timings_token = request_timings.set(timings)
+    in_flight = REQUESTS_IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["Server-Timing"] = server_timing_header(timings, time.perf_counter() - start)
+        return response
+    finally:
+        in_flight.dec()
+        REQUEST_LATENCY.labels(endpoint, request.method, str(status)).observe(time.perf_counter() - start)
+        current_endpoint.reset(endpoint_token)
+        request_timings.reset(timings_token)
+
+@app.exception_handler(ServiceOverloadedError)
+async def overloaded_handler(request: Request, exc: ServiceOverloadedError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+def route_template(request: Request) -> str:
+    """Path template of the matching route, to keep metric label cardinality bounded"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
 # Include routers
 app.include_router(knowledge_base.router, prefix="/api/kb", tags=["Knowledge Base"])
 app.include_router(conversation.router, prefix="/api/conversation", tags=["Conversation"])
@@ -28,10 +141,20 @@ app.mount("/files", StaticFiles(directory="/data/uploads"), name="files")
 async def root():
     return {"message": "Welcome to DeepTalk API"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # With several workers, aggregate the metric files all of them write
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok", "service": "DeepTalk API"}
 
 if __name__ == "__main__":
+    # Development server; production runs python -m app.serve
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import uuid
+import numpy as np
 
 class DocumentMetadata(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -14,18 +15,85 @@ class DocumentMetadata(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.now)
     size_bytes: Optional[int] = None
     page_count: Optional[int] = None
+    content_hash: Optional[str] = None  # Key of the extracted-text artifact
+    chunk_count: Optional[int] = None
+    duplicate_chunk_count: Optional[int] = None  # Near-duplicate chunks linked instead of indexed
     status: str = "processed"  # processing, processed, failed
     error: Optional[str] = None
-    
-class TextChunk(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    document_id: str
-    content: str
-    page_num: Optional[int] = None
-    chunk_num: int
-    embedding: Optional[List[float]] = None
-    metadata: Dict[str, Any] = {}
-
-class Document(BaseModel):
-    metadata: DocumentMetadata
-    chunks: List[TextChunk] = []
+
+class TextChunk:
+    """Lightweight chunk record used on the ingestion path.
+
+    Chunks are created in bulk for every document, so this is a plain
+    ``__slots__`` class rather than a pydantic model. Embeddings are not
+    stored per chunk; they live in ``Document.embeddings`` as one matrix.
+    """
+    __slots__ = ("id", "document_id", "content", "page_num", "chunk_num", "metadata")
+
+    def __init__(
+        self,
+        document_id: str,
+        content: str,
+        chunk_num: int,
+        page_num: Optional[int] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        id: Optional[str] = None,
+    ):
+        self.id = id or str(uuid.uuid4())
+        self.document_id = document_id
+        self.content = content
+        self.page_num = page_num
+        self.chunk_num = chunk_num
+        self.metadata = metadata or {}
+
+    def to_source(self) -> Dict[str, Any]:
+        """Return the chunk fields that are indexed alongside its embedding"""
+        return {
+            "document_id": self.document_id,
+            "content": self.content,
+            "chunk_num": self.chunk_num,
+            "page_num": self.page_num,
+            "metadata": self.metadata,
+        }
+
+class Document:
+    """A document being ingested: metadata, chunks and their embedding matrix.
+
+    ``embeddings`` is a contiguous float32 array of shape
+    ``(len(chunks), dimension)``; row ``i`` belongs to ``chunks[i]``.
+    ``embedding_spec`` is the provider and model that produced it.
+    """
+    __slots__ = ("metadata", "chunks", "embeddings", "embedding_spec")
+
+    def __init__(
+        self,
+        metadata: DocumentMetadata,
+        chunks: Optional[List[TextChunk]] = None,
+        embeddings: Optional[np.ndarray] = None,
+        embedding_spec: Optional[Dict[str, str]] = None,
+    ):
+        self.metadata = metadata
+        self.chunks = chunks or []
+        self.embeddings = embeddings
+        self.embedding_spec = embedding_spec
+
+class ReindexJob(BaseModel):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "running"  # running, completed, failed
+    source_index: str
+    target_index: str
+    embedding_provider: str
+    embedding_model: str
+    chunk_size: Optional[int] = None  # Re-chunk from artifacts when set
+    overlap: Optional[int] = None
+    max_chunks_per_sec: float
+    cursor: Optional[List[Any]] = None  # search_after position in document_metadata
+    documents_done: int = 0
+    chunks_done: int = 0
+    total_documents: Optional[int] = None
+    started_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+    swapped_at: Optional[datetime] = None  # When the alias moved to the target index
+    dedup_done: Optional[int] = None  # Re-chunked documents handed over in the near-duplicate index
+    completed_at: Optional[datetime] = None
+    error: Optional[str] = None
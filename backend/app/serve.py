@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import uvicorn
+
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+# Seconds to wait for the embedding sidecar to load its model and listen
+SIDECAR_START_TIMEOUT = 300
+
+def start_sidecar(path: str) -> subprocess.Popen:
+    """Start the shared embedding process and wait until its socket accepts connections"""
+    # A socket left behind by a previous run would look like a running sidecar
+    for stale in (path, path + ".tmp"):
+        if os.path.exists(stale):
+            os.unlink(stale)
+    # A separate interpreter, so this process never imports the model libraries
+    process = subprocess.Popen([sys.executable, "-m", "app.services.embedding_server", path])
+    deadline = time.monotonic() + SIDECAR_START_TIMEOUT
+    while not os.path.exists(path):
+        if process.poll() is not None:
+            raise RuntimeError(f"Embedding sidecar exited with code {process.returncode}")
+        if time.monotonic() > deadline:
+            process.terminate()
+            raise RuntimeError("Embedding sidecar did not start in time")
+        time.sleep(0.1)
+    return process
+
+def main():
+    """Production entry point: API workers plus an optional shared embedding sidecar.
+
+    Each worker is a separate process with its own event loop. Local models
+    (the local embedding provider and the cross-encoder reranker) are loaded
+    once, in the sidecar, when EMBEDDING_SIDECAR_SOCKET is set; otherwise
+    every worker loads its own copy.
+    """
+    workers = settings.API_WORKERS
+    sidecar = None
+    local_models = settings.EMBEDDING_PROVIDER == "local" or (
+        settings.RERANK_ENABLED and settings.RERANK_PROVIDER == "cross_encoder"
+    )
+    if not local_models:
+        # Everything runs remotely; there is no model to share
+        os.environ["EMBEDDING_SIDECAR_SOCKET"] = ""
+    elif settings.EMBEDDING_SIDECAR_SOCKET:
+        sidecar = start_sidecar(settings.EMBEDDING_SIDECAR_SOCKET)
+    elif workers > 1:
+        print("EMBEDDING_SIDECAR_SOCKET is not set: each worker loads its own local models")
+
+    # Workers share metrics through files; must be set before they import prometheus_client
+    metrics_dir = None
+    if workers > 1 and not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        metrics_dir = tempfile.mkdtemp(prefix="deeptalk-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
+    try:
+        uvicorn.run("app.main:app", host=settings.API_HOST, port=settings.API_PORT, workers=workers)
+    finally:
+        if sidecar is not None:
+            sidecar.terminate()
+            try:
+                sidecar.wait(10)
+            except subprocess.TimeoutExpired:
+                sidecar.kill()
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+import gzip
+import hashlib
+import tempfile
+from typing import List, Optional, Tuple
+import orjson
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+# Bump whenever extraction output changes so stale artifacts are not reused
+EXTRACTOR_VERSION = 1
+
+def get_artifact_dir() -> str:
+    """Directory holding extracted-text artifacts, next to the uploads"""
+    return os.path.join(settings.UPLOAD_DIR, "artifacts")
+
+def hash_file(file_path: str) -> str:
+    """Compute the SHA-256 content hash of a file"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_text(text: str) -> str:
+    """Compute the SHA-256 content hash of extracted text (used for URL sources)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def artifact_path(content_hash: str) -> str:
+    """Path of the artifact for a content hash and the current extractor version"""
+    return os.path.join(get_artifact_dir(), f"{content_hash}.v{EXTRACTOR_VERSION}.json.gz")
+
+def load_artifact(content_hash: str) -> Optional[Tuple[str, List[int]]]:
+    """Load extracted text and page start offsets, or None if not cached"""
+    path = artifact_path(content_hash)
+    if not os.path.exists(path):
+        return None
+
+    with gzip.open(path, "rb") as f:
+        artifact = orjson.loads(f.read())
+    return artifact["text"], artifact["page_starts"]
+
+def save_artifact(content_hash: str, text: str, page_starts: List[int]):
+    """Store extracted text and page start offsets as a compressed artifact"""
+    os.makedirs(get_artifact_dir(), exist_ok=True)
+    payload = orjson.dumps({
+        "content_hash": content_hash,
+        "extractor_version": EXTRACTOR_VERSION,
+        "text": text,
+        "page_starts": page_starts,
+    })
+
+    # Write to a temporary file first so concurrent readers never see a partial artifact
+    fd, tmp_path = tempfile.mkstemp(dir=get_artifact_dir(), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(gzip.compress(payload, compresslevel=6))
+        os.replace(tmp_path, artifact_path(content_hash))
+    except Exception:
+        os.remove(tmp_path)
+        raise
@@ -1,6 +1,74 @@
-import boto3
 import json
-from typing import Dict, Any, List, Generator, Optional
+import asyncio
+import threading
+import concurrent.futures
+import time
+import logging
+from typing import Dict, Any, List, AsyncGenerator, Optional
+from app.utils.config import get_settings
+from app.utils.metrics import track_stage, record_stage, record_tokens
+from app.utils.admission import ServiceOverloadedError
+from app.utils.resilience import (
+    DeadlineExceededError,
+    clear_deadline,
+    get_breaker,
+    time_remaining,
+    within_deadline,
+    within_timeout,
+)
+from app.services.conversation_store import HistoryWindow, get_history_window, get_messages_between, save_summary
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# Bedrock error codes that mean we are over quota rather than that the request failed
+THROTTLING_ERROR_CODES = {"ThrottlingException", "ServiceQuotaExceededException", "TooManyRequestsException"}
+
+# Marks the end of a token stream read in a worker thread
+_STREAM_END = object()
+
+def raise_if_throttled(error: Exception):
+    """Surface Bedrock throttling as an overload error instead of a generic failure"""
+    # botocore's ClientError carries the error code in .response; checked by
+    # shape so botocore is only imported together with the client
+    response = getattr(error, "response", None)
+    if isinstance(response, dict) and response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES:
+        raise ServiceOverloadedError("Model capacity exceeded, please retry later", status_code=503, retry_after=2) from error
+
+def is_bedrock_failure(error: BaseException) -> bool:
+    """Whether an error means Bedrock is unhealthy or over quota, as opposed to a bad request"""
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        if response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES:
+            return True
+        return response.get("ResponseMetadata", {}).get("HTTPStatusCode", 500) >= 500
+    # Timeouts and connection errors
+    return True
+
+# Conversations whose older turns are being summarized right now
+_compacting = set()
+# Running summary tasks; the event loop only keeps weak references to tasks
+_compaction_tasks = set()
+
+# Answer sent when generation fails; it is not stored as an assistant turn
+FALLBACK_RESPONSE = "I'm sorry, I encountered an error processing your request. Please try again."
+
+# Shared Bedrock runtime client; boto3 clients are thread-safe and costly to create
+_bedrock_runtime = None
+
+def get_bedrock_runtime():
+    """Get the shared Bedrock runtime client"""
+    global _bedrock_runtime
+    
+    if _bedrock_runtime is None:
+        # boto3 takes a noticeable share of startup, so import it on first use
+        import boto3
+        _bedrock_runtime = boto3.client(
+            service_name="bedrock-runtime",
+            region_name=settings.AWS_REGION,
+        )
+    return _bedrock_runtime
 
 class BedrockClient:
     def __init__(self, model_params: Dict[str, Any]):
@@ -15,9 +83,77 @@ class BedrockClient:
         
         # Update with provided parameters
         self.params = {**self.default_params, **model_params}
+        # Every model gets a circuit breaker and metric series, so only known ones are accepted
+        if self.params["modelId"] not in settings.BEDROCK_ALLOWED_MODELS:
+            raise ValueError(f"Unsupported model: {self.params['modelId']}")
         
-        # Initialize Bedrock runtime client
-        self.bedrock_runtime = boto3.client('bedrock-runtime')
+        # Use the shared Bedrock runtime client
+        self.bedrock_runtime = get_bedrock_runtime()
+    
+    async def load_history(self, conversation_id: Optional[str]) -> Optional[HistoryWindow]:
+        """Load the summary and newest turns that fit HISTORY_TOKEN_BUDGET.
+
+        Turns that no longer fit are folded into the cached summary in the
+        background, so the prompt size stays bounded however long the
+        conversation gets.
+        """
+        if not conversation_id:
+            return None
+        history = await get_history_window(conversation_id, settings.HISTORY_TOKEN_BUDGET)
+        if history.overflow_through is not None and conversation_id not in _compacting:
+            _compacting.add(conversation_id)
+            task = asyncio.create_task(self.compact_history(conversation_id, history))
+            _compaction_tasks.add(task)
+            task.add_done_callback(_compaction_tasks.discard)
+        return history
+    
+    async def compact_history(self, conversation_id: str, history: HistoryWindow):
+        """Summarize turns that fell out of the history window into the cached summary"""
+        # Runs in the background, so the request that started it must not time it out
+        clear_deadline()
+        try:
+            messages = await get_messages_between(
+                conversation_id, history.summarized_through, history.overflow_through
+            )
+            if messages:
+                summary = await get_breaker(f"bedrock:{settings.HISTORY_SUMMARY_MODEL_ID}").call(
+                    lambda: asyncio.to_thread(self._summarize, history.summary, messages),
+                    is_bedrock_failure,
+                    "history_summary",
+                    cap=settings.BEDROCK_TIMEOUT_SECONDS,
+                )
+                await save_summary(conversation_id, summary, messages[-1]["seq"])
+        except Exception:
+            logger.exception("Error summarizing conversation %s", conversation_id)
+        finally:
+            _compacting.discard(conversation_id)
+    
+    def _summarize(self, previous_summary: Optional[str], messages: List[Dict[str, Any]]) -> str:
+        """Fold turns into a running summary with the summary model (blocking)"""
+        model_id = settings.HISTORY_SUMMARY_MODEL_ID
+        transcript = "\n\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in messages)
+        prompt = f"""Update the summary of a conversation with the new turns below. Keep facts, names, decisions and open questions the assistant may need later. Reply with the summary only.
+
+Current summary:
+{previous_summary or 'None'}
+
+New turns:
+{transcript}"""
+        
+        with track_stage("history_summary", model_id):
+            response = self.bedrock_runtime.invoke_model(
+                modelId=model_id,
+                body=json.dumps({
+                    "anthropic_version": "bedrock-2023-05-31",
+                    "max_tokens": settings.HISTORY_SUMMARY_MAX_TOKENS,
+                    "temperature": 0,
+                    "messages": [{"role": "user", "content": prompt}],
+                })
+            )
+            response_body = json.loads(response.get('body').read())
+        usage = response_body.get('usage', {})
+        record_tokens(model_id, usage.get('input_tokens', 0), usage.get('output_tokens', 0))
+        return response_body['content'][0]['text']
         
     async def generate_response(
         self,
@@ -39,35 +175,58 @@ class BedrockClient:
         
         # Construct the request based on the model ID
         model_id = self.params.get("modelId")
+        history = await self.load_history(conversation_id)
         
         if model_id.startswith("anthropic.claude"):
-            request_body = self._create_claude_request(system_message, context_text, query)
+            request_body = self._create_claude_request(system_message, context_text, query, history)
         elif model_id.startswith("amazon.titan"):
-            request_body = self._create_titan_request(system_message, context_text, query)
+            request_body = self._create_titan_request(system_message, context_text, query, history)
         else:
             raise ValueError(f"Unsupported model: {model_id}")
         
         try:
-            # Call Bedrock API
-            response = self.bedrock_runtime.invoke_model(
-                modelId=model_id,
-                body=json.dumps(request_body)
-            )
-            
-            # Parse response
-            response_body = json.loads(response.get('body').read())
+            with track_stage("generation", model_id):
+                # Call Bedrock API off the event loop, within the request deadline
+                response_body = await get_breaker(f"bedrock:{model_id}").call(
+                    lambda: asyncio.to_thread(self._invoke, model_id, request_body),
+                    is_bedrock_failure,
+                    "generation",
+                    cap=settings.BEDROCK_TIMEOUT_SECONDS,
+                )
             
             if model_id.startswith("anthropic.claude"):
+                usage = response_body.get('usage', {})
+                record_tokens(model_id, usage.get('input_tokens', 0), usage.get('output_tokens', 0))
                 return response_body['content'][0]['text']
             elif model_id.startswith("amazon.titan"):
-                return response_body['results'][0]['outputText']
+                result = response_body['results'][0]
+                record_tokens(model_id, response_body.get('inputTextTokenCount', 0), result.get('tokenCount', 0))
+                return result['outputText']
             
+        except ServiceOverloadedError:
+            # Open circuit or deadline: let the client retry instead of apologizing
+            raise
         except Exception as e:
+            raise_if_throttled(e)
             # Log error and return fallback message
-            print(f"Error calling Bedrock API: {str(e)}")
-            return "I'm sorry, I encountered an error processing your request. Please try again."
+            logger.exception("Error calling Bedrock API")
+            return FALLBACK_RESPONSE
     
-    def _create_claude_request(self, system_message: str, context_text: str, query: str) -> Dict[str, Any]:
+    def _invoke(self, model_id: str, request_body: Dict[str, Any]) -> Dict[str, Any]:
+        """Call a model and parse its response (blocking)"""
+        response = self.bedrock_runtime.invoke_model(
+            modelId=model_id,
+            body=json.dumps(request_body)
+        )
+        return json.loads(response.get('body').read())
+    
+    def _create_claude_request(
+        self,
+        system_message: str,
+        context_text: str,
+        query: str,
+        history: Optional[HistoryWindow] = None,
+    ) -> Dict[str, Any]:
         """Create request body for Claude models"""
         user_message = f"""Please answer the following question based on the provided context.
 
@@ -75,20 +234,47 @@ class BedrockClient:
 
 Question: {query}"""
         
+        messages = []
+        if history:
+            if history.summary:
+                system_message = f"{system_message}\n\nSummary of the earlier conversation:\n{history.summary}"
+            for turn in history.messages:
+                # Claude needs alternating roles starting with the user
+                if not messages and turn["role"] != "user":
+                    continue
+                if messages and messages[-1]["role"] == turn["role"]:
+                    messages[-1]["content"] += "\n\n" + turn["content"]
+                else:
+                    messages.append({"role": turn["role"], "content": turn["content"]})
+            if messages and messages[-1]["role"] == "user":
+                messages.pop()
+        messages.append({"role": "user", "content": user_message})
+        
         return {
             "anthropic_version": "bedrock-2023-05-31",
             "max_tokens": self.params.get("maxTokens"),
             "temperature": self.params.get("temperature"),
             "top_p": self.params.get("topP"),
             "system": system_message,
-            "messages": [
-                {"role": "user", "content": user_message}
-            ]
+            "messages": messages
         }
     
-    def _create_titan_request(self, system_message: str, context_text: str, query: str) -> Dict[str, Any]:
+    def _create_titan_request(
+        self,
+        system_message: str,
+        context_text: str,
+        query: str,
+        history: Optional[HistoryWindow] = None,
+    ) -> Dict[str, Any]:
         """Create request body for Amazon Titan models"""
-        prompt = f"{system_message}\n\nContext:\n{context_text if context_text else 'No context provided.'}\n\nQuestion: {query}\n\nAnswer:"
+        conversation = ""
+        if history:
+            if history.summary:
+                conversation += f"Summary of the earlier conversation:\n{history.summary}\n\n"
+            if history.messages:
+                turns = "\n".join(f"{turn['role'].capitalize()}: {turn['content']}" for turn in history.messages)
+                conversation += f"Conversation so far:\n{turns}\n\n"
+        prompt = f"{system_message}\n\n{conversation}Context:\n{context_text if context_text else 'No context provided.'}\n\nQuestion: {query}\n\nAnswer:"
         
         return {
             "inputText": prompt,
@@ -104,7 +290,7 @@ Question: {query}"""
         query: str,
         contexts: List[Dict[str, Any]],
         conversation_id: Optional[str] = None,
-    ) -> Generator[str, None, None]:
+    ) -> AsyncGenerator[str, None]:
         """Stream response from AWS Bedrock"""
         
         # Prepare context from retrieved chunks
@@ -121,34 +307,118 @@ Question: {query}"""
         model_id = self.params.get("modelId")
         
         if model_id.startswith("anthropic.claude"):
-            request_body = self._create_claude_request(system_message, context_text, query)
-            # Add streaming parameter
-            request_body["stream"] = True
+            history = await self.load_history(conversation_id)
+            request_body = self._create_claude_request(system_message, context_text, query, history)
         else:
             # For models that don't support streaming, fall back to non-streaming
             response = await self.generate_response(query, contexts, conversation_id)
             yield response
             return
         
+        # Bedrock's event stream is blocking, so it is read in a worker thread that
+        # hands tokens over through a bounded queue. A slow consumer fills the
+        # queue and pauses the reader (backpressure); closing this generator
+        # stops the reader.
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.STREAM_BUFFER_SIZE)
+        stop = threading.Event()
+        
+        def put(item) -> bool:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while not stop.is_set():
+                try:
+                    future.result(timeout=0.5)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    continue
+            future.cancel()
+            return False
+        
+        def read_stream():
+            try:
+                # Call Bedrock API with streaming
+                response = self.bedrock_runtime.invoke_model_with_response_stream(
+                    modelId=model_id,
+                    body=json.dumps(request_body)
+                )
+                
+                # Process the streaming response
+                for event in response.get('body'):
+                    if stop.is_set():
+                        break
+                    if 'chunk' not in event:
+                        continue
+                    chunk_data = json.loads(event['chunk']['bytes'])
+                    event_type = chunk_data.get('type')
+                    
+                    if event_type == 'content_block_delta' and chunk_data['delta'].get('type') == 'text_delta':
+                        if not put(chunk_data['delta']['text']):
+                            break
+                    elif event_type == 'message_start':
+                        usage = chunk_data['message'].get('usage', {})
+                        record_tokens(model_id, input_tokens=usage.get('input_tokens', 0))
+                    elif event_type == 'message_delta':
+                        usage = chunk_data.get('usage', {})
+                        record_tokens(model_id, output_tokens=usage.get('output_tokens', 0))
+            except Exception as e:
+                put(e)
+            finally:
+                put(_STREAM_END)
+        
+        # Fail fast while Bedrock's circuit is open, before starting the reader
+        breaker = get_breaker(f"bedrock:{model_id}")
+        breaker.check()
+        settled = False
+        # As in CircuitBreaker.call: running out of a deadline that earlier
+        # stages used up is not Bedrock's failure
+        cap = settings.BEDROCK_TIMEOUT_SECONDS
+        own_timeout = time_remaining(cap) == cap
+        
+        # to_thread copies the context, so metrics keep the request's endpoint label
+        reader = asyncio.ensure_future(asyncio.to_thread(read_stream))
         try:
-            # Call Bedrock API with streaming
-            response = self.bedrock_runtime.invoke_model_with_response_stream(
-                modelId=model_id,
-                body=json.dumps(request_body)
-            )
+            with track_stage("generation_stream", model_id):
+                start = time.perf_counter()
+                first_token = True
+                
+                while True:
+                    # The request deadline covers the wait for the first token;
+                    # after that the stream only has to keep moving
+                    if first_token:
+                        item = await within_deadline(queue.get(), "time_to_first_token", cap)
+                    else:
+                        item = await within_timeout(queue.get(), "generation_stream", settings.STREAM_IDLE_TIMEOUT_SECONDS)
+                    if item is _STREAM_END:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    if first_token:
+                        record_stage("time_to_first_token", time.perf_counter() - start, model_id)
+                        breaker.record_success()
+                        settled = True
+                        first_token = False
+                    # Yield the text content
+                    yield item
             
-            # Process the streaming response
-            for event in response.get('body'):
-                # Check if we have a proper chunk with content
-                if 'chunk' in event:
-                    chunk_data = json.loads(event['chunk']['bytes'])
-                    if 'content' in chunk_data and len(chunk_data['content']) > 0:
-                        content_type = chunk_data['content'][0]['type']
-                        if content_type == 'text':
-                            # Yield the text content
-                            yield chunk_data['content'][0]['text']
+            if not settled:
+                breaker.record_success()
+                settled = True
                 
         except Exception as e:
+            if not settled:
+                settled = True
+                if is_bedrock_failure(e) and (own_timeout or not isinstance(e, DeadlineExceededError)):
+                    breaker.record_failure()
+                else:
+                    breaker.release_probe()
+            if isinstance(e, ServiceOverloadedError):
+                raise
+            raise_if_throttled(e)
             # Log error and yield fallback message
-            print(f"Error calling Bedrock streaming API: {str(e)}")
-            yield "I'm sorry, I encountered an error processing your request. Please try again."
+            logger.exception("Error calling Bedrock streaming API")
+            yield FALLBACK_RESPONSE
+        finally:
+            if not settled:
+                # Abandoned by the caller before Bedrock answered
+                breaker.release_probe()
+            stop.set()
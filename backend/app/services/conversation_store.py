@@ -0,0 +1,438 @@
+import os
+import json
+import sqlite3
+import asyncio
+import threading
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models.conversation import Conversation, Message
+from app.utils.config import get_settings
+from app.utils.metrics import track_stage
+from app.utils.pagination import encode_cursor, decode_cursor
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) used for history budgets"""
+    return len(text) // 4 + 1
+
+class HistoryWindow:
+    """Conversation history that fits a prompt: a cached summary plus the newest turns.
+
+    ``overflow_through`` is the sequence number of the newest message that no
+    longer fits the budget and is not yet covered by the summary; it is None
+    when nothing needs compacting.
+    """
+    __slots__ = ("summary", "summarized_through", "messages", "overflow_through")
+
+    def __init__(
+        self,
+        summary: Optional[str],
+        summarized_through: int,
+        messages: List[Dict[str, Any]],
+        overflow_through: Optional[int],
+    ):
+        self.summary = summary
+        self.summarized_through = summarized_through
+        self.messages = messages
+        self.overflow_through = overflow_through
+
+class ConversationStore:
+    """Conversations and messages in SQLite (WAL mode).
+
+    Messages carry an autoincrement sequence number, which orders them and
+    serves as the pagination cursor. Calls block and are made off the event
+    loop.
+    """
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                knowledge_base_ids TEXT,
+                metadata TEXT NOT NULL DEFAULT '{}',
+                last_message TEXT,
+                message_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated_at, id);
+            CREATE TABLE IF NOT EXISTS messages (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                conversation_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                context_sources TEXT,
+                token_count INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_conversation ON messages (conversation_id, seq);
+            CREATE TABLE IF NOT EXISTS summaries (
+                conversation_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                through_seq INTEGER NOT NULL,
+                token_count INTEGER NOT NULL
+            );
+        """)
+
+    def create_conversation(self, conversation: Conversation):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO conversations (id, title, created_at, updated_at, knowledge_base_ids, metadata)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    conversation.id,
+                    conversation.title,
+                    conversation.created_at.isoformat(),
+                    conversation.updated_at.isoformat(),
+                    json.dumps(conversation.knowledge_base_ids) if conversation.knowledge_base_ids else None,
+                    json.dumps(conversation.metadata),
+                ),
+            )
+
+    def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return conversation_row(row) if row else None
+
+    def list_conversations(self, cursor: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Most recently updated conversations first; returns the page and the next cursor"""
+        if cursor:
+            updated_at, conversation_id = decode_cursor(cursor)
+            sql = (
+                "SELECT * FROM conversations WHERE (updated_at, id) < (?, ?)"
+                " ORDER BY updated_at DESC, id DESC LIMIT ?"
+            )
+            params = (updated_at, conversation_id, limit + 1)
+        else:
+            sql = "SELECT * FROM conversations ORDER BY updated_at DESC, id DESC LIMIT ?"
+            params = (limit + 1,)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"])
+        return [conversation_row(row) for row in rows], next_cursor
+
+    def list_messages(
+        self,
+        conversation_id: str,
+        before: Optional[int],
+        limit: int,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """A page of messages in chronological order, newest page first.
+
+        ``before`` is the sequence number returned as the previous page's
+        cursor; the returned cursor fetches the next older page.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM messages WHERE conversation_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (conversation_id, before if before is not None else 2 ** 63 - 1, limit + 1),
+            ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1]["seq"]
+        return [message_row(row) for row in reversed(rows)], next_cursor
+
+    def write_messages(self, messages: List[Message]):
+        """Append messages in one transaction, creating conversations on first use"""
+        with self.lock, self.conn:
+            for message in messages:
+                timestamp = message.timestamp.isoformat()
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO conversations (id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (message.conversation_id, message.content[:60] or "New Conversation", timestamp, timestamp),
+                )
+                inserted = self.conn.execute(
+                    "INSERT OR IGNORE INTO messages"
+                    " (id, conversation_id, role, content, timestamp, context_sources, token_count)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        message.id,
+                        message.conversation_id,
+                        message.role,
+                        message.content,
+                        timestamp,
+                        json.dumps(message.context_sources) if message.context_sources else None,
+                        estimate_tokens(message.content),
+                    ),
+                ).rowcount
+                if inserted:
+                    self.conn.execute(
+                        "UPDATE conversations SET updated_at = ?, last_message = ?, message_count = message_count + 1"
+                        " WHERE id = ?",
+                        (timestamp, message.content[:200], message.conversation_id),
+                    )
+
+    def delete_conversation(self, conversation_id: str) -> bool:
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            self.conn.execute("DELETE FROM summaries WHERE conversation_id = ?", (conversation_id,))
+            return self.conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,)).rowcount > 0
+
+    def history_window(self, conversation_id: str, token_budget: int) -> HistoryWindow:
+        """Newest messages that fit the budget, on top of the cached summary.
+
+        Only messages after the summary are read, newest first, and reading
+        stops at the first one over budget, so the cost does not depend on
+        how long the conversation is.
+        """
+        with self.lock:
+            summary = self.conn.execute(
+                "SELECT summary, through_seq, token_count FROM summaries WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+            summarized_through = summary["through_seq"] if summary else 0
+            remaining = token_budget - (summary["token_count"] if summary else 0)
+
+            messages = []
+            overflow_through = None
+            rows = self.conn.execute(
+                "SELECT seq, role, content, token_count FROM messages"
+                " WHERE conversation_id = ? AND seq > ? ORDER BY seq DESC",
+                (conversation_id, summarized_through),
+            )
+            for row in rows:
+                if row["token_count"] > remaining:
+                    overflow_through = row["seq"]
+                    break
+                remaining -= row["token_count"]
+                messages.append({"seq": row["seq"], "role": row["role"], "content": row["content"]})
+
+        messages.reverse()
+        return HistoryWindow(summary["summary"] if summary else None, summarized_through, messages, overflow_through)
+
+    def messages_between(self, conversation_id: str, after: int, through: int) -> List[Dict[str, Any]]:
+        """Messages with after < seq <= through, oldest first"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, role, content FROM messages"
+                " WHERE conversation_id = ? AND seq > ? AND seq <= ? ORDER BY seq",
+                (conversation_id, after, through),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def save_summary(self, conversation_id: str, summary: str, through_seq: int):
+        """Store a summary unless a newer one already covers more messages"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO summaries (conversation_id, summary, through_seq, token_count) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(conversation_id) DO UPDATE SET"
+                " summary = excluded.summary, through_seq = excluded.through_seq, token_count = excluded.token_count"
+                " WHERE excluded.through_seq > summaries.through_seq",
+                (conversation_id, summary, through_seq, estimate_tokens(summary)),
+            )
+
+def conversation_row(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "title": row["title"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+        "knowledge_base_ids": json.loads(row["knowledge_base_ids"]) if row["knowledge_base_ids"] else None,
+        "metadata": json.loads(row["metadata"]),
+        "last_message": row["last_message"],
+        "message_count": row["message_count"],
+    }
+
+def message_row(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "role": row["role"],
+        "content": row["content"],
+        "timestamp": row["timestamp"],
+        "context_sources": json.loads(row["context_sources"]) if row["context_sources"] else None,
+    }
+
+class MessageWriter:
+    """Write-behind queue that batches message inserts into single transactions.
+
+    Messages are written within ``interval`` seconds, as soon as
+    ``batch_size`` are queued, or when a ``flush`` is waiting; messages
+    queued by concurrent turns go into the same transaction. Readers call
+    ``flush`` first when the conversation they read has unwritten messages.
+    """
+
+    def __init__(self, store: ConversationStore, batch_size: int, interval: float):
+        self.store = store
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: Dict[str, int] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def enqueue(self, messages: List[Message]):
+        self.start()
+        for message in messages:
+            self.pending[message.conversation_id] = self.pending.get(message.conversation_id, 0) + 1
+            self.queue.put_nowait(message)
+
+    def has_pending(self, conversation_id: str) -> bool:
+        return conversation_id in self.pending
+
+    async def flush(self):
+        """Wait until everything queued so far is written"""
+        if self.pending:
+            self.start()
+            done = asyncio.get_running_loop().create_future()
+            self.queue.put_nowait(done)
+            await done
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                if isinstance(batch[-1], asyncio.Future):
+                    # A flush is waiting; write now rather than at the deadline
+                    break
+            await self.write(batch)
+
+    async def write(self, batch: List[Any]):
+        messages = [item for item in batch if isinstance(item, Message)]
+        waiters = [item for item in batch if isinstance(item, asyncio.Future)]
+        try:
+            if messages:
+                with track_stage("conversation_write"):
+                    await asyncio.to_thread(self.store.write_messages, messages)
+        except Exception:
+            logger.exception("Error writing %d conversation messages", len(messages))
+        finally:
+            for message in messages:
+                self.pending[message.conversation_id] -= 1
+                if not self.pending[message.conversation_id]:
+                    del self.pending[message.conversation_id]
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def close(self):
+        """Write out queued messages and stop"""
+        await self.flush()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+_store: Optional[ConversationStore] = None
+_writer: Optional[MessageWriter] = None
+
+def get_conversation_store() -> ConversationStore:
+    global _store
+    if _store is None:
+        _store = ConversationStore(settings.CONVERSATION_DB_PATH)
+    return _store
+
+def get_message_writer() -> MessageWriter:
+    global _writer
+    if _writer is None:
+        _writer = MessageWriter(
+            get_conversation_store(),
+            settings.CONVERSATION_WRITE_BATCH_SIZE,
+            settings.CONVERSATION_WRITE_INTERVAL,
+        )
+    return _writer
+
+async def flush_conversation(conversation_id: str):
+    """Make queued messages of a conversation visible to readers"""
+    writer = get_message_writer()
+    if writer.has_pending(conversation_id):
+        await writer.flush()
+
+async def close_message_writer():
+    if _writer is not None:
+        await _writer.close()
+
+async def store_messages(
+    conversation_id: str,
+    query: str,
+    response: str,
+    contexts: Optional[List[Dict[str, Any]]] = None,
+):
+    """Write a user turn and its answer through the batching writer.
+
+    Returns once they are committed: the next turn may be served by another
+    worker, which cannot see this worker's queue. Concurrent turns still
+    share a transaction.
+    """
+    now = datetime.now()
+    writer = get_message_writer()
+    writer.enqueue([
+        Message(conversation_id=conversation_id, role="user", content=query, timestamp=now),
+        Message(
+            conversation_id=conversation_id,
+            role="assistant",
+            content=response,
+            timestamp=datetime.now(),
+            context_sources=[ctx["source"] for ctx in contexts] if contexts else None,
+        ),
+    ])
+    await writer.flush()
+
+async def create_conversation(conversation: Conversation):
+    await asyncio.to_thread(get_conversation_store().create_conversation, conversation)
+
+async def get_conversation(conversation_id: str) -> Optional[Dict[str, Any]]:
+    await flush_conversation(conversation_id)
+    return await asyncio.to_thread(get_conversation_store().get_conversation, conversation_id)
+
+async def list_conversations(cursor: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    # Listing spans all conversations, so wait for every queued write
+    await get_message_writer().flush()
+    return await asyncio.to_thread(get_conversation_store().list_conversations, cursor, limit)
+
+async def list_messages(
+    conversation_id: str,
+    before: Optional[int],
+    limit: int,
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    await flush_conversation(conversation_id)
+    return await asyncio.to_thread(get_conversation_store().list_messages, conversation_id, before, limit)
+
+async def delete_conversation(conversation_id: str) -> bool:
+    await flush_conversation(conversation_id)
+    return await asyncio.to_thread(get_conversation_store().delete_conversation, conversation_id)
+
+async def get_history_window(conversation_id: str, token_budget: int) -> HistoryWindow:
+    await flush_conversation(conversation_id)
+    with track_stage("history_load"):
+        return await asyncio.to_thread(get_conversation_store().history_window, conversation_id, token_budget)
+
+async def get_messages_between(conversation_id: str, after: int, through: int) -> List[Dict[str, Any]]:
+    return await asyncio.to_thread(get_conversation_store().messages_between, conversation_id, after, through)
+
+async def save_summary(conversation_id: str, summary: str, through_seq: int):
+    await asyncio.to_thread(get_conversation_store().save_summary, conversation_id, summary, through_seq)
@@ -0,0 +1,422 @@
+import os
+import re
+import zlib
+import sqlite3
+import hashlib
+import asyncio
+import threading
+from typing import Iterator, List, Dict, Optional, Sequence, Set, Tuple
+import numpy as np
+
+from app.models.knowledge_base import TextChunk
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+# MinHash parameters: NUM_BANDS * ROWS_PER_BAND permutations. With 16 bands of
+# 8 rows, chunk pairs above ~0.7 Jaccard similarity become LSH candidates;
+# candidates are then checked against DEDUP_THRESHOLD.
+NUM_BANDS = 16
+ROWS_PER_BAND = 8
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+SHINGLE_SIZE = 5
+
+# Universal hash functions h(x) = (a * x + b) mod p over 32-bit shingle hashes.
+# The seed is fixed so signatures stay comparable across processes and restarts.
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(20240229)
+_A = _rng.integers(1, 2**32, size=(NUM_PERM, 1), dtype=np.uint64)
+_B = _rng.integers(0, 2**32, size=(NUM_PERM, 1), dtype=np.uint64)
+
+_WORD_RE = re.compile(r"\w+")
+
+class DedupResult:
+    """Outcome of near-duplicate detection for one document"""
+    __slots__ = ("unique_chunks", "signatures", "duplicates")
+
+    def __init__(self):
+        self.unique_chunks: List[TextChunk] = []
+        self.signatures: List[np.ndarray] = []
+        # (duplicate chunk, canonical chunk ID)
+        self.duplicates: List[Tuple[TextChunk, str]] = []
+
+    @property
+    def dedup_rate(self) -> float:
+        total = len(self.unique_chunks) + len(self.duplicates)
+        return len(self.duplicates) / total if total else 0.0
+
+def minhash_signature(text: str) -> np.ndarray:
+    """Compute the MinHash signature of a text over word shingles"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    # Reduce the product before adding b, so every intermediate stays well below 2**64
+    return ((_A * hashes % _PRIME + _B) % _PRIME).min(axis=1)
+
+def band_keys(signature: np.ndarray) -> List[int]:
+    """LSH bucket keys for each band of a signature, as signed 64-bit ints"""
+    keys = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(band.to_bytes(2, "little") + rows.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+class NearDuplicateIndex:
+    """Persistent LSH index of canonical chunk signatures, backed by SQLite"""
+
+    def __init__(self, path: str, threshold: float):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                chunk_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS signatures_document ON signatures (document_id);
+            CREATE TABLE IF NOT EXISTS bands (
+                band_key INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bands_key ON bands (band_key);
+            CREATE INDEX IF NOT EXISTS bands_chunk ON bands (chunk_id);
+            CREATE TABLE IF NOT EXISTS duplicates (
+                chunk_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                chunk_num INTEGER NOT NULL,
+                canonical_chunk_id TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS duplicates_document ON duplicates (document_id);
+            CREATE INDEX IF NOT EXISTS duplicates_canonical ON duplicates (canonical_chunk_id);
+        """)
+
+    def find_duplicates(self, chunks: List[TextChunk]) -> DedupResult:
+        """Split chunks into unique ones and near-duplicates of already indexed chunks.
+
+        Chunks are compared against the persistent index and against earlier
+        chunks of the same batch.
+        """
+        result = DedupResult()
+        # Band buckets of chunks accepted earlier in this batch
+        pending: Dict[int, List[int]] = {}
+
+        with self.lock:
+            for chunk in chunks:
+                signature = minhash_signature(chunk.content)
+                keys = band_keys(signature)
+                canonical_id = self._match_pending(signature, keys, pending, result)
+                if canonical_id is None:
+                    canonical_id = self._match_stored(signature, keys)
+
+                if canonical_id is None:
+                    for key in keys:
+                        pending.setdefault(key, []).append(len(result.unique_chunks))
+                    result.unique_chunks.append(chunk)
+                    result.signatures.append(signature)
+                else:
+                    chunk.metadata["duplicate_of"] = canonical_id
+                    result.duplicates.append((chunk, canonical_id))
+        return result
+
+    def _match_pending(self, signature, keys, pending, result) -> Optional[str]:
+        candidates = {position for key in keys for position in pending.get(key, ())}
+        for position in sorted(candidates):
+            if similarity(signature, result.signatures[position]) >= self.threshold:
+                return result.unique_chunks[position].id
+        return None
+
+    def _match_stored(self, signature, keys) -> Optional[str]:
+        placeholders = ",".join("?" * len(keys))
+        rows = self.conn.execute(
+            f"SELECT DISTINCT s.chunk_id, s.signature FROM bands b "
+            f"JOIN signatures s ON s.chunk_id = b.chunk_id WHERE b.band_key IN ({placeholders})",
+            keys,
+        ).fetchall()
+        for chunk_id, blob in rows:
+            if similarity(signature, np.frombuffer(blob, dtype=np.uint64)) >= self.threshold:
+                return chunk_id
+        return None
+
+    def register(self, document_id: str, result: DedupResult, replaces: Sequence[str] = ()):
+        """Record a document's canonical chunks and duplicate links once it is indexed.
+
+        ``replaces`` are chunk IDs whose previous duplicate links this
+        registration supersedes; they are dropped in the same transaction.
+        """
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM duplicates WHERE chunk_id = ?", [(chunk_id,) for chunk_id in replaces])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO signatures (chunk_id, document_id, signature) VALUES (?, ?, ?)",
+                [(chunk.id, document_id, signature.tobytes())
+                 for chunk, signature in zip(result.unique_chunks, result.signatures)],
+            )
+            self.conn.executemany(
+                "INSERT INTO bands (band_key, chunk_id) VALUES (?, ?)",
+                [(key, chunk.id)
+                 for chunk, signature in zip(result.unique_chunks, result.signatures)
+                 for key in band_keys(signature)],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO duplicates (chunk_id, document_id, chunk_num, canonical_chunk_id, content) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(chunk.id, document_id, chunk.chunk_num, canonical_id, chunk.content)
+                 for chunk, canonical_id in result.duplicates],
+            )
+
+    def remove_document(self, document_id: str):
+        """Drop a document's signatures and duplicate links"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM bands WHERE chunk_id IN (SELECT chunk_id FROM signatures WHERE document_id = ?)",
+                (document_id,),
+            )
+            self.conn.execute("DELETE FROM signatures WHERE document_id = ?", (document_id,))
+            self.conn.execute("DELETE FROM duplicates WHERE document_id = ?", (document_id,))
+
+    def stop_matching(self, document_id: str) -> List[str]:
+        """Retire a document's chunks before they are replaced or deleted; returns its canonical chunk IDs.
+
+        Its canonical chunks stop matching new chunks and its own duplicate
+        links are dropped. The signatures stay until remove_chunks, so the
+        duplicates other documents linked to them can still be found with
+        find_dependents.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM bands WHERE chunk_id IN (SELECT chunk_id FROM signatures WHERE document_id = ?)",
+                (document_id,),
+            )
+            self.conn.execute("DELETE FROM duplicates WHERE document_id = ?", (document_id,))
+            rows = self.conn.execute("SELECT chunk_id FROM signatures WHERE document_id = ?", (document_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def find_dependents(self, document_id: str, chunk_ids: Sequence[str]) -> List[TextChunk]:
+        """Other documents' chunks linked as duplicates of the given chunks of a document.
+
+        Those chunks were never indexed, so they must be indexed before the
+        chunks they duplicate are removed.
+        """
+        rows = []
+        with self.lock:
+            for start in range(0, len(chunk_ids), 500):
+                batch = list(chunk_ids[start:start + 500])
+                rows += self.conn.execute(
+                    "SELECT chunk_id, document_id, chunk_num, content FROM duplicates "
+                    f"WHERE canonical_chunk_id IN ({','.join('?' * len(batch))}) AND document_id != ?",
+                    (*batch, document_id),
+                ).fetchall()
+        return [
+            TextChunk(document_id=doc_id, content=content, chunk_num=chunk_num, id=chunk_id)
+            for chunk_id, doc_id, chunk_num, content in rows
+        ]
+
+    def linked_duplicates(self, chunk_ids: Sequence[str]) -> Set[str]:
+        """Which of the given chunks are still linked as duplicates"""
+        linked: Set[str] = set()
+        with self.lock:
+            for start in range(0, len(chunk_ids), 500):
+                batch = list(chunk_ids[start:start + 500])
+                rows = self.conn.execute(
+                    f"SELECT chunk_id FROM duplicates WHERE chunk_id IN ({','.join('?' * len(batch))})", batch,
+                ).fetchall()
+                linked.update(row[0] for row in rows)
+        return linked
+
+    def duplicates_of_documents(self, document_ids: Sequence[str]) -> Dict[str, TextChunk]:
+        """The unindexed duplicate chunks of the given documents, keyed by their canonical chunk ID"""
+        duplicates: Dict[str, TextChunk] = {}
+        with self.lock:
+            for start in range(0, len(document_ids), 500):
+                batch = list(document_ids[start:start + 500])
+                rows = self.conn.execute(
+                    "SELECT chunk_id, document_id, chunk_num, canonical_chunk_id, content FROM duplicates "
+                    f"WHERE document_id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for chunk_id, doc_id, chunk_num, canonical_id, content in rows:
+                    duplicates.setdefault(
+                        canonical_id,
+                        TextChunk(document_id=doc_id, content=content, chunk_num=chunk_num, id=chunk_id),
+                    )
+        return duplicates
+
+    def remove_chunks(self, chunk_ids: Sequence[str]):
+        """Drop chunks' signatures, bands and duplicate links"""
+        params = [(chunk_id,) for chunk_id in chunk_ids]
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM bands WHERE chunk_id = ?", params)
+            self.conn.executemany("DELETE FROM signatures WHERE chunk_id = ?", params)
+            self.conn.executemany("DELETE FROM duplicates WHERE chunk_id = ?", params)
+
+    def iter_signatures(self, page_size: int = 1000) -> Iterator[Tuple[str, str, bytes]]:
+        """Every (chunk ID, document ID, signature) row, read a page at a time"""
+        return self._iter_rows("SELECT chunk_id, document_id, signature FROM signatures", page_size)
+
+    def iter_duplicates(self, page_size: int = 1000) -> Iterator[Tuple[str, str, int, str, str]]:
+        """Every (chunk ID, document ID, chunk number, canonical chunk ID, content) duplicate link"""
+        return self._iter_rows(
+            "SELECT chunk_id, document_id, chunk_num, canonical_chunk_id, content FROM duplicates", page_size,
+        )
+
+    def _iter_rows(self, select: str, page_size: int) -> Iterator[tuple]:
+        last = ""
+        while True:
+            # Keyset pages, so writers only wait for one page at a time
+            with self.lock:
+                rows = self.conn.execute(
+                    f"{select} WHERE chunk_id > ? ORDER BY chunk_id LIMIT ?", (last, page_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    def restore(self, signatures: Sequence[Tuple[str, str, bytes]], duplicates: Sequence[Tuple[str, str, int, str, str]]):
+        """Insert exported signature and duplicate link rows, rebuilding the band buckets"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO signatures (chunk_id, document_id, signature) VALUES (?, ?, ?)", signatures,
+            )
+            self.conn.executemany(
+                "INSERT INTO bands (band_key, chunk_id) VALUES (?, ?)",
+                [(key, chunk_id)
+                 for chunk_id, _, signature in signatures
+                 for key in band_keys(np.frombuffer(signature, dtype=np.uint64))],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO duplicates (chunk_id, document_id, chunk_num, canonical_chunk_id, content) "
+                "VALUES (?, ?, ?, ?, ?)",
+                duplicates,
+            )
+
+    def dangling_duplicates(self) -> List[TextChunk]:
+        """Duplicate chunks whose canonical chunk has no signature, so it is not indexed either"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT chunk_id, document_id, chunk_num, content FROM duplicates "
+                "WHERE canonical_chunk_id NOT IN (SELECT chunk_id FROM signatures)"
+            ).fetchall()
+        return [
+            TextChunk(document_id=doc_id, content=content, chunk_num=chunk_num, id=chunk_id)
+            for chunk_id, doc_id, chunk_num, content in rows
+        ]
+
+    def clear(self):
+        """Drop every signature and duplicate link"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM bands")
+            self.conn.execute("DELETE FROM signatures")
+            self.conn.execute("DELETE FROM duplicates")
+
+_index: Optional[NearDuplicateIndex] = None
+
+def get_dedup_index() -> NearDuplicateIndex:
+    """Get the shared near-duplicate index, opening it on first use"""
+    global _index
+
+    if _index is None:
+        _index = NearDuplicateIndex(settings.DEDUP_INDEX_PATH, settings.DEDUP_THRESHOLD)
+    return _index
+
+async def find_near_duplicates(chunks: List[TextChunk]) -> DedupResult:
+    """Detect near-duplicate chunks; every chunk is unique when dedup is disabled"""
+    if not settings.DEDUP_ENABLED:
+        result = DedupResult()
+        result.unique_chunks = list(chunks)
+        return result
+    return await asyncio.to_thread(get_dedup_index().find_duplicates, chunks)
+
+async def register_chunks(document_id: str, result: DedupResult, replaces: Sequence[str] = ()):
+    """Make a document's unique chunks available as canonical chunks"""
+    if settings.DEDUP_ENABLED:
+        await asyncio.to_thread(get_dedup_index().register, document_id, result, replaces)
+
+async def register_indexed_chunks(document_id: str, chunks: List[TextChunk]):
+    """Make chunks that were all indexed, without near-duplicate detection, canonical chunks"""
+    if not settings.DEDUP_ENABLED or not chunks:
+        return
+
+    def build() -> DedupResult:
+        result = DedupResult()
+        result.unique_chunks = list(chunks)
+        result.signatures = [minhash_signature(chunk.content) for chunk in chunks]
+        return result
+
+    await register_chunks(document_id, await asyncio.to_thread(build))
+
+async def forget_document(document_id: str):
+    """Remove a document from the near-duplicate index"""
+    if settings.DEDUP_ENABLED:
+        await asyncio.to_thread(get_dedup_index().remove_document, document_id)
+
+async def stop_matching_document(document_id: str) -> List[str]:
+    """Keep a document's chunks from absorbing new duplicates before they are replaced or deleted.
+
+    Returns the document's canonical chunk IDs, to pass to find_dependents
+    and then forget_chunks once the dependents are indexed.
+    """
+    if not settings.DEDUP_ENABLED:
+        return []
+    return await asyncio.to_thread(get_dedup_index().stop_matching, document_id)
+
+async def find_dependents(document_id: str, chunk_ids: Sequence[str]) -> List[TextChunk]:
+    """Other documents' unindexed duplicates of the given chunks"""
+    if not settings.DEDUP_ENABLED or not chunk_ids:
+        return []
+    return await asyncio.to_thread(get_dedup_index().find_dependents, document_id, chunk_ids)
+
+async def linked_duplicates(chunk_ids: Sequence[str]) -> Set[str]:
+    """Which of the given chunks are still linked as duplicates"""
+    if not settings.DEDUP_ENABLED or not chunk_ids:
+        return set()
+    return await asyncio.to_thread(get_dedup_index().linked_duplicates, chunk_ids)
+
+async def duplicates_of_documents(document_ids: Sequence[str]) -> Dict[str, TextChunk]:
+    """Unindexed duplicate chunks of the given documents, keyed by the canonical chunk standing in for them"""
+    if not settings.DEDUP_ENABLED or not document_ids:
+        return {}
+    return await asyncio.to_thread(get_dedup_index().duplicates_of_documents, list(document_ids))
+
+async def forget_chunks(chunk_ids: Sequence[str]):
+    """Remove chunks from the near-duplicate index"""
+    if settings.DEDUP_ENABLED and chunk_ids:
+        await asyncio.to_thread(get_dedup_index().remove_chunks, chunk_ids)
+
+async def clear_dedup_index():
+    """Empty the near-duplicate index, e.g. when the whole knowledge base is replaced"""
+    # Also when dedup is disabled, so stale links do not resurface if it is enabled again
+    if settings.DEDUP_ENABLED or os.path.exists(settings.DEDUP_INDEX_PATH):
+        await asyncio.to_thread(get_dedup_index().clear)
+
+async def restore_dedup_rows(
+    signatures: Sequence[Tuple[str, str, bytes]], duplicates: Sequence[Tuple[str, str, int, str, str]],
+):
+    """Load exported signatures and duplicate links into the near-duplicate index"""
+    if settings.DEDUP_ENABLED and (signatures or duplicates):
+        await asyncio.to_thread(get_dedup_index().restore, signatures, duplicates)
+
+async def find_dangling_duplicates() -> List[TextChunk]:
+    """Unindexed duplicate chunks whose canonical chunk is gone"""
+    if not settings.DEDUP_ENABLED:
+        return []
+    return await asyncio.to_thread(get_dedup_index().dangling_duplicates)
@@ -0,0 +1,199 @@
+import os
+import sqlite3
+import asyncio
+import threading
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.services.dedup import forget_document, stop_matching_document
+from app.services.document_processor import document_lock, promote_dependents
+from app.services.vector_store import (
+    CHUNK_INDEX_PATTERN,
+    delete_document_chunks,
+    delete_document_metadata,
+    get_document_metadata,
+    get_task_status,
+    invalidate_document,
+    list_deleting_document_ids,
+    update_chunk_tags,
+    update_document_metadata,
+)
+from app.utils.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Seconds between progress checks of a running delete_by_query task
+DELETION_POLL_INTERVAL = 1.0
+
+# Finished deletions whose outcome is still reported by get_deletion_status
+MAX_FINISHED_DELETIONS = 1000
+
+# Deletions running in this process; None while one is being launched
+_running_deletions: Dict[str, Optional[asyncio.Task]] = {}
+
+class DeletionStatusStore:
+    """Deletion progress in SQLite, so any worker can report a deletion another one runs"""
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS deletions (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                total INTEGER,
+                deleted INTEGER NOT NULL,
+                task TEXT,
+                error TEXT,
+                updated_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS deletions_updated ON deletions (status, updated_at);
+        """)
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM deletions WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        status = {"id": row["id"], "status": row["status"], "total": row["total"], "deleted": row["deleted"]}
+        if row["task"] is not None:
+            status["task"] = row["task"]
+        if row["error"] is not None:
+            status["error"] = row["error"]
+        return status
+
+    def save(self, status: Dict[str, Any]):
+        """Record a deletion's progress, dropping the oldest finished ones beyond MAX_FINISHED_DELETIONS"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO deletions (id, status, total, deleted, task, error, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    status["id"],
+                    status["status"],
+                    status["total"],
+                    status["deleted"],
+                    status.get("task"),
+                    status.get("error"),
+                    datetime.now().isoformat(),
+                ),
+            )
+            if status["status"] != "deleting":
+                self.conn.execute(
+                    "DELETE FROM deletions WHERE status != 'deleting' AND id NOT IN ("
+                    " SELECT id FROM deletions WHERE status != 'deleting' ORDER BY updated_at DESC LIMIT ?)",
+                    (MAX_FINISHED_DELETIONS,),
+                )
+
+_status_store: Optional[DeletionStatusStore] = None
+
+def get_deletion_store() -> DeletionStatusStore:
+    global _status_store
+    if _status_store is None:
+        _status_store = DeletionStatusStore(settings.DELETION_STATUS_PATH)
+    return _status_store
+
+async def save_deletion_status(status: Dict[str, Any]):
+    await asyncio.to_thread(get_deletion_store().save, status)
+
+async def delete_document(doc_id: str) -> Optional[Dict[str, Any]]:
+    """Start deleting a document; returns its deletion status, or None if it does not exist.
+
+    The document is marked as deleting right away, which hides it from
+    listings and search results. Its chunks are then removed from every
+    chunk index version by a background delete_by_query task.
+    """
+    metadata = await get_document_metadata(doc_id)
+    if metadata is None:
+        return None
+
+    if metadata.status != "deleting":
+        await update_document_metadata(doc_id, {"status": "deleting", "updated_at": datetime.now()})
+    invalidate_document(doc_id)
+    await launch_deletion(doc_id)
+    return await get_deletion_status(doc_id)
+
+async def launch_deletion(doc_id: str):
+    if doc_id not in _running_deletions:
+        status = {"id": doc_id, "status": "deleting", "total": None, "deleted": 0}
+        # Claimed before the first await, so a concurrent call does not start a second run
+        _running_deletions[doc_id] = None
+        try:
+            await save_deletion_status(status)
+        except BaseException:
+            _running_deletions.pop(doc_id, None)
+            raise
+        _running_deletions[doc_id] = asyncio.create_task(run_deletion(status))
+
+async def get_deletion_status(doc_id: str) -> Optional[Dict[str, Any]]:
+    """Progress of a document deletion, started by any worker"""
+    return await asyncio.to_thread(get_deletion_store().get, doc_id)
+
+async def resume_document_deletions():
+    """Restart deletions interrupted by a restart"""
+    for doc_id in await list_deleting_document_ids():
+        await launch_deletion(doc_id)
+
+async def run_deletion(status: Dict[str, Any]):
+    doc_id = status["id"]
+    try:
+        # Waits for a reprocess that got in first (later ones see the status and
+        # refuse), so its chunks are written before they are deleted below
+        async with document_lock(doc_id):
+            metadata = await get_document_metadata(doc_id)
+            if metadata is not None and metadata.status != "deleting":
+                await update_document_metadata(doc_id, {"status": "deleting", "updated_at": datetime.now()})
+            canonical_chunk_ids = await stop_matching_document(doc_id)
+
+        # Chunks of other documents that were linked to this one as duplicates
+        # must be indexed before its chunks disappear from results. Their links
+        # are only dropped once they are indexed, so a failed or interrupted
+        # deletion finds them again when it is retried.
+        await promote_dependents(doc_id, canonical_chunk_ids)
+        await forget_document(doc_id)
+
+        task_id = await delete_document_chunks(doc_id, index_name=CHUNK_INDEX_PATTERN, wait_for_completion=False)
+        status["task"] = task_id
+        while True:
+            progress = await get_task_status(task_id)
+            status["total"] = progress["total"]
+            status["deleted"] = progress["deleted"]
+            if progress["completed"]:
+                break
+            await save_deletion_status(status)
+            await asyncio.sleep(DELETION_POLL_INTERVAL)
+        if progress["failures"]:
+            raise Exception(f"Chunk deletion failed: {progress['failures'][0]}")
+
+        await delete_document_metadata(doc_id)
+        invalidate_document(doc_id)
+        status["status"] = "deleted"
+    except Exception as e:
+        # The document stays marked as deleting and is retried on restart
+        logger.exception("Deleting document %s failed", doc_id)
+        status["status"] = "failed"
+        status["error"] = str(e)
+    finally:
+        try:
+            await save_deletion_status(status)
+        finally:
+            _running_deletions.pop(doc_id, None)
+
+async def update_document_tags(doc_id: str, tags: List[str]) -> Optional[Dict[str, Any]]:
+    """Replace a document's tags in its metadata and all of its chunks; None if it does not exist"""
+    metadata = await get_document_metadata(doc_id)
+    if metadata is None or metadata.status == "deleting":
+        return None
+
+    await update_document_metadata(doc_id, {"tags": tags, "updated_at": datetime.now()})
+    chunks_updated = await update_chunk_tags(doc_id, tags)
+    invalidate_document(doc_id)
+    return {"id": doc_id, "tags": tags, "chunks_updated": chunks_updated}
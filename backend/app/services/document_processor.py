@@ -1,23 +1,84 @@
 import os
-from typing import List, Dict, Any
-import PyPDF2
-import docx2txt
+import weakref
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
+import numpy as np
 from app.models.knowledge_base import Document, DocumentMetadata, TextChunk
 from app.services.embedding import get_embeddings
-from app.services.vector_store import store_document_chunks
+from app.services.vector_store import (
+    CHUNK_INDEX_ALIAS,
+    store_document_chunks,
+    get_document_metadata,
+    delete_document_chunks,
+    get_active_embedding_spec,
+    index_chunks,
+    invalidate_document,
+    update_document_metadata,
+)
+from app.services.extraction import check_chunking, extract_and_split, split_artifact
+from app.services.dedup import (
+    find_dependents,
+    find_near_duplicates,
+    forget_chunks,
+    linked_duplicates,
+    register_chunks,
+    stop_matching_document,
+)
 from app.utils.config import get_settings
 
 settings = get_settings()
 
+# Process pool for CPU-bound extraction and chunking, created on first use
+_process_pool = None
+
+# Embedding and indexing run as separately bounded stages
+embed_semaphore = asyncio.Semaphore(settings.EMBED_CONCURRENCY)
+index_semaphore = asyncio.Semaphore(settings.INDEX_CONCURRENCY)
+
+# Replacing a document's chunks and promoting other documents' duplicates
+# into it must not interleave; locks are dropped once nobody holds them
+_document_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def document_lock(doc_id: str) -> asyncio.Lock:
+    lock = _document_locks.get(doc_id)
+    if lock is None:
+        lock = _document_locks[doc_id] = asyncio.Lock()
+    return lock
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Get the shared process pool used for extraction and chunking"""
+    global _process_pool
+    
+    if _process_pool is None:
+        # Spawn rather than fork so workers never inherit model or client state
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.PROCESS_POOL_WORKERS or None,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
 async def process_document(file_path: str, filename: str, tags: List[str] = None) -> str:
     """Process a document: extract text, split into chunks, embed, and store"""
+    document = await ingest_file(file_path, filename, tags)
+    return document.metadata.id
+
+async def ingest_file(
+    file_path: str,
+    filename: str,
+    tags: List[str] = None,
+    doc_id: Optional[str] = None,
+) -> Document:
+    """Run a file through every ingestion stage; returns the indexed document.
+
+    ``doc_id`` re-ingests under an existing document ID, e.g. to finish an
+    import that was interrupted.
+    """
     # Determine document type from extension
     _, ext = os.path.splitext(filename)
     doc_type = ext[1:].lower()  # Remove the dot
     
-    # Extract text from document
-    text = extract_text(file_path, doc_type)
-    
     # Create document metadata
     metadata = DocumentMetadata(
         title=os.path.basename(filename),
@@ -27,98 +88,158 @@ async def process_document(file_path: str, filename: str, tags: List[str] = None
         size_bytes=os.path.getsize(file_path),
         status="processing"
     )
+    if doc_id:
+        metadata.id = doc_id
     
-    # Split text into chunks
-    chunks = split_text(text, metadata.id)
+    # Extract text (or load the cached artifact) and split it into chunks in the process pool
+    loop = asyncio.get_running_loop()
+    chunks, content_hash, page_count = await loop.run_in_executor(
+        get_process_pool(), extract_and_split, file_path, doc_type, metadata.id
+    )
+    metadata.content_hash = content_hash
+    metadata.page_count = page_count
     
     # Create the document object
     document = Document(metadata=metadata, chunks=chunks)
     
+    # Deduplicate, embed and store
+    return await index_document(document)
+
+async def index_document(document: Document) -> Document:
+    """Run the shared ingestion stages on a chunked document: dedup, embed and store"""
+    # Near-duplicates of already indexed chunks are linked, not embedded or indexed
+    dedup = await find_near_duplicates(document.chunks)
+    document.chunks = dedup.unique_chunks
+    document.metadata.chunk_count = len(dedup.unique_chunks) + len(dedup.duplicates)
+    document.metadata.duplicate_chunk_count = len(dedup.duplicates)
+    
     # Get embeddings for chunks
-    document = await embed_chunks(document)
+    async with embed_semaphore:
+        document = await embed_chunks(document)
     
     # Store in vector database
     document.metadata.status = "processed"
-    await store_document_chunks(document)
+    async with index_semaphore:
+        await store_document_chunks(document)
     
-    return document.metadata.id
-
-def extract_text(file_path: str, doc_type: str) -> str:
-    """Extract text from different document types"""
-    if doc_type == "pdf":
-        return extract_from_pdf(file_path)
-    elif doc_type in ["docx", "doc"]:
-        return extract_from_docx(file_path)
-    elif doc_type == "txt":
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    else:
-        raise ValueError(f"Unsupported document type: {doc_type}")
-
-def extract_from_pdf(file_path: str) -> str:
-    """Extract text from PDF files"""
-    text = ""
-    with open(file_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        for page in reader.pages:
-            text += page.extract_text() + "\n\n"
-    return text
-
-def extract_from_docx(file_path: str) -> str:
-    """Extract text from DOCX files"""
-    return docx2txt.process(file_path)
-
-def split_text(text: str, doc_id: str, chunk_size: int = 1000, overlap: int = 200) -> List[TextChunk]:
-    """Split text into overlapping chunks for processing"""
-    chunks = []
-    
-    # Simple splitting by chunk_size with overlap
-    start = 0
-    chunk_num = 0
-    
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        
-        # Try to find a good break point (newline or space)
-        if end < len(text):
-            # Look for newline first
-            newline_pos = text.rfind('\n', start, end)
-            if newline_pos > start + chunk_size // 2:
-                end = newline_pos + 1
-            else:
-                # Look for space
-                space_pos = text.rfind(' ', start, end)
-                if space_pos > start + chunk_size // 2:
-                    end = space_pos + 1
-        
-        chunk_text = text[start:end]
-        
-        # Only create a chunk if it has meaningful content
-        if chunk_text.strip():
-            chunk = TextChunk(
-                document_id=doc_id,
-                content=chunk_text,
-                chunk_num=chunk_num,
-                metadata={"start_char": start, "end_char": end}
-            )
-            chunks.append(chunk)
-            chunk_num += 1
-        
-        # Move start position, accounting for overlap
-        start = end - overlap if end < len(text) else len(text)
-    
-    return chunks
+    # Only indexed chunks may serve as canonical chunks for later uploads
+    await register_chunks(document.metadata.id, dedup)
+    
+    return document
 
 async def embed_chunks(document: Document) -> Document:
     """Generate embeddings for document chunks"""
     # Get all chunk texts
     texts = [chunk.content for chunk in document.chunks]
+    if not texts:
+        document.embeddings = np.empty((0, 0), dtype=np.float32)
+        return document
     
-    # Generate embeddings
-    embeddings = await get_embeddings(texts)
-    
-    # Assign embeddings back to chunks
-    for i, embedding in enumerate(embeddings):
-        document.chunks[i].embedding = embedding
+    # Generate embeddings as one matrix with the model of the live index; row i belongs to chunk i
+    spec = await get_active_embedding_spec()
+    document.embeddings = await get_embeddings(texts, **spec)
+    document.embedding_spec = spec
     
     return document
+
+async def reprocess_document(doc_id: str, chunk_size: int, overlap: int) -> int:
+    """Re-chunk and re-embed a stored document from its extracted-text artifact.
+
+    New chunks are indexed before the old ones are removed, so the document
+    stays searchable throughout. Returns the new chunk count.
+    """
+    metadata = await get_reprocessable_metadata(doc_id)
+    if not metadata.content_hash:
+        raise ValueError(f"Document {doc_id} has no extracted-text artifact")
+    
+    loop = asyncio.get_running_loop()
+    chunks = await loop.run_in_executor(
+        get_process_pool(), split_artifact, metadata.content_hash, doc_id, chunk_size, overlap
+    )
+    
+    # The document's old chunks must not count as canonical copies of its new
+    # ones, and other documents' duplicates of them must survive their removal
+    async with document_lock(doc_id):
+        # A deletion may have started while the artifact was being split
+        document = Document(metadata=await get_reprocessable_metadata(doc_id), chunks=chunks)
+        old_chunk_ids = await stop_matching_document(doc_id)
+        document = await index_document(document)
+    await retire_old_chunks(doc_id, old_chunk_ids, keep_ids=[chunk.id for chunk in document.chunks])
+    
+    return document.metadata.chunk_count
+
+async def get_reprocessable_metadata(doc_id: str) -> DocumentMetadata:
+    """A document's metadata, or ValueError if it is missing or being deleted"""
+    metadata = await get_document_metadata(doc_id)
+    if metadata is None:
+        raise ValueError(f"Document {doc_id} not found")
+    if metadata.status == "deleting":
+        raise ValueError(f"Document {doc_id} is being deleted")
+    return metadata
+
+async def retire_old_chunks(doc_id: str, old_chunk_ids: List[str], keep_ids: List[str]):
+    """Remove a document's chunks replaced by a new version of it.
+
+    ``old_chunk_ids`` comes from stop_matching_document, called before the
+    new chunks were indexed. Other documents' duplicates of the old chunks
+    are indexed first, so their content stays searchable.
+    """
+    await promote_dependents(doc_id, old_chunk_ids)
+    await forget_chunks(old_chunk_ids)
+    async with index_semaphore:
+        await delete_document_chunks(doc_id, keep_ids=keep_ids)
+
+async def promote_dependents(doc_id: str, chunk_ids: List[str]):
+    """Index other documents' near-duplicates of a document's chunks before those chunks are removed"""
+    await promote_orphaned_duplicates(await find_dependents(doc_id, chunk_ids))
+
+async def promote_orphaned_duplicates(chunks: List[TextChunk]):
+    """Index duplicate chunks whose canonical chunk is being removed"""
+    by_document: Dict[str, List[TextChunk]] = {}
+    for chunk in chunks:
+        by_document.setdefault(chunk.document_id, []).append(chunk)
+
+    for doc_id, chunks in by_document.items():
+        async with document_lock(doc_id):
+            # The owning document may have been re-chunked or deleted meanwhile
+            linked = await linked_duplicates([chunk.id for chunk in chunks])
+            doc_chunks = [chunk for chunk in chunks if chunk.id in linked]
+            metadata = await get_document_metadata(doc_id)
+            if not doc_chunks or metadata is None or metadata.status == "deleting":
+                continue
+
+            # Orphans may still duplicate each other or chunks of other documents
+            dedup = await find_near_duplicates(doc_chunks)
+            document = await embed_chunks(Document(metadata, dedup.unique_chunks))
+            if document.chunks:
+                await index_chunks(
+                    CHUNK_INDEX_ALIAS, document.chunks, document.embeddings, document.embedding_spec, metadata.tags,
+                )
+            await register_chunks(doc_id, dedup, replaces=[chunk.id for chunk in doc_chunks])
+
+            await update_document_metadata(doc_id, {
+                "duplicate_chunk_count": max(0, (metadata.duplicate_chunk_count or 0) - len(dedup.unique_chunks)),
+            })
+        invalidate_document(doc_id)
+
+async def reprocess_documents(
+    doc_ids: List[str],
+    chunk_size: Optional[int] = None,
+    overlap: Optional[int] = None,
+    concurrency: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Re-chunk and re-embed many documents in parallel without re-parsing originals"""
+    check_chunking(chunk_size, overlap)
+    chunk_size = settings.CHUNK_SIZE if chunk_size is None else chunk_size
+    overlap = settings.CHUNK_OVERLAP if overlap is None else overlap
+    semaphore = asyncio.Semaphore(concurrency or settings.REPROCESS_CONCURRENCY)
+    
+    async def reprocess(doc_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                chunk_count = await reprocess_document(doc_id, chunk_size, overlap)
+                return {"id": doc_id, "success": True, "chunks": chunk_count}
+            except Exception as e:
+                return {"id": doc_id, "success": False, "error": str(e)}
+    
+    return await asyncio.gather(*(reprocess(doc_id) for doc_id in doc_ids))
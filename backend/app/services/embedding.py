@@ -1,65 +1,48 @@
-from typing import List
-import boto3
-import json
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Optional
 import numpy as np
+from app.services.providers import get_provider
 from app.utils.config import get_settings
+from app.utils.metrics import track_stage
 
 settings = get_settings()
 
-# Initialize local embedding model
-local_model = None
-
-async def get_embeddings(texts: List[str]) -> List[List[float]]:
-    """Generate embeddings for a list of text chunks"""
+def get_embedding_spec() -> Dict[str, str]:
+    """Embedding provider and model configured in settings"""
     if settings.EMBEDDING_PROVIDER == "bedrock":
-        return await get_bedrock_embeddings(texts)
-    else:
-        return await get_local_embeddings(texts)
+        return {"provider": "bedrock", "model": settings.BEDROCK_EMBEDDING_MODEL}
+    return {"provider": "local", "model": settings.LOCAL_EMBEDDING_MODEL}
+
+def resolve_embedding_model(provider: Optional[str] = None, model: Optional[str] = None) -> Dict[str, str]:
+    """Fill in the configured provider and model where not given"""
+    provider = provider or settings.EMBEDDING_PROVIDER
+    if not model:
+        model = settings.BEDROCK_EMBEDDING_MODEL if provider == "bedrock" else settings.LOCAL_EMBEDDING_MODEL
+    return {"provider": provider, "model": model}
+
+def get_embedding_backend(provider: str):
+    """Backend module for a provider; local models go through the shared sidecar when one is configured"""
+    if provider == "local" and settings.EMBEDDING_SIDECAR_SOCKET:
+        return get_provider("embedding", "local_sidecar")
+    return get_provider("embedding", provider)
+
+async def get_embeddings(
+    texts: List[str],
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+) -> np.ndarray:
+    """Generate embeddings for a list of text chunks.
 
-async def get_bedrock_embeddings(texts: List[str]) -> List[List[float]]:
-    """Get embeddings using AWS Bedrock"""
-    # Initialize Bedrock client
-    bedrock_runtime = boto3.client(
-        service_name="bedrock-runtime",
-        region_name=settings.AWS_REGION,
-    )
-    
-    embeddings = []
-    
-    # Process in batches to avoid hitting API limits
-    batch_size = 10
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
-        batch_embeddings = []
-        
-        for text in batch:
-            # Call Bedrock embedding model
-            response = bedrock_runtime.invoke_model(
-                modelId=settings.BEDROCK_EMBEDDING_MODEL,
-                body=json.dumps({
-                    "inputText": text,
-                })
-            )
-            
-            response_body = json.loads(response.get('body').read())
-            embedding = response_body.get('embedding')
-            batch_embeddings.append(embedding)
-            
-        embeddings.extend(batch_embeddings)
-    
-    return embeddings
+    Returns a contiguous float32 matrix with one row per input text. The
+    provider and model default to the configured ones; callers pass them
+    explicitly to embed for a specific index version. Provider backends are
+    imported on first use, so only the configured one is ever loaded.
+    """
+    spec = resolve_embedding_model(provider, model)
+    backend = get_embedding_backend(spec["provider"])
+    with track_stage("embedding", f"{spec['provider']}:{spec['model']}"):
+        return await backend.embed(texts, spec["model"])
 
-async def get_local_embeddings(texts: List[str]) -> List[List[float]]:
-    """Get embeddings using local model"""
-    global local_model
-    
-    if local_model is None:
-        # Load the model on first use
-        local_model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    # Generate embeddings
-    embeddings = local_model.encode(texts)
-    
-    # Convert numpy arrays to lists for JSON serialization
-    return [embedding.tolist() for embedding in embeddings]
+async def warmup_embeddings(provider: Optional[str] = None, model: Optional[str] = None):
+    """Load an embedding backend and its model ahead of the first request"""
+    spec = resolve_embedding_model(provider, model)
+    await get_embedding_backend(spec["provider"]).warmup(spec["model"])
@@ -0,0 +1,54 @@
+from typing import List
+import asyncio
+import json
+import numpy as np
+from app.services.bedrock_client import get_bedrock_runtime, is_bedrock_failure
+from app.utils.resilience import get_breaker
+
+async def embed(texts: List[str], model: str) -> np.ndarray:
+    """Get embeddings using AWS Bedrock"""
+    # Use the shared Bedrock runtime client
+    bedrock_runtime = get_bedrock_runtime()
+    
+    embeddings = None
+    
+    breaker = get_breaker(f"bedrock:{model}")
+    
+    # Titan takes one text per call, so each batch is sent as concurrent
+    # calls off the event loop; batches bound the number in flight
+    batch_size = 10
+    for i in range(0, len(texts), batch_size):
+        batch = texts[i:i + batch_size]
+        batch_embeddings = await asyncio.gather(*(
+            breaker.call(
+                lambda text=text: asyncio.to_thread(invoke_embedding_model, bedrock_runtime, model, text),
+                is_bedrock_failure,
+                "embedding",
+            )
+            for text in batch
+        ))
+        
+        # Write each batch straight into one preallocated float32 matrix
+        batch_matrix = np.asarray(batch_embeddings, dtype=np.float32)
+        if embeddings is None:
+            embeddings = np.empty((len(texts), batch_matrix.shape[1]), dtype=np.float32)
+        embeddings[i:i + len(batch)] = batch_matrix
+    
+    if embeddings is None:
+        return np.empty((0, 0), dtype=np.float32)
+    return embeddings
+
+def invoke_embedding_model(bedrock_runtime, model: str, text: str) -> List[float]:
+    """Embed one text with a Bedrock embedding model (blocking)"""
+    response = bedrock_runtime.invoke_model(
+        modelId=model,
+        body=json.dumps({
+            "inputText": text,
+        })
+    )
+    response_body = json.loads(response.get('body').read())
+    return response_body.get('embedding')
+
+async def warmup(model: str):
+    """Create the Bedrock client so the first request does not pay for it"""
+    await asyncio.to_thread(get_bedrock_runtime)
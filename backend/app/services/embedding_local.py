@@ -0,0 +1,34 @@
+from typing import Dict, List
+import asyncio
+import threading
+from sentence_transformers import SentenceTransformer
+import numpy as np
+
+# Local embedding models, loaded on first use and keyed by model name
+local_models: Dict[str, SentenceTransformer] = {}
+_load_lock = threading.Lock()
+
+def load_model(model: str) -> SentenceTransformer:
+    """Get a local model, loading it on first use (blocking)"""
+    local_model = local_models.get(model)
+    if local_model is None:
+        with _load_lock:
+            local_model = local_models.get(model)
+            if local_model is None:
+                local_model = local_models[model] = SentenceTransformer(model)
+    return local_model
+
+async def embed(texts: List[str], model: str) -> np.ndarray:
+    """Get embeddings using local model"""
+    local_model = local_models.get(model) or await asyncio.to_thread(load_model, model)
+    
+    # Generate embeddings as a single float32 matrix; JSON conversion happens
+    # only when the vectors are serialized for indexing
+    # Encoding is CPU-bound, so keep it off the event loop
+    embeddings = await asyncio.to_thread(local_model.encode, texts, convert_to_numpy=True)
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+async def warmup(model: str):
+    """Load the model and run one encode so weights and kernels are ready"""
+    local_model = await asyncio.to_thread(load_model, model)
+    await asyncio.to_thread(local_model.encode, ["warmup"], convert_to_numpy=True)
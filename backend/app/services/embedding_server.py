@@ -0,0 +1,136 @@
+from typing import Dict, List, Tuple
+import os
+import sys
+import signal
+import asyncio
+import numpy as np
+from app.services.embedding_local import load_model
+from app.services.embedding_sidecar import encode_frame, read_frame
+from app.services.providers import get_provider
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+class EmbeddingBatcher:
+    """Merges concurrent embedding requests from all workers into model batches.
+
+    The first queued request opens a batch; it is sent to the model once it
+    holds EMBEDDING_SIDECAR_MAX_BATCH texts or EMBEDDING_SIDECAR_MAX_WAIT_MS
+    has passed. Encoding runs in one thread at a time, since the model
+    already spreads each batch over all cores.
+    """
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue: "asyncio.Queue[Tuple[str, List[str], asyncio.Future]]" = asyncio.Queue()
+
+    async def embed(self, model: str, texts: List[str]) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((model, texts, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            count = len(pending[0][1])
+            deadline = loop.time() + self.max_wait
+            while count < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                count += len(item[1])
+
+            by_model: Dict[str, List[Tuple[str, List[str], asyncio.Future]]] = {}
+            for item in pending:
+                by_model.setdefault(item[0], []).append(item)
+            for model, items in by_model.items():
+                await self.encode(model, items)
+
+    async def encode(self, model: str, items: List[Tuple[str, List[str], asyncio.Future]]):
+        texts = [text for _, item_texts, _ in items for text in item_texts]
+        try:
+            local_model = await asyncio.to_thread(load_model, model)
+            embeddings = await asyncio.to_thread(local_model.encode, texts, convert_to_numpy=True)
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for _, item_texts, future in items:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+            offset += len(item_texts)
+
+async def handle_connection(batcher: EmbeddingBatcher, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serve requests from one worker connection until it closes"""
+    try:
+        while True:
+            try:
+                request, _ = await read_frame(reader)
+            except asyncio.IncompleteReadError:
+                break
+            try:
+                if request.get("task") == "rerank":
+                    # Cross-encoder scores as a one-column matrix; each request is already a batch
+                    pairs = [(query, passage) for query, passage in request["pairs"]]
+                    result = (await get_provider("reranker", "cross_encoder").score(pairs, request["model"]))[:, None]
+                else:
+                    result = await batcher.embed(request["model"], request["texts"])
+                rows, dim = result.shape
+                writer.write(encode_frame({"rows": rows, "dim": dim}, np.ascontiguousarray(result).tobytes()))
+            except Exception as e:
+                writer.write(encode_frame({"error": str(e)}))
+            await writer.drain()
+    except asyncio.CancelledError:
+        # Shutting down; the worker reconnects or reports the sidecar as unavailable
+        pass
+    finally:
+        writer.close()
+
+async def serve(path: str):
+    """Serve local embedding models and the cross-encoder reranker on a Unix socket"""
+    if settings.EMBEDDING_WARMUP and settings.EMBEDDING_PROVIDER == "local":
+        local_model = await asyncio.to_thread(load_model, settings.LOCAL_EMBEDDING_MODEL)
+        await asyncio.to_thread(local_model.encode, ["warmup"], convert_to_numpy=True)
+    if settings.EMBEDDING_WARMUP and settings.RERANK_ENABLED and settings.RERANK_PROVIDER == "cross_encoder":
+        await get_provider("reranker", "cross_encoder").warmup(settings.RERANK_MODEL)
+
+    # Stop cleanly, removing the socket, when the serving process terminates us
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    batcher = EmbeddingBatcher(settings.EMBEDDING_SIDECAR_MAX_BATCH, settings.EMBEDDING_SIDECAR_MAX_WAIT_MS / 1000)
+    batch_task = asyncio.create_task(batcher.run())
+
+    # Bind under a temporary name so the socket only appears once it accepts connections
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: handle_connection(batcher, reader, writer),
+        path=path + ".tmp",
+    )
+    os.replace(path + ".tmp", path)
+    print(f"Embedding sidecar listening on {path}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        if os.path.exists(path):
+            os.unlink(path)
+
+def main(path: str = ""):
+    try:
+        asyncio.run(serve(path or settings.EMBEDDING_SIDECAR_SOCKET))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "")
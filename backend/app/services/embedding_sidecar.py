@@ -0,0 +1,77 @@
+from typing import List, Optional, Tuple
+import asyncio
+import struct
+import orjson
+import numpy as np
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+# Frames are a 4-byte big-endian header length, a JSON header and, for
+# responses, a raw float32 payload of header["rows"] x header["dim"]
+_LENGTH = struct.Struct(">I")
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[dict, bytes]:
+    """Read one frame; the payload is empty unless the header announces one"""
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    header = orjson.loads(await reader.readexactly(length))
+    size = header.get("rows", 0) * header.get("dim", 0) * 4
+    payload = await reader.readexactly(size) if size else b""
+    return header, payload
+
+def encode_frame(header: dict, payload: bytes = b"") -> bytes:
+    data = orjson.dumps(header)
+    return _LENGTH.pack(len(data)) + data + payload
+
+class SidecarError(Exception):
+    """Raised when the embedding sidecar rejects a request or cannot be reached"""
+
+class SidecarConnectionPool:
+    """Idle Unix socket connections to the sidecar, one request in flight per connection"""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.slots = asyncio.Semaphore(size)
+        self.idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self.loop = asyncio.get_running_loop()
+
+    async def request(self, header: dict) -> Tuple[dict, bytes]:
+        async with self.slots:
+            connection = self.idle.pop() if self.idle else await asyncio.open_unix_connection(self.path)
+            reader, writer = connection
+            try:
+                writer.write(encode_frame(header))
+                await writer.drain()
+                response = await read_frame(reader)
+            except BaseException:
+                # A half-read response leaves the stream unusable
+                writer.close()
+                raise
+            self.idle.append(connection)
+            return response
+
+_pool: Optional[SidecarConnectionPool] = None
+
+def get_pool() -> SidecarConnectionPool:
+    global _pool
+    # Connections belong to the event loop that opened them
+    if _pool is None or _pool.loop is not asyncio.get_running_loop():
+        _pool = SidecarConnectionPool(settings.EMBEDDING_SIDECAR_SOCKET, settings.EMBEDDING_SIDECAR_CONNECTIONS)
+    return _pool
+
+async def embed(texts: List[str], model: str) -> np.ndarray:
+    """Get local model embeddings from the shared sidecar process"""
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    try:
+        header, payload = await get_pool().request({"model": model, "texts": texts})
+    except (OSError, asyncio.IncompleteReadError) as e:
+        raise SidecarError(f"Embedding sidecar unavailable at {settings.EMBEDDING_SIDECAR_SOCKET}: {str(e)}") from e
+    if "error" in header:
+        raise SidecarError(f"Embedding sidecar failed: {header['error']}")
+    # Copy out of the receive buffer so the matrix is writable
+    return np.frombuffer(payload, dtype=np.float32).reshape(header["rows"], header["dim"]).copy()
+
+async def warmup(model: str):
+    """Make the sidecar load the model and open a first connection"""
+    await embed(["warmup"], model)
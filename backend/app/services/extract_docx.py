@@ -0,0 +1,6 @@
+from typing import List, Tuple
+import docx2txt
+
+def extract_pages(file_path: str) -> Tuple[str, List[int]]:
+    """Extract text from DOCX files; DOCX has no fixed pages, so it is one page"""
+    return docx2txt.process(file_path), [0]
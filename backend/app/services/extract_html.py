@@ -0,0 +1,18 @@
+from typing import Optional, Tuple
+from bs4 import BeautifulSoup
+
+def extract_html(html: str) -> Tuple[Optional[str], str]:
+    """Extract the title and main text of an HTML page"""
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.title.string.strip() if soup.title and soup.title.string else None
+    
+    # Remove script and style elements
+    for script in soup(["script", "style", "header", "footer", "nav"]):
+        script.extract()
+    
+    # Get text content
+    text = soup.get_text(separator='\n\n')
+    
+    # Clean up text: remove excessive newlines and spaces
+    lines = [line.strip() for line in text.split('\n')]
+    return title, '\n'.join(line for line in lines if line)
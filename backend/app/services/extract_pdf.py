@@ -0,0 +1,16 @@
+from typing import List, Tuple
+import PyPDF2
+
+def extract_pages(file_path: str) -> Tuple[str, List[int]]:
+    """Extract text from PDF files along with page start offsets"""
+    pages = []
+    page_starts = []
+    offset = 0
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page in reader.pages:
+            page_text = page.extract_text() + "\n\n"
+            page_starts.append(offset)
+            pages.append(page_text)
+            offset += len(page_text)
+    return "".join(pages), page_starts
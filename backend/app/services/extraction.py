@@ -0,0 +1,124 @@
+import bisect
+from typing import List, Optional, Tuple
+from app.models.knowledge_base import TextChunk
+from app.services.artifact_store import hash_file, load_artifact, save_artifact
+from app.services.providers import get_provider
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+# Runs in the ingestion process pool, so this module stays free of model,
+# client and parser imports; extractors are resolved per file type on first use
+
+def extract_and_split(file_path: str, doc_type: str, doc_id: str) -> Tuple[List[TextChunk], str, int]:
+    """Extract text from a file and split it into chunks (runs in a worker process).
+
+    The extracted text is cached as an artifact keyed by content hash, so the
+    same file is never parsed twice. Returns the chunks, the content hash and
+    the page count.
+    """
+    content_hash = hash_file(file_path)
+    artifact = load_artifact(content_hash)
+    if artifact is None:
+        text, page_starts = extract_text_with_pages(file_path, doc_type)
+        save_artifact(content_hash, text, page_starts)
+    else:
+        text, page_starts = artifact
+    
+    chunks = split_text(
+        text,
+        doc_id,
+        chunk_size=settings.CHUNK_SIZE,
+        overlap=settings.CHUNK_OVERLAP,
+        page_starts=page_starts,
+    )
+    return chunks, content_hash, len(page_starts)
+
+def check_chunking(chunk_size: Optional[int], overlap: Optional[int]):
+    """Raise ValueError unless the chunking parameters (None = configured default) are usable"""
+    if chunk_size is not None and chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    if overlap is not None and overlap < 0:
+        raise ValueError(f"overlap must not be negative, got {overlap}")
+    chunk_size = settings.CHUNK_SIZE if chunk_size is None else chunk_size
+    overlap = settings.CHUNK_OVERLAP if overlap is None else overlap
+    if overlap < 0 or overlap >= chunk_size // 2:
+        raise ValueError(f"overlap ({overlap}) must be less than half of chunk_size ({chunk_size})")
+
+def split_artifact(content_hash: str, doc_id: str, chunk_size: int, overlap: int) -> List[TextChunk]:
+    """Re-split a document from its cached artifact (runs in a worker process)"""
+    artifact = load_artifact(content_hash)
+    if artifact is None:
+        raise ValueError(f"No extracted-text artifact for content hash {content_hash}")
+    text, page_starts = artifact
+    return split_text(text, doc_id, chunk_size=chunk_size, overlap=overlap, page_starts=page_starts)
+
+def extract_text(file_path: str, doc_type: str) -> str:
+    """Extract text from different document types"""
+    text, _ = extract_text_with_pages(file_path, doc_type)
+    return text
+
+def extract_text_with_pages(file_path: str, doc_type: str) -> Tuple[str, List[int]]:
+    """Extract text and the character offset at which each page starts"""
+    try:
+        extractor = get_provider("extractor", doc_type)
+    except ValueError:
+        raise ValueError(f"Unsupported document type: {doc_type}")
+    return extractor(file_path)
+
+def extract_plain_text(file_path: str) -> Tuple[str, List[int]]:
+    """Read a UTF-8 text file as a single page"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read(), [0]
+
+def split_text(
+    text: str,
+    doc_id: str,
+    chunk_size: int = 1000,
+    overlap: int = 200,
+    page_starts: Optional[List[int]] = None,
+) -> List[TextChunk]:
+    """Split text into overlapping chunks for processing.
+
+    When page start offsets are given, each chunk is tagged with the
+    (1-based) page its first character falls on.
+    """
+    chunks = []
+    
+    # Simple splitting by chunk_size with overlap
+    start = 0
+    chunk_num = 0
+    
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        
+        # Try to find a good break point (newline or space)
+        if end < len(text):
+            # Look for newline first
+            newline_pos = text.rfind('\n', start, end)
+            if newline_pos > start + chunk_size // 2:
+                end = newline_pos + 1
+            else:
+                # Look for space
+                space_pos = text.rfind(' ', start, end)
+                if space_pos > start + chunk_size // 2:
+                    end = space_pos + 1
+        
+        chunk_text = text[start:end]
+        
+        # Only create a chunk if it has meaningful content
+        if chunk_text.strip():
+            chunk = TextChunk(
+                document_id=doc_id,
+                content=chunk_text,
+                chunk_num=chunk_num,
+                page_num=bisect.bisect_right(page_starts, start) if page_starts else None,
+                metadata={"start_char": start, "end_char": end}
+            )
+            chunks.append(chunk)
+            chunk_num += 1
+        
+        # Move start position, accounting for overlap; always advance
+        start = max(end - overlap, start + 1) if end < len(text) else len(text)
+    
+    return chunks
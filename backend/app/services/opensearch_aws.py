@@ -0,0 +1,26 @@
+import boto3
+from opensearchpy import OpenSearch, RequestsHttpConnection
+from requests_aws4auth import AWS4Auth
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+def create_aws_opensearch_client() -> OpenSearch:
+    """Connect to AWS OpenSearch Service with signed requests"""
+    # Create AWS credentials for request signing
+    credentials = boto3.Session().get_credentials()
+    awsauth = AWS4Auth(
+        settings.AWS_ACCESS_KEY_ID,
+        settings.AWS_SECRET_ACCESS_KEY,
+        settings.AWS_REGION,
+        'es',
+        session_token=credentials.token if hasattr(credentials, 'token') else None
+    )
+    
+    return OpenSearch(
+        hosts=[{'host': settings.OPENSEARCH_HOST, 'port': settings.OPENSEARCH_PORT}],
+        http_auth=awsauth,
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=RequestsHttpConnection
+    )
@@ -0,0 +1,111 @@
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+from starlette.requests import HTTPConnection
+
+from app.services.retrieval import retrieve_relevant_chunks
+from app.services.vector_store import on_document_change
+from app.utils.admission import try_acquire_slot
+from app.utils.config import get_settings
+from app.utils.metrics import current_endpoint, record_cache
+from app.utils.resilience import set_deadline, within_deadline
+
+settings = get_settings()
+
+# Bumped whenever a document changes in this process, so prefetched results
+# retrieved before the change are not served after it
+_document_generation = 0
+
+def bump_document_generation(doc_id: str):
+    global _document_generation
+    _document_generation += 1
+
+on_document_change(bump_document_generation)
+
+def prefetch_key(query: str, knowledge_base_ids: Optional[List[str]]) -> Tuple[str, Optional[Tuple[str, ...]]]:
+    """What a prefetch is matched on: the query up to whitespace, and the knowledge bases searched"""
+    return " ".join(query.split()), tuple(sorted(knowledge_base_ids)) if knowledge_base_ids else None
+
+class RetrievalPrefetcher:
+    """Speculative retrieval for the draft query of one websocket connection.
+
+    Each draft replaces the previous one: its retrieval is cancelled, and the
+    new one starts once the draft has not changed for PREFETCH_DEBOUNCE_MS.
+    Prefetches only run when an interactive admission slot is free right
+    away, so they never queue ahead of real queries. When the submitted
+    query matches the draft, take() returns the prefetched contexts (waiting
+    for a retrieval that is still running) instead of retrieving again.
+    """
+
+    def __init__(self, connection: HTTPConnection):
+        self.connection = connection
+        self.key = None
+        self.task: Optional[asyncio.Task] = None
+        self.started = False
+        self.generation = 0
+        self.finished_at = 0.0
+
+    def prefetch(self, query: str, knowledge_base_ids: Optional[List[str]] = None):
+        """Start (or keep) speculative retrieval for a draft query"""
+        key = prefetch_key(query, knowledge_base_ids)
+        task = self.task
+        # Same draft again: keep its retrieval unless it was skipped or failed
+        if key == self.key and task is not None and not (task.done() and (task.cancelled() or task.exception() or task.result() is None)):
+            return
+        self.cancel()
+        if not key[0]:
+            return
+        self.key = key
+        self.started = False
+        self.task = asyncio.create_task(self.run(key[0], knowledge_base_ids))
+        # A failed prefetch that is never taken is not worth a warning
+        self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def run(self, query: str, knowledge_base_ids: Optional[List[str]]) -> Optional[List[Dict[str, Any]]]:
+        await asyncio.sleep(settings.PREFETCH_DEBOUNCE_MS / 1000)
+        slot = try_acquire_slot("interactive", self.connection)
+        if slot is None:
+            return None
+        self.started = True
+        self.generation = _document_generation
+        current_endpoint.set("prefetch")
+        set_deadline(settings.REQUEST_DEADLINE_SECONDS)
+        try:
+            contexts = await retrieve_relevant_chunks(query=query, knowledge_base_ids=knowledge_base_ids)
+        finally:
+            slot.release()
+        self.finished_at = time.monotonic()
+        return contexts
+
+    async def take(self, query: str, knowledge_base_ids: Optional[List[str]] = None) -> Optional[List[Dict[str, Any]]]:
+        """Prefetched contexts for this exact query, or None if it has to be retrieved normally"""
+        task, key, started = self.task, self.key, self.started
+        self.task = self.key = None
+        if task is None:
+            return None
+        if key != prefetch_key(query, knowledge_base_ids) or not started:
+            # A prefetch still in its debounce delay is no head start
+            task.cancel()
+            record_cache("prefetch", hit=False)
+            return None
+
+        try:
+            contexts = await within_deadline(task, "prefetch")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            contexts = None
+        fresh = (
+            self.generation == _document_generation
+            and time.monotonic() - self.finished_at < settings.PREFETCH_TTL_SECONDS
+        )
+        if contexts is None or not fresh:
+            record_cache("prefetch", hit=False)
+            return None
+        record_cache("prefetch", hit=True)
+        return contexts
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.task = self.key = None
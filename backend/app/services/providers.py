@@ -0,0 +1,71 @@
+import importlib
+import threading
+from typing import Any, Dict, List
+
+# Pluggable backends by kind and name, given as "module" or "module:attribute".
+# They are imported on first use, so heavy dependencies (PyTorch, PyPDF2,
+# boto3, ...) are never loaded by processes that do not need them.
+#
+# - embedding: a module with async embed(texts, model) -> np.ndarray and async warmup(model)
+# - extractor: extract(file_path) -> (text, page_starts); "html" takes page
+#   source and returns (title, text) instead
+# - vector_store: a factory returning an opensearch-py compatible client
+# - reranker: a module with async score(pairs, model) -> np.ndarray of
+#   (query, passage) relevance scores and async warmup(model)
+PROVIDERS: Dict[str, Dict[str, str]] = {
+    "embedding": {
+        "bedrock": "app.services.embedding_bedrock",
+        "local": "app.services.embedding_local",
+        "local_sidecar": "app.services.embedding_sidecar",
+    },
+    "extractor": {
+        "pdf": "app.services.extract_pdf:extract_pages",
+        "docx": "app.services.extract_docx:extract_pages",
+        "doc": "app.services.extract_docx:extract_pages",
+        "txt": "app.services.extraction:extract_plain_text",
+        "html": "app.services.extract_html:extract_html",
+    },
+    "vector_store": {
+        "opensearch": "app.services.vector_store:create_local_opensearch_client",
+        "aws_opensearch": "app.services.opensearch_aws:create_aws_opensearch_client",
+    },
+    "reranker": {
+        "cross_encoder": "app.services.rerank_local",
+        "cross_encoder_sidecar": "app.services.rerank_sidecar",
+    },
+}
+
+_loaded: Dict[tuple, Any] = {}
+_lock = threading.Lock()
+
+def register_provider(kind: str, name: str, target: str):
+    """Register or replace a backend given as "package.module" or "package.module:attribute" """
+    with _lock:
+        PROVIDERS.setdefault(kind, {})[name] = target
+        _loaded.pop((kind, name), None)
+
+def get_provider(kind: str, name: str) -> Any:
+    """Resolve a backend, importing it on first use; raises ValueError for unknown names"""
+    key = (kind, name)
+    provider = _loaded.get(key)
+    if provider is not None:
+        return provider
+
+    target = PROVIDERS.get(kind, {}).get(name)
+    if target is None:
+        raise ValueError(f"Unknown {kind} provider: {name}")
+
+    # Imports take the import lock anyway; this only avoids resolving twice
+    with _lock:
+        if key not in _loaded:
+            module_name, _, attribute = target.partition(":")
+            provider = importlib.import_module(module_name)
+            _loaded[key] = getattr(provider, attribute) if attribute else provider
+        return _loaded[key]
+
+def loaded_providers() -> Dict[str, List[str]]:
+    """Names of the backends imported so far, by kind"""
+    loaded: Dict[str, List[str]] = {}
+    for kind, name in sorted(_loaded):
+        loaded.setdefault(kind, []).append(name)
+    return loaded
@@ -0,0 +1,373 @@
+import os
+import time
+import fcntl
+import logging
+import asyncio
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+from opensearchpy.helpers import scan
+
+from app.models.knowledge_base import ReindexJob, TextChunk
+from app.services.embedding import get_embeddings, get_embedding_spec
+from app.services.dedup import forget_chunks, register_indexed_chunks, stop_matching_document
+from app.services.document_processor import document_lock, get_process_pool, promote_dependents
+from app.services.extraction import check_chunking, split_artifact
+from app.services.vector_store import (
+    CHUNK_INDEX_ALIAS,
+    METADATA_INDEX,
+    get_opensearch_client,
+    ensure_indexes,
+    create_chunk_index,
+    chunk_index_name,
+    chunk_index_version,
+    list_chunk_indexes,
+    get_chunk_index_target,
+    swap_chunk_alias,
+    delete_document_chunks,
+    embedding_model_key,
+    index_chunks,
+)
+from app.utils.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Documents fetched from document_metadata per page
+REINDEX_PAGE_SIZE = 100
+
+# Jobs running in this process, keyed by job ID
+_running_jobs: Dict[str, asyncio.Task] = {}
+
+def get_job_dir() -> str:
+    """Directory holding reindex job state files"""
+    return os.path.join(settings.UPLOAD_DIR, "reindex")
+
+def job_path(job_id: str) -> str:
+    return os.path.join(get_job_dir(), f"{job_id}.json")
+
+def rechunked_path(job_id: str) -> str:
+    """IDs of the documents a job re-chunked, one per line"""
+    return os.path.join(get_job_dir(), f"{job_id}.rechunked")
+
+def save_job(job: ReindexJob):
+    """Persist job progress so it can be resumed after a crash"""
+    job.updated_at = datetime.now()
+    tmp_path = job_path(job.id) + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(job.model_dump_json())
+    os.replace(tmp_path, job_path(job.id))
+
+def load_job(job_id: str) -> Optional[ReindexJob]:
+    """Load a job's persisted state"""
+    path = job_path(job_id)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return ReindexJob.model_validate_json(f.read())
+
+def list_jobs() -> List[ReindexJob]:
+    """List all persisted reindex jobs, newest first"""
+    if not os.path.isdir(get_job_dir()):
+        return []
+    jobs = [load_job(name[:-len(".json")]) for name in os.listdir(get_job_dir()) if name.endswith(".json")]
+    return sorted(jobs, key=lambda job: job.started_at, reverse=True)
+
+async def start_reindex(
+    embedding_provider: Optional[str] = None,
+    embedding_model: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    overlap: Optional[int] = None,
+    max_chunks_per_sec: Optional[float] = None,
+) -> ReindexJob:
+    """Create the next chunk index version and start re-embedding into it in the background"""
+    if chunk_size is not None or overlap is not None:
+        check_chunking(chunk_size, overlap)
+    if any(job.status == "running" for job in list_jobs()):
+        raise ValueError("A reindex job is already running")
+
+    await ensure_indexes()
+    spec = get_embedding_spec()
+    if embedding_provider:
+        spec = {"provider": embedding_provider, "model": embedding_model or spec["model"]}
+    elif embedding_model:
+        spec["model"] = embedding_model
+
+    # The new version gets the dimension of the target model
+    dimension = (await get_embeddings(["dimension probe"], **spec)).shape[1]
+    versions = [index["version"] for index in await list_chunk_indexes()]
+    target_index = chunk_index_name(max(versions, default=0) + 1)
+    await create_chunk_index(target_index, dimension, spec)
+
+    job = ReindexJob(
+        source_index=await get_chunk_index_target(),
+        target_index=target_index,
+        embedding_provider=spec["provider"],
+        embedding_model=spec["model"],
+        chunk_size=chunk_size,
+        overlap=overlap,
+        max_chunks_per_sec=max_chunks_per_sec or settings.REINDEX_MAX_CHUNKS_PER_SEC,
+    )
+    os.makedirs(get_job_dir(), exist_ok=True)
+    save_job(job)
+    launch_job(job)
+    return job
+
+async def resume_reindex_jobs():
+    """Resume jobs that were still running when the process stopped"""
+    for job in list_jobs():
+        if job.status == "running":
+            launch_job(job)
+
+def launch_job(job: ReindexJob):
+    """Run a job as a background task in this process"""
+    if job.id not in _running_jobs:
+        task = asyncio.create_task(run_reindex_job(job))
+        _running_jobs[job.id] = task
+        task.add_done_callback(lambda _: _running_jobs.pop(job.id, None))
+
+async def run_reindex_job(job: ReindexJob):
+    """Copy every document into the job's target index, then swap the alias.
+
+    Progress is checkpointed after each document. Only one process runs a
+    given job at a time: the others find its lock file held and return.
+    Documents uploaded while the job runs sort after the cursor, so they
+    are picked up by later pages, or after the swap by a catch-up pass from
+    the cursor for those that reached the previous index in between.
+    """
+    lock_file = open(job_path(job.id) + ".lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return
+
+    try:
+        # Re-read under the lock in case another process made progress
+        job = load_job(job.id)
+        if job.status != "running":
+            return
+
+        client = await get_opensearch_client()
+        if job.swapped_at is None:
+            count = await asyncio.to_thread(client.count, index=METADATA_INDEX)
+            job.total_documents = count["count"]
+            await copy_documents(job)
+
+            await swap_chunk_alias(job.target_index)
+            job.swapped_at = datetime.now()
+            save_job(job)
+
+        # Uploads from here on go to the target index; the ones between the
+        # last page and the swap went to the previous index
+        await asyncio.to_thread(client.indices.refresh, index=f"{METADATA_INDEX},{job.source_index}")
+        await copy_documents(job, catch_up=True)
+        await hand_over_duplicates(job)
+
+        job.status = "completed"
+        job.completed_at = datetime.now()
+        save_job(job)
+    except Exception as e:
+        logger.exception("Reindex job %s failed", job.id)
+        job.status = "failed"
+        job.error = str(e)
+        save_job(job)
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+async def copy_documents(job: ReindexJob, catch_up: bool = False):
+    """Copy documents after the job's cursor into the target index, checkpointing each one.
+
+    When catching up, documents that already have chunks in the target
+    index were uploaded after the swap; only their chunks embedded with
+    another model are redone.
+    """
+    run_started = time.monotonic()
+    run_chunks = 0
+    first_document = not catch_up
+
+    while True:
+        page = await fetch_document_page(job.cursor)
+        if not page:
+            break
+
+        for hit in page:
+            if catch_up:
+                chunk_count = await catch_up_document(job, hit["_source"])
+            else:
+                chunk_count = await reindex_document(job, hit["_source"], first_document)
+            first_document = False
+
+            job.cursor = hit["sort"]
+            job.documents_done += 1
+            job.chunks_done += chunk_count
+            save_job(job)
+
+            # Pace the job to the configured throughput (0 disables the cap)
+            run_chunks += chunk_count
+            if job.max_chunks_per_sec > 0:
+                expected = run_chunks / job.max_chunks_per_sec
+                elapsed = time.monotonic() - run_started
+                if expected > elapsed:
+                    await asyncio.sleep(expected - elapsed)
+
+async def hand_over_duplicates(job: ReindexJob):
+    """Point the near-duplicate index at the chunks of re-chunked documents in the live index.
+
+    Every chunk of a re-chunked document was indexed, so its own duplicate
+    links are dropped first, for all of them. Then each one's new chunks
+    become canonical chunks, and other documents' duplicates of its old
+    chunks are indexed before the old chunks are forgotten.
+    """
+    if not os.path.exists(rechunked_path(job.id)):
+        return
+    with open(rechunked_path(job.id)) as f:
+        doc_ids = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+    if job.dedup_done is None:
+        for doc_id in doc_ids:
+            await stop_matching_document(doc_id)
+        job.dedup_done = 0
+        save_job(job)
+
+    for doc_id in doc_ids[job.dedup_done:]:
+        chunks = await fetch_document_chunks(job.target_index, doc_id)
+        new_ids = {chunk.id for chunk in chunks}
+        async with document_lock(doc_id):
+            # Signatures stay until forgotten, so this also finds the old chunks after a restart
+            old_chunk_ids = [chunk_id for chunk_id in await stop_matching_document(doc_id) if chunk_id not in new_ids]
+            await register_indexed_chunks(doc_id, chunks)
+        await promote_dependents(doc_id, old_chunk_ids)
+        await forget_chunks(old_chunk_ids)
+
+        job.dedup_done += 1
+        save_job(job)
+
+async def catch_up_document(job: ReindexJob, source: Dict[str, Any]) -> int:
+    """Bring a document written around the swap into the target index; returns the chunks embedded"""
+    doc_id = source["id"]
+    spec = job_embedding_spec(job)
+    async with document_lock(doc_id):
+        if not await count_document_chunks(job.target_index, doc_id):
+            # It reached the previous index before the swap
+            return await reindex_document(job, source, first_document=False)
+
+        stale = await fetch_document_chunks(job.target_index, doc_id, exclude_model=embedding_model_key(spec))
+        if not stale:
+            return 0
+        embeddings = await get_embeddings([chunk.content for chunk in stale], **spec)
+        await index_chunks(job.target_index, stale, embeddings, spec, source.get("tags") or [])
+        return len(stale)
+
+def job_embedding_spec(job: ReindexJob) -> Dict[str, str]:
+    """Embedding provider and model of a job's target index"""
+    return {"provider": job.embedding_provider, "model": job.embedding_model}
+
+async def count_document_chunks(index_name: str, doc_id: str) -> int:
+    """Number of a document's chunks in an index"""
+    client = await get_opensearch_client()
+    response = await asyncio.to_thread(
+        client.count, index=index_name, body={"query": {"term": {"document_id": doc_id}}}
+    )
+    return response["count"]
+
+async def fetch_document_page(cursor: Optional[List[Any]]) -> List[Dict[str, Any]]:
+    """Fetch the next page of documents in a stable order"""
+    client = await get_opensearch_client()
+
+    body = {
+        "size": REINDEX_PAGE_SIZE,
+        "query": {"bool": {"must_not": [{"term": {"status": "deleting"}}]}},
+        "sort": [{"created_at": "asc"}, {"id": "asc"}],
+        "_source": ["id", "content_hash", "tags"],
+    }
+    if cursor:
+        body["search_after"] = cursor
+    response = await asyncio.to_thread(client.search, index=METADATA_INDEX, body=body)
+    return response["hits"]["hits"]
+
+async def reindex_document(job: ReindexJob, source: Dict[str, Any], first_document: bool) -> int:
+    """Re-embed one document's chunks into the target index; returns the chunk count"""
+    doc_id = source["id"]
+    chunks = None
+
+    if job.chunk_size and source.get("content_hash"):
+        loop = asyncio.get_running_loop()
+        try:
+            chunks = await loop.run_in_executor(
+                get_process_pool(),
+                split_artifact,
+                source["content_hash"],
+                doc_id,
+                job.chunk_size,
+                job.overlap if job.overlap is not None else settings.CHUNK_OVERLAP,
+            )
+        except ValueError:
+            # No artifact for this document; keep its existing chunks
+            chunks = None
+
+        # Re-chunked IDs are new, so clear a partial copy left by a crash
+        if chunks is not None and first_document:
+            await delete_document_chunks(doc_id, index_name=job.target_index)
+        if chunks is not None:
+            with open(rechunked_path(job.id), "a") as f:
+                f.write(doc_id + "\n")
+
+    if chunks is None:
+        chunks = await fetch_document_chunks(job.source_index, doc_id)
+    if not chunks:
+        return 0
+
+    spec = job_embedding_spec(job)
+    embeddings = await get_embeddings([chunk.content for chunk in chunks], **spec)
+    await index_chunks(job.target_index, chunks, embeddings, spec, source.get("tags") or [])
+    return len(chunks)
+
+async def fetch_document_chunks(
+    index_name: str, doc_id: str, exclude_model: Optional[str] = None
+) -> List[TextChunk]:
+    """Read a document's chunks (without embeddings) from an index, keeping their IDs.
+
+    With ``exclude_model``, only chunks embedded with another model (or
+    written before chunks recorded it) are returned.
+    """
+    client = await get_opensearch_client()
+
+    query: Dict[str, Any] = {"term": {"document_id": doc_id}}
+    if exclude_model:
+        query = {"bool": {"filter": [query], "must_not": [{"term": {"embedding_model": exclude_model}}]}}
+
+    def collect() -> List[TextChunk]:
+        hits = scan(
+            client,
+            index=index_name,
+            query={
+                "query": query,
+                "_source": {"excludes": ["embedding"]},
+            },
+        )
+        chunks = [
+            TextChunk(
+                id=hit["_id"],
+                document_id=hit["_source"]["document_id"],
+                content=hit["_source"]["content"],
+                chunk_num=hit["_source"]["chunk_num"],
+                page_num=hit["_source"].get("page_num"),
+                metadata=hit["_source"].get("metadata") or {},
+            )
+            for hit in hits
+        ]
+        return sorted(chunks, key=lambda chunk: chunk.chunk_num)
+
+    return await asyncio.to_thread(collect)
+
+async def rollback_chunk_index() -> str:
+    """Point the chunk alias back at the previous index version"""
+    current = chunk_index_version(await get_chunk_index_target())
+    previous = [index for index in await list_chunk_indexes() if index["version"] < current]
+    if not previous:
+        raise ValueError("No previous index version to roll back to")
+
+    target = previous[-1]["index"]
+    await swap_chunk_alias(target)
+    return target
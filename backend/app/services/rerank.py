@@ -0,0 +1,105 @@
+from collections import OrderedDict
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.services.providers import get_provider
+from app.services.vector_store import on_document_change
+from app.utils.admission import ServiceOverloadedError
+from app.utils.config import get_settings
+from app.utils.metrics import record_cache, track_stage
+from app.utils.resilience import within_deadline
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# (query, chunk ID) -> (document ID, score), least recently used first
+_score_cache: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+# Cached keys per document, so a changed document drops its scores
+_keys_by_document: Dict[str, Set[Tuple[str, str]]] = {}
+
+def forget_document_scores(doc_id: str):
+    """Drop cached scores of a document's chunks"""
+    for key in _keys_by_document.pop(doc_id, ()):
+        _score_cache.pop(key, None)
+
+on_document_change(forget_document_scores)
+
+def cache_score(key: Tuple[str, str], doc_id: str, score: float):
+    _score_cache[key] = (doc_id, score)
+    _keys_by_document.setdefault(doc_id, set()).add(key)
+    while len(_score_cache) > settings.RERANK_CACHE_SIZE:
+        old_key, (old_doc_id, _) = _score_cache.popitem(last=False)
+        keys = _keys_by_document.get(old_doc_id)
+        if keys is not None:
+            keys.discard(old_key)
+            if not keys:
+                del _keys_by_document[old_doc_id]
+
+def get_rerank_backend(provider: Optional[str] = None):
+    """Backend module for a reranker; the local cross-encoder runs in the shared sidecar when one is configured"""
+    provider = provider or settings.RERANK_PROVIDER
+    if provider == "cross_encoder" and settings.EMBEDDING_SIDECAR_SOCKET:
+        return get_provider("reranker", "cross_encoder_sidecar")
+    return get_provider("reranker", provider)
+
+def candidate_count(top_n: int) -> int:
+    """kNN hits to fetch for top_n results: a wider set when reranking"""
+    return max(top_n, settings.RERANK_CANDIDATES) if settings.RERANK_ENABLED else top_n
+
+def default_top_k() -> int:
+    """Contexts a query gets when the caller does not ask for a number"""
+    return settings.RERANK_TOP_N if settings.RERANK_ENABLED else 5
+
+async def rerank_results(
+    searches: List[Tuple[str, List[Dict[str, Any]]]],
+    top_n: List[int],
+) -> List[List[Dict[str, Any]]]:
+    """Reorder each query's kNN candidates by cross-encoder score and keep its top_n.
+
+    The (query, chunk) pairs of all queries that are not cached are scored in
+    one batch. Results get a ``rerank_score`` next to their kNN ``score``.
+    If the reranker fails, candidates keep their kNN order.
+    """
+    scores: Dict[Tuple[str, str], float] = {}
+    pending: List[Tuple[Tuple[str, str], str, str]] = []
+    for query, candidates in searches:
+        for result in candidates:
+            key = (query, result["id"])
+            if key in scores:
+                continue
+            cached = _score_cache.get(key)
+            record_cache("rerank", hit=cached is not None)
+            if cached is not None:
+                _score_cache.move_to_end(key)
+                scores[key] = cached[1]
+            else:
+                scores[key] = None
+                pending.append((key, result["document_id"], result["content"]))
+
+    if pending:
+        model = settings.RERANK_MODEL
+        backend = get_rerank_backend()
+        try:
+            with track_stage("rerank", f"{settings.RERANK_PROVIDER}:{model}"):
+                new_scores = await within_deadline(
+                    backend.score([(key[0], content) for key, _, content in pending], model), "rerank"
+                )
+        except ServiceOverloadedError:
+            raise
+        except Exception:
+            logger.exception("Reranking failed, keeping vector search order")
+            return [candidates[:n] for (_, candidates), n in zip(searches, top_n)]
+        for (key, doc_id, _), score in zip(pending, new_scores.tolist()):
+            scores[key] = score
+            cache_score(key, doc_id, score)
+
+    reranked = []
+    for (query, candidates), n in zip(searches, top_n):
+        results = [{**result, "rerank_score": scores[(query, result["id"])]} for result in candidates]
+        results.sort(key=lambda result: result["rerank_score"], reverse=True)
+        reranked.append(results[:n])
+    return reranked
+
+async def warmup_reranker(provider: Optional[str] = None, model: Optional[str] = None):
+    """Load the reranker model ahead of the first query"""
+    await get_rerank_backend(provider).warmup(model or settings.RERANK_MODEL)
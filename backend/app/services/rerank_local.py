@@ -0,0 +1,49 @@
+from typing import Dict, List, Tuple
+import asyncio
+import threading
+from sentence_transformers import CrossEncoder
+import numpy as np
+
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+# Cross-encoder models, loaded on first use and keyed by model name
+local_models: Dict[str, CrossEncoder] = {}
+_load_lock = threading.Lock()
+
+# One batch at a time: PyTorch already spreads a batch over every core, and
+# concurrent batches would only contend for them
+_scoring = asyncio.Lock()
+
+def load_model(model: str) -> CrossEncoder:
+    """Get a local cross-encoder, loading it on CPU on first use (blocking)"""
+    local_model = local_models.get(model)
+    if local_model is None:
+        with _load_lock:
+            local_model = local_models.get(model)
+            if local_model is None:
+                local_model = local_models[model] = CrossEncoder(
+                    model, device="cpu", max_length=settings.RERANK_MAX_LENGTH,
+                )
+    return local_model
+
+def predict(local_model: CrossEncoder, pairs: List[Tuple[str, str]]) -> np.ndarray:
+    scores = local_model.predict(
+        pairs,
+        batch_size=settings.RERANK_BATCH_SIZE,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    return np.asarray(scores, dtype=np.float32)
+
+async def score(pairs: List[Tuple[str, str]], model: str) -> np.ndarray:
+    """Relevance score of each (query, passage) pair; higher is more relevant"""
+    local_model = local_models.get(model) or await asyncio.to_thread(load_model, model)
+    # Scoring is CPU-bound, so keep it off the event loop
+    async with _scoring:
+        return await asyncio.to_thread(predict, local_model, pairs)
+
+async def warmup(model: str):
+    """Load the model and score one pair so weights and kernels are ready"""
+    await score([("warmup", "warmup")], model)
@@ -0,0 +1,23 @@
+from typing import List, Tuple
+import asyncio
+import numpy as np
+from app.services.embedding_sidecar import SidecarError, get_pool
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+async def score(pairs: List[Tuple[str, str]], model: str) -> np.ndarray:
+    """Cross-encoder scores of (query, passage) pairs from the shared sidecar process"""
+    if not pairs:
+        return np.empty(0, dtype=np.float32)
+    try:
+        header, payload = await get_pool().request({"task": "rerank", "model": model, "pairs": pairs})
+    except (OSError, asyncio.IncompleteReadError) as e:
+        raise SidecarError(f"Embedding sidecar unavailable at {settings.EMBEDDING_SIDECAR_SOCKET}: {str(e)}") from e
+    if "error" in header:
+        raise SidecarError(f"Reranking in the sidecar failed: {header['error']}")
+    return np.frombuffer(payload, dtype=np.float32).copy()
+
+async def warmup(model: str):
+    """Make the sidecar load the cross-encoder and open a first connection"""
+    await score([("warmup", "warmup")], model)
@@ -1,23 +1,69 @@
 from typing import List, Dict, Any, Optional
 from app.services.embedding import get_embeddings
-from app.services.vector_store import vector_search
+from app.services.rerank import candidate_count, default_top_k, rerank_results
+from app.services.vector_store import vector_search, vector_search_batch, get_active_embedding_spec
+from app.utils.config import get_settings
+from app.utils.resilience import within_deadline
+
+settings = get_settings()
 
 async def retrieve_relevant_chunks(
     query: str,
     knowledge_base_ids: Optional[List[str]] = None,
-    top_k: int = 5,
+    top_k: Optional[int] = None,
 ) -> List[Dict[str, Any]]:
-    """Retrieve relevant chunks for a query using semantic search"""
+    """Retrieve relevant chunks for a query using semantic search.
+
+    With reranking enabled, a wider kNN candidate set is rescored by the
+    cross-encoder and only the best ``top_k`` (RERANK_TOP_N by default)
+    are returned.
+    """
+    top_k = top_k or default_top_k()
     
-    # Generate embedding for the query
-    query_embeddings = await get_embeddings([query])
-    query_embedding = query_embeddings[0]
+    # Generate embedding for the query with the model of the live index
+    spec = await get_active_embedding_spec()
+    query_embeddings = await within_deadline(get_embeddings([query], **spec), "embedding")
+    query_embedding = query_embeddings[0].tolist()
     
     # Search for similar chunks in vector store
     results = await vector_search(
         query_embedding=query_embedding,
-        k=top_k,
+        k=candidate_count(top_k),
         knowledge_base_ids=knowledge_base_ids
     )
     
+    if settings.RERANK_ENABLED:
+        results = (await rerank_results([(query, results)], [top_k]))[0]
+    return results
+
+async def retrieve_relevant_chunks_batch(queries: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Retrieve chunks for many queries at once.
+
+    Each query is a dict with ``query`` and optional ``knowledge_base_ids``
+    and ``top_k``. All queries are embedded in one model batch and searched
+    in a single _msearch (and reranked in one cross-encoder batch); results
+    are returned per query, in input order.
+    """
+    if not queries:
+        return []
+    
+    spec = await get_active_embedding_spec()
+    query_embeddings = await within_deadline(
+        get_embeddings([query["query"] for query in queries], **spec), "embedding"
+    )
+    
+    top_ks = [query.get("top_k") or default_top_k() for query in queries]
+    results = await vector_search_batch([
+        {
+            "embedding": embedding,
+            "k": candidate_count(top_k),
+            "knowledge_base_ids": query.get("knowledge_base_ids"),
+        }
+        for query, embedding, top_k in zip(queries, query_embeddings, top_ks)
+    ])
+    
+    if settings.RERANK_ENABLED:
+        results = await rerank_results(
+            [(query["query"], candidates) for query, candidates in zip(queries, results)], top_ks
+        )
     return results
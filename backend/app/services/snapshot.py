@@ -0,0 +1,533 @@
+import os
+import json
+import logging
+import asyncio
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+import numpy as np
+import orjson
+from opensearchpy.helpers import scan
+
+from app.models.knowledge_base import DocumentMetadata, TextChunk
+from app.services.dedup import (
+    DedupResult,
+    clear_dedup_index,
+    find_dangling_duplicates,
+    get_dedup_index,
+    minhash_signature,
+    register_chunks,
+    restore_dedup_rows,
+)
+from app.services.document_processor import promote_orphaned_duplicates
+from app.services.embedding import get_embedding_spec
+from app.services.vector_store import (
+    BULK_BATCH_SIZE,
+    CHUNK_INDEX_ALIAS,
+    METADATA_INDEX,
+    chunk_index_name,
+    clear_facet_cache,
+    create_chunk_index,
+    create_metadata_index,
+    embedding_model_key,
+    first_bulk_error,
+    get_chunk_index_target,
+    get_index_embedding_spec,
+    get_opensearch_client,
+    list_chunk_indexes,
+    swap_alias,
+    swap_chunk_alias,
+)
+from app.utils.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the snapshot layout changes incompatibly
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Hits fetched per scroll page during export
+EXPORT_PAGE_SIZE = 1000
+
+CHUNK_STRING_COLUMNS = ["id", "document_id", "content"]
+CHUNK_JSON_COLUMNS = ["metadata", "tags"]
+DOCUMENT_COLUMNS = list(DocumentMetadata.model_fields)
+SIGNATURE_COLUMNS = ["chunk_id", "document_id", "signature"]
+DUPLICATE_COLUMNS = ["chunk_id", "document_id", "canonical_chunk_id", "content"]
+
+# A snapshot is a directory:
+#
+#   manifest.json                    format version, embedding model, counts
+#   documents/<field>.bin            one JSON-encoded column per metadata field
+#   chunks/{id,document_id,content}.bin
+#   chunks/{metadata,tags}.bin       JSON-encoded columns
+#   chunks/{chunk_num,page_num}.npy  int32, -1 for missing page numbers
+#   chunks/embeddings.npy            float32 (chunks, dimension), or int8 with
+#   chunks/embedding_scales.npy      one float32 scale per row
+#   dedup/signatures/{chunk_id,document_id}.bin
+#   dedup/signatures/signature.bin   raw uint64 MinHash signatures of canonical chunks
+#   dedup/duplicates/{chunk_id,document_id,canonical_chunk_id,content}.bin
+#   dedup/duplicates/chunk_num.npy   int32, the unindexed near-duplicate chunks
+#
+# Every .bin column is the concatenated UTF-8 values with a .offsets.npy
+# array of n + 1 int64 byte offsets, so any row range is one contiguous read.
+
+class StringColumnWriter:
+    """Appends strings to a .bin column and its offsets"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(f"{path}.bin", "wb")
+        self.offsets = [0]
+
+    def append(self, value: bytes):
+        self.file.write(value)
+        self.offsets.append(self.offsets[-1] + len(value))
+
+    def close(self):
+        self.file.close()
+        np.save(f"{self.path}.offsets.npy", np.asarray(self.offsets, dtype=np.int64))
+
+class StringColumnReader:
+    """Reads row ranges of a .bin column"""
+
+    def __init__(self, path: str):
+        self.file = open(f"{path}.bin", "rb")
+        self.offsets = np.load(f"{path}.offsets.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def read(self, start: int, end: int) -> List[bytes]:
+        offsets = np.asarray(self.offsets[start:end + 1]) - self.offsets[start]
+        self.file.seek(int(self.offsets[start]))
+        data = self.file.read(int(offsets[-1]))
+        return [data[offsets[i]:offsets[i + 1]] for i in range(end - start)]
+
+    def close(self):
+        self.file.close()
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """Load and validate a snapshot's manifest"""
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        raise ValueError(f"Not a snapshot directory: {directory}")
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+    return manifest
+
+def quantize_rows(rows: np.ndarray):
+    """Symmetric int8 quantization with one scale per row"""
+    scales = np.abs(rows).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    return np.rint(rows / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+async def export_snapshot(
+    directory: str,
+    quantize: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, Any]:
+    """Write the live knowledge base (metadata and chunks behind the alias) to a snapshot directory.
+
+    Documents being deleted are left out. Embeddings are copied as stored,
+    so restoring needs no embedding model calls.
+    """
+    client = await get_opensearch_client()
+    source_index = await get_chunk_index_target()
+    spec = await get_index_embedding_spec(source_index)
+    mapping = await asyncio.to_thread(client.indices.get_mapping, index=source_index)
+    meta = next(iter(mapping.values()))["mappings"].get("_meta", {})
+
+    os.makedirs(os.path.join(directory, "documents"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "chunks"), exist_ok=True)
+
+    exported, deleting = await asyncio.to_thread(export_documents, client, directory)
+    chunk_query = {"bool": {"must_not": [{"terms": {"document_id": sorted(deleting)}}]}} if deleting else {"match_all": {}}
+    total = (await asyncio.to_thread(client.count, index=CHUNK_INDEX_ALIAS, body={"query": chunk_query}))["count"]
+    chunk_count, dimension = await asyncio.to_thread(
+        export_chunks, client, directory, chunk_query, total, meta.get("dimension"), quantize, progress,
+    )
+    # Without the duplicate links, deleting a restored canonical document would lose its duplicates' content
+    dedup = await asyncio.to_thread(export_dedup, directory, exported) if settings.DEDUP_ENABLED else None
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "source_index": source_index,
+        "embedding": {**spec, "dimension": dimension},
+        "vector_dtype": "int8" if quantize else "float32",
+        "documents": len(exported),
+        "chunks": chunk_count,
+        "dedup": dedup,
+        "document_columns": DOCUMENT_COLUMNS,
+    }
+    # Written last: a directory without a manifest is an incomplete export
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def export_documents(client, directory: str):
+    """Write document metadata columns; returns the IDs of the exported documents and of those being deleted"""
+    writers = {field: StringColumnWriter(os.path.join(directory, "documents", field)) for field in DOCUMENT_COLUMNS}
+    exported: Set[str] = set()
+    deleting: Set[str] = set()
+    try:
+        for hit in scan(client, index=METADATA_INDEX, query={"query": {"match_all": {}}}, size=EXPORT_PAGE_SIZE):
+            source = hit["_source"]
+            if source.get("status") == "deleting":
+                deleting.add(hit["_id"])
+                continue
+            for field, writer in writers.items():
+                writer.append(orjson.dumps(source.get(field)))
+            exported.add(hit["_id"])
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return exported, deleting
+
+def export_chunks(
+    client,
+    directory: str,
+    query: Dict[str, Any],
+    total: int,
+    dimension: Optional[int],
+    quantize: bool,
+    progress: Optional[Callable[[int], None]],
+):
+    """Stream chunks into the column files and a memory-mapped embedding matrix"""
+    chunk_dir = os.path.join(directory, "chunks")
+    strings = {name: StringColumnWriter(os.path.join(chunk_dir, name)) for name in CHUNK_STRING_COLUMNS + CHUNK_JSON_COLUMNS}
+    chunk_nums = np.empty(total, dtype=np.int32)
+    page_nums = np.empty(total, dtype=np.int32)
+    embeddings = scales = None
+    row = 0
+
+    def flush(page: List[Dict[str, Any]]):
+        nonlocal embeddings, scales, dimension, row
+        rows = np.asarray([hit["_source"]["embedding"] for hit in page], dtype=np.float32)
+        if embeddings is None:
+            dimension = dimension or rows.shape[1]
+            embeddings = np.lib.format.open_memmap(
+                os.path.join(chunk_dir, "embeddings.npy"), mode="w+",
+                dtype=np.int8 if quantize else np.float32, shape=(total, dimension),
+            )
+            if quantize:
+                scales = np.empty(total, dtype=np.float32)
+        end = row + len(page)
+        if quantize:
+            embeddings[row:end], scales[row:end] = quantize_rows(rows)
+        else:
+            embeddings[row:end] = rows
+        for i, hit in enumerate(page, start=row):
+            source = hit["_source"]
+            strings["id"].append(hit["_id"].encode("utf-8"))
+            strings["document_id"].append(source["document_id"].encode("utf-8"))
+            strings["content"].append(source["content"].encode("utf-8"))
+            strings["metadata"].append(orjson.dumps(source.get("metadata") or {}))
+            strings["tags"].append(orjson.dumps(source.get("tags") or []))
+            chunk_nums[i] = source.get("chunk_num") or 0
+            page_num = source.get("page_num")
+            page_nums[i] = -1 if page_num is None else page_num
+        row = end
+        if progress:
+            progress(row)
+
+    try:
+        page = []
+        for hit in scan(client, index=CHUNK_INDEX_ALIAS, query={"query": query}, size=EXPORT_PAGE_SIZE):
+            if row + len(page) >= total:
+                # The matrix is sized from the count taken before the scan
+                raise RuntimeError("Chunks were added during the export; rerun it while uploads are paused")
+            page.append(hit)
+            if len(page) == EXPORT_PAGE_SIZE:
+                flush(page)
+                page = []
+        if page:
+            flush(page)
+    finally:
+        for writer in strings.values():
+            writer.close()
+
+    # Chunks deleted during the scan leave unused rows at the end
+    np.save(os.path.join(chunk_dir, "chunk_num.npy"), chunk_nums[:row])
+    np.save(os.path.join(chunk_dir, "page_num.npy"), page_nums[:row])
+    if scales is not None:
+        np.save(os.path.join(chunk_dir, "embedding_scales.npy"), scales[:row])
+    if embeddings is not None:
+        embeddings.flush()
+    return row, dimension
+
+def export_dedup(directory: str, documents: Set[str]) -> Dict[str, int]:
+    """Write the near-duplicate index rows of the exported documents"""
+    index = get_dedup_index()
+    signature_dir = os.path.join(directory, "dedup", "signatures")
+    duplicate_dir = os.path.join(directory, "dedup", "duplicates")
+    os.makedirs(signature_dir, exist_ok=True)
+    os.makedirs(duplicate_dir, exist_ok=True)
+
+    writers = {name: StringColumnWriter(os.path.join(signature_dir, name)) for name in SIGNATURE_COLUMNS}
+    signatures = 0
+    try:
+        for chunk_id, doc_id, signature in index.iter_signatures(EXPORT_PAGE_SIZE):
+            if doc_id not in documents:
+                continue
+            writers["chunk_id"].append(chunk_id.encode("utf-8"))
+            writers["document_id"].append(doc_id.encode("utf-8"))
+            writers["signature"].append(signature)
+            signatures += 1
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    writers = {name: StringColumnWriter(os.path.join(duplicate_dir, name)) for name in DUPLICATE_COLUMNS}
+    chunk_nums = []
+    try:
+        for chunk_id, doc_id, chunk_num, canonical_id, content in index.iter_duplicates(EXPORT_PAGE_SIZE):
+            if doc_id not in documents:
+                continue
+            writers["chunk_id"].append(chunk_id.encode("utf-8"))
+            writers["document_id"].append(doc_id.encode("utf-8"))
+            writers["canonical_chunk_id"].append(canonical_id.encode("utf-8"))
+            writers["content"].append(content.encode("utf-8"))
+            chunk_nums.append(chunk_num)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    np.save(os.path.join(duplicate_dir, "chunk_num.npy"), np.asarray(chunk_nums, dtype=np.int32))
+    return {"signatures": signatures, "duplicates": len(chunk_nums)}
+
+async def import_snapshot(
+    directory: str,
+    replace: bool = False,
+    register_dedup: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, Any]:
+    """Load a snapshot into new metadata and chunk index versions and point the aliases at them.
+
+    Chunks are streamed from the memory-mapped columns into concurrent bulk
+    requests with their stored embeddings; nothing is re-embedded. Unless
+    ``replace`` is set, the live knowledge base must be empty. The live
+    aliases only move once everything is loaded, and the previous indexes
+    are kept, as after a reindex. The near-duplicate index is restored
+    from the snapshot; ``register_dedup`` rebuilds it from the chunks of
+    snapshots exported without it.
+    """
+    manifest = read_manifest(directory)
+    client = await get_opensearch_client()
+
+    alias_exists = await asyncio.to_thread(client.indices.exists_alias, name=CHUNK_INDEX_ALIAS)
+    if not replace and await asyncio.to_thread(client.indices.exists, index=METADATA_INDEX):
+        existing = (await asyncio.to_thread(client.count, index=METADATA_INDEX))["count"]
+        if existing:
+            raise ValueError(f"The knowledge base already has {existing} documents; pass replace to overwrite it")
+
+    embedding = manifest["embedding"]
+    spec = {"provider": embedding["provider"], "model": embedding["model"]}
+    if spec != get_embedding_spec():
+        logger.warning("Snapshot was embedded with %s/%s; queries will use that model", spec["provider"], spec["model"])
+
+    versions = [index["version"] for index in await list_chunk_indexes()] if alias_exists else []
+    target_index = chunk_index_name(max(versions, default=0) + 1)
+    await create_chunk_index(target_index, embedding["dimension"], spec)
+    metadata_index = await create_metadata_index()
+
+    try:
+        await import_documents(client, directory, manifest, metadata_index)
+        chunks = await import_chunks(client, directory, target_index, embedding_model_key(spec), progress)
+        await asyncio.to_thread(client.indices.refresh, index=target_index)
+    except BaseException:
+        # The live aliases were never touched; drop the partial indexes
+        await asyncio.to_thread(client.indices.delete, index=f"{target_index},{metadata_index}")
+        raise
+
+    dedup = manifest.get("dedup")
+    if replace or dedup is not None:
+        # Links to the replaced chunks would make new uploads point at chunks that are gone
+        await clear_dedup_index()
+    if dedup is not None:
+        await import_dedup(directory)
+    await swap_alias(METADATA_INDEX, metadata_index)
+    await swap_chunk_alias(target_index)
+    clear_facet_cache()
+    if dedup is not None:
+        # Duplicates of chunks that were not exported get indexed on their own
+        await promote_orphaned_duplicates(await find_dangling_duplicates())
+    elif register_dedup:
+        await register_snapshot_chunks(directory)
+    return {"index": target_index, "documents": manifest["documents"], "chunks": chunks}
+
+async def import_documents(client, directory: str, manifest: Dict[str, Any], index_name: str):
+    """Bulk-index the document metadata columns"""
+    fields = manifest["document_columns"]
+    columns = {field: StringColumnReader(os.path.join(directory, "documents", field)) for field in fields}
+    try:
+        count = manifest["documents"]
+        for start in range(0, count, BULK_BATCH_SIZE):
+            end = min(start + BULK_BATCH_SIZE, count)
+            values = {field: column.read(start, end) for field, column in columns.items()}
+            lines = []
+            for i in range(end - start):
+                source = {field: orjson.loads(values[field][i]) for field in fields}
+                lines.append(orjson.dumps({"index": {"_index": index_name, "_id": source["id"]}}))
+                lines.append(orjson.dumps(source))
+            lines.append(b"")
+            response = await asyncio.to_thread(client.bulk, body=b"\n".join(lines), refresh=end == count)
+            if response.get("errors"):
+                raise Exception(f"Failed to import documents: {first_bulk_error(response)}")
+    finally:
+        for column in columns.values():
+            column.close()
+
+async def import_chunks(
+    client,
+    directory: str,
+    index_name: str,
+    embedding_model: str,
+    progress: Optional[Callable[[int], None]],
+) -> int:
+    """Stream chunk blocks into INDEX_CONCURRENCY concurrent bulk requests"""
+    chunk_dir = os.path.join(directory, "chunks")
+    columns = {name: StringColumnReader(os.path.join(chunk_dir, name)) for name in CHUNK_STRING_COLUMNS + CHUNK_JSON_COLUMNS}
+    chunk_nums = np.load(os.path.join(chunk_dir, "chunk_num.npy"), mmap_mode="r")
+    page_nums = np.load(os.path.join(chunk_dir, "page_num.npy"), mmap_mode="r")
+    count = len(chunk_nums)
+    embeddings = np.load(os.path.join(chunk_dir, "embeddings.npy"), mmap_mode="r") if count else None
+    scales_path = os.path.join(chunk_dir, "embedding_scales.npy")
+    scales = np.load(scales_path, mmap_mode="r") if os.path.exists(scales_path) else None
+    # Column reads share file positions, so blocks are read one at a time
+    read_lock = asyncio.Lock()
+    slots = asyncio.Semaphore(settings.INDEX_CONCURRENCY)
+    done = 0
+
+    def read_block(start: int, end: int) -> Dict[str, Any]:
+        block = {name: column.read(start, end) for name, column in columns.items()}
+        rows = np.asarray(embeddings[start:end], dtype=np.float32)
+        if scales is not None:
+            rows *= np.asarray(scales[start:end])[:, None]
+        block["embedding"] = rows
+        block["chunk_num"] = np.asarray(chunk_nums[start:end]).tolist()
+        block["page_num"] = np.asarray(page_nums[start:end]).tolist()
+        return block
+
+    def build_body(block: Dict[str, Any]) -> bytes:
+        lines = []
+        for i, chunk_id in enumerate(block["id"]):
+            page_num = block["page_num"][i]
+            source = {
+                "document_id": block["document_id"][i].decode("utf-8"),
+                "content": block["content"][i].decode("utf-8"),
+                "chunk_num": block["chunk_num"][i],
+                "page_num": None if page_num < 0 else page_num,
+                "metadata": orjson.loads(block["metadata"][i]),
+                "tags": orjson.loads(block["tags"][i]),
+                "embedding": block["embedding"][i],
+                "embedding_model": embedding_model,
+            }
+            lines.append(orjson.dumps({"index": {"_index": index_name, "_id": chunk_id.decode("utf-8")}}))
+            lines.append(orjson.dumps(source, option=orjson.OPT_SERIALIZE_NUMPY))
+        lines.append(b"")
+        return b"\n".join(lines)
+
+    async def load_block(start: int, end: int):
+        nonlocal done
+        try:
+            async with read_lock:
+                block = await asyncio.to_thread(read_block, start, end)
+            body = await asyncio.to_thread(build_body, block)
+            response = await asyncio.to_thread(client.bulk, body=body)
+            if response.get("errors"):
+                raise Exception(f"Failed to import chunks: {first_bulk_error(response)}")
+            done += end - start
+            if progress:
+                progress(done)
+        finally:
+            slots.release()
+
+    tasks = []
+    try:
+        for start in range(0, count, BULK_BATCH_SIZE):
+            await slots.acquire()
+            # Stop scheduling as soon as a block has failed
+            for task in tasks:
+                if task.done() and task.exception():
+                    raise task.exception()
+            tasks.append(asyncio.create_task(load_block(start, min(start + BULK_BATCH_SIZE, count))))
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for column in columns.values():
+            column.close()
+    return count
+
+async def import_dedup(directory: str):
+    """Restore the near-duplicate index rows of a snapshot"""
+    signature_dir = os.path.join(directory, "dedup", "signatures")
+    duplicate_dir = os.path.join(directory, "dedup", "duplicates")
+
+    columns = {name: StringColumnReader(os.path.join(signature_dir, name)) for name in SIGNATURE_COLUMNS}
+    try:
+        count = len(columns["chunk_id"])
+        for start in range(0, count, BULK_BATCH_SIZE):
+            end = min(start + BULK_BATCH_SIZE, count)
+            block = {name: column.read(start, end) for name, column in columns.items()}
+            rows = [
+                (chunk_id.decode("utf-8"), doc_id.decode("utf-8"), signature)
+                for chunk_id, doc_id, signature in zip(block["chunk_id"], block["document_id"], block["signature"])
+            ]
+            await restore_dedup_rows(rows, [])
+    finally:
+        for column in columns.values():
+            column.close()
+
+    columns = {name: StringColumnReader(os.path.join(duplicate_dir, name)) for name in DUPLICATE_COLUMNS}
+    chunk_nums = np.load(os.path.join(duplicate_dir, "chunk_num.npy"))
+    try:
+        for start in range(0, len(chunk_nums), BULK_BATCH_SIZE):
+            end = min(start + BULK_BATCH_SIZE, len(chunk_nums))
+            block = {name: column.read(start, end) for name, column in columns.items()}
+            rows = [
+                (
+                    block["chunk_id"][i].decode("utf-8"),
+                    block["document_id"][i].decode("utf-8"),
+                    int(chunk_nums[start + i]),
+                    block["canonical_chunk_id"][i].decode("utf-8"),
+                    block["content"][i].decode("utf-8"),
+                )
+                for i in range(end - start)
+            ]
+            await restore_dedup_rows([], rows)
+    finally:
+        for column in columns.values():
+            column.close()
+
+async def register_snapshot_chunks(directory: str):
+    """Add a snapshot's chunks to the near-duplicate index as canonical chunks"""
+    chunk_dir = os.path.join(directory, "chunks")
+    columns = {name: StringColumnReader(os.path.join(chunk_dir, name)) for name in ["id", "document_id", "content"]}
+    chunk_nums = np.load(os.path.join(chunk_dir, "chunk_num.npy"), mmap_mode="r")
+
+    def dedup_results(start: int, end: int) -> Dict[str, DedupResult]:
+        block = {name: column.read(start, end) for name, column in columns.items()}
+        results: Dict[str, DedupResult] = {}
+        for i, chunk_id in enumerate(block["id"]):
+            chunk = TextChunk(
+                id=chunk_id.decode("utf-8"),
+                document_id=block["document_id"][i].decode("utf-8"),
+                content=block["content"][i].decode("utf-8"),
+                chunk_num=int(chunk_nums[start + i]),
+            )
+            result = results.setdefault(chunk.document_id, DedupResult())
+            result.unique_chunks.append(chunk)
+            result.signatures.append(minhash_signature(chunk.content))
+        return results
+
+    try:
+        for start in range(0, len(chunk_nums), BULK_BATCH_SIZE):
+            end = min(start + BULK_BATCH_SIZE, len(chunk_nums))
+            for doc_id, result in (await asyncio.to_thread(dedup_results, start, end)).items():
+                await register_chunks(doc_id, result)
+    finally:
+        for column in columns.values():
+            column.close()
@@ -1,12 +1,16 @@
 import requests
-from bs4 import BeautifulSoup
 from typing import List, Optional
 import uuid
 from datetime import datetime
 
 from app.models.knowledge_base import Document, DocumentMetadata, TextChunk
-from app.services.document_processor import split_text, embed_chunks
-from app.services.vector_store import store_document_chunks
+from app.services.document_processor import index_document
+from app.services.extraction import split_text
+from app.services.providers import get_provider
+from app.services.artifact_store import hash_text, load_artifact, save_artifact
+from app.utils.config import get_settings
+
+settings = get_settings()
 
 async def extract_from_url(url: str, title: Optional[str] = None, tags: List[str] = None) -> str:
     """Extract content from a URL, process it and store in knowledge base"""
@@ -19,25 +23,10 @@ async def extract_from_url(url: str, title: Optional[str] = None, tags: List[str
         raise Exception(f"Failed to fetch URL: {str(e)}")
     
     # Parse HTML content
-    soup = BeautifulSoup(response.text, 'html.parser')
+    page_title, text = get_provider("extractor", "html")(response.text)
     
     # Extract title if not provided
-    if not title and soup.title:
-        title = soup.title.string.strip()
-    elif not title:
-        title = url
-    
-    # Extract main content
-    # Remove script and style elements
-    for script in soup(["script", "style", "header", "footer", "nav"]):
-        script.extract()
-    
-    # Get text content
-    text = soup.get_text(separator='\n\n')
-    
-    # Clean up text: remove excessive newlines and spaces
-    lines = [line.strip() for line in text.split('\n')]
-    text = '\n'.join(line for line in lines if line)
+    title = title or page_title or url
     
     # Create document metadata
     metadata = DocumentMetadata(
@@ -48,17 +37,19 @@ async def extract_from_url(url: str, title: Optional[str] = None, tags: List[str
         created_at=datetime.now(),
     )
     
+    # Keep the extracted text as an artifact so the page can be re-chunked later
+    content_hash = hash_text(text)
+    if load_artifact(content_hash) is None:
+        save_artifact(content_hash, text, [0])
+    metadata.content_hash = content_hash
+    
     # Split text into chunks
-    chunks = split_text(text, metadata.id)
+    chunks = split_text(text, metadata.id, chunk_size=settings.CHUNK_SIZE, overlap=settings.CHUNK_OVERLAP)
     
     # Create document
     document = Document(metadata=metadata, chunks=chunks)
     
-    # Get embeddings for chunks
-    document = await embed_chunks(document)
-    
-    # Store in vector database
-    document.metadata.status = "processed"
-    await store_document_chunks(document)
+    # Deduplicate, embed and store
+    document = await index_document(document)
     
     return metadata.id
@@ -1,107 +1,631 @@
-from typing import List, Dict, Any
-from opensearchpy import OpenSearch, RequestsHttpConnection
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple, Callable
+from collections import OrderedDict
+import asyncio
+from opensearchpy import OpenSearch, NotFoundError, TransportError
+from opensearchpy.helpers import scan
 import json
-import boto3
-from requests_aws4auth import AWS4Auth
-from app.models.knowledge_base import Document, TextChunk
+import logging
+import time
+import numpy as np
+import orjson
+from app.models.knowledge_base import Document, DocumentMetadata, TextChunk
+from app.services.dedup import duplicates_of_documents
+from app.services.embedding import get_embeddings, get_embedding_spec
+from app.services.providers import get_provider
 from app.utils.config import get_settings
+from app.utils.metrics import track_stage, record_cache
+from app.utils.admission import ServiceOverloadedError
+from app.utils.resilience import DeadlineExceededError, get_breaker, hedged_call
+from app.utils.pagination import encode_cursor, decode_cursor
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Number of chunks sent per _bulk request
+BULK_BATCH_SIZE = 500
+
+# Chunks are read and written through this alias; physical indexes are versioned
+CHUNK_INDEX_ALIAS = "knowledge_chunks"
+# Every chunk index version, including ones not behind the alias
+CHUNK_INDEX_PATTERN = f"{CHUNK_INDEX_ALIAS}*"
+# Document metadata is read and written through this alias in the same way
+METADATA_INDEX = "document_metadata"
+
+METADATA_INDEX_BODY = {
+    "mappings": {
+        "properties": {
+            "id": {"type": "keyword"},
+            "title": {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}},
+            "filename": {"type": "keyword"},
+            "type": {"type": "keyword"},
+            "tags": {"type": "keyword"},
+            "source_url": {"type": "keyword"},
+            "created_at": {"type": "date"},
+            "updated_at": {"type": "date"},
+            "status": {"type": "keyword"},
+            "content_hash": {"type": "keyword"},
+        }
+    }
+}
+
+# How long an index's embedding model is cached, in seconds. The index behind
+# the chunk alias is looked up on every read, so a swap made by another worker
+# is seen at once.
+INDEX_SPEC_TTL = 30.0
+
+# How long document facet counts are cached, in seconds
+FACET_CACHE_TTL = 10.0
+FACET_CACHE_SIZE = 256  # Filter combinations kept, least recently used evicted first
+FACET_SIZE = 50  # Tag buckets returned per facet
+
+# Shared client so connections are pooled across requests
+_client = None
+_indexes_ready = False
+_indexes_lock = asyncio.Lock()
+# Physical index -> (looked up at, embedding spec)
+_index_spec_cache: Dict[str, Tuple[float, Dict[str, str]]] = {}
+# Filter key -> (computed at, facets), least recently used first
+_facet_cache: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+# Callbacks run with a document ID whenever that document is added, changed or deleted
+_document_hooks: List[Callable[[str], None]] = []
+
+def on_document_change(callback: Callable[[str], None]):
+    """Register a cache invalidation hook for document changes"""
+    _document_hooks.append(callback)
+
+def invalidate_document(doc_id: str):
+    """Run the invalidation hooks for a changed document"""
+    for callback in _document_hooks:
+        callback(doc_id)
 
 async def get_opensearch_client():
     """Get OpenSearch client"""
-    # For AWS OpenSearch Service
-    if settings.OPENSEARCH_SERVICE_ENABLED:
-        # Create AWS credentials for request signing
-        credentials = boto3.Session().get_credentials()
-        awsauth = AWS4Auth(
-            settings.AWS_ACCESS_KEY_ID,
-            settings.AWS_SECRET_ACCESS_KEY,
-            settings.AWS_REGION,
-            'es',
-            session_token=credentials.token if hasattr(credentials, 'token') else None
-        )
-        
-        # Connect to AWS OpenSearch Service
-        return OpenSearch(
-            hosts=[{'host': settings.OPENSEARCH_HOST, 'port': settings.OPENSEARCH_PORT}],
-            http_auth=awsauth,
-            use_ssl=True,
-            verify_certs=True,
-            connection_class=RequestsHttpConnection
-        )
-    else:
-        # Connect to local OpenSearch (for development/testing)
-        return OpenSearch(
-            hosts=[{"host": settings.OPENSEARCH_HOST, "port": settings.OPENSEARCH_PORT}],
-            use_ssl=settings.OPENSEARCH_USE_SSL,
-            verify_certs=False,  # Not for production
-            http_auth=(settings.OPENSEARCH_USERNAME, settings.OPENSEARCH_PASSWORD) if settings.OPENSEARCH_USERNAME else None,
-        )
+    global _client
+    
+    if _client is None:
+        _client = create_opensearch_client()
+    return _client
 
-async def create_index_if_not_exists(index_name: str):
-    """Create vector index if it doesn't exist"""
+def create_opensearch_client():
+    """Create a new OpenSearch client from settings"""
+    # The AWS backend pulls in boto3 and request signing, so it is only
+    # imported when OpenSearch Service is enabled
+    name = "aws_opensearch" if settings.OPENSEARCH_SERVICE_ENABLED else "opensearch"
+    return get_provider("vector_store", name)()
+
+def create_local_opensearch_client() -> OpenSearch:
+    """Connect to local OpenSearch (for development/testing)"""
+    return OpenSearch(
+        hosts=[{"host": settings.OPENSEARCH_HOST, "port": settings.OPENSEARCH_PORT}],
+        use_ssl=settings.OPENSEARCH_USE_SSL,
+        verify_certs=False,  # Not for production
+        http_auth=(settings.OPENSEARCH_USERNAME, settings.OPENSEARCH_PASSWORD) if settings.OPENSEARCH_USERNAME else None,
+    )
+
+async def create_chunk_index(index_name: str, dimension: int, embedding_spec: Dict[str, Any]):
+    """Create a physical chunk index, recording its embedding model in the mapping _meta"""
     client = await get_opensearch_client()
     
-    if not client.indices.exists(index=index_name):
-        # Create the index with appropriate mapping for vectors
-        index_body = {
-            "settings": {
-                "index": {
-                    "knn": True,
-                }
-            },
-            "mappings": {
-                "properties": {
-                    "embedding": {
-                        "type": "knn_vector",
-                        "dimension": 384  # Adjust based on your embedding model
-                    },
-                    "content": {"type": "text"},
-                    "document_id": {"type": "keyword"},
-                    "chunk_num": {"type": "integer"},
-                    "metadata": {"type": "object"},
-                }
+    # Create the index with appropriate mapping for vectors
+    index_body = {
+        "settings": {
+            "index": {
+                "knn": True,
+            }
+        },
+        "mappings": {
+            "_meta": {**embedding_spec, "dimension": dimension},
+            "properties": {
+                "embedding": {
+                    "type": "knn_vector",
+                    "dimension": dimension,
+                },
+                "content": {"type": "text"},
+                "document_id": {"type": "keyword"},
+                "embedding_model": {"type": "keyword"},
+                "chunk_num": {"type": "integer"},
+                "page_num": {"type": "integer"},
+                "metadata": {"type": "object"},
+                "tags": {"type": "keyword"},
             }
         }
+    }
+    
+    await asyncio.to_thread(client.indices.create, index=index_name, body=index_body)
+
+def chunk_index_name(version: int) -> str:
+    """Physical index name for a chunk index version"""
+    return f"{CHUNK_INDEX_ALIAS}_v{version}"
+
+def chunk_index_version(index_name: str) -> int:
+    """Version number of a physical chunk index (0 for the legacy unversioned index)"""
+    prefix = f"{CHUNK_INDEX_ALIAS}_v"
+    return int(index_name[len(prefix):]) if index_name.startswith(prefix) else 0
+
+def metadata_index_name(version: int) -> str:
+    """Physical index name for a metadata index version"""
+    return f"{METADATA_INDEX}_v{version}"
+
+async def create_metadata_index() -> str:
+    """Create the next metadata index version, not yet behind the alias; returns its name"""
+    client = await get_opensearch_client()
+    
+    prefix = f"{METADATA_INDEX}_v"
+    response = await asyncio.to_thread(client.indices.get, index=f"{prefix}*")
+    version = max((int(name[len(prefix):]) for name in response), default=0) + 1
+    index_name = metadata_index_name(version)
+    await asyncio.to_thread(client.indices.create, index=index_name, body=METADATA_INDEX_BODY)
+    return index_name
+
+async def ensure_indexes():
+    """Create the first metadata and chunk index versions behind their aliases"""
+    global _indexes_ready
+    
+    if _indexes_ready:
+        return
+    client = await get_opensearch_client()
+    
+    async with _indexes_lock:
+        if _indexes_ready:
+            return
+        
+        if await asyncio.to_thread(client.indices.exists, index=METADATA_INDEX):
+            await migrate_metadata_index()
+        else:
+            index_name = await create_metadata_index()
+            await asyncio.to_thread(client.indices.put_alias, index=index_name, name=METADATA_INDEX)
         
-        client.indices.create(index=index_name, body=index_body)
+        # A legacy concrete "knowledge_chunks" index also satisfies the check and keeps working
+        if not await asyncio.to_thread(client.indices.exists, index=CHUNK_INDEX_ALIAS):
+            spec = get_embedding_spec()
+            dimension = (await get_embeddings(["dimension probe"], **spec)).shape[1]
+            index_name = chunk_index_name(1)
+            await create_chunk_index(index_name, dimension, spec)
+            await asyncio.to_thread(client.indices.put_alias, index=index_name, name=CHUNK_INDEX_ALIAS)
+        
+        _indexes_ready = True
+
+async def migrate_metadata_index():
+    """Copy document metadata into a new index version if its mapping differs from METADATA_INDEX_BODY.
+
+    Metadata indexes created before the explicit mapping map ``id``, ``type``
+    and ``tags`` as text, which cannot be sorted or aggregated on. This runs
+    once, on first use after upgrading; writes that another process makes
+    to the old index during the copy are not carried over.
+    """
+    client = await get_opensearch_client()
+    
+    current = await get_alias_target(METADATA_INDEX)
+    response = await asyncio.to_thread(client.indices.get_mapping, index=current)
+    properties = next(iter(response.values()))["mappings"].get("properties", {})
+    expected = METADATA_INDEX_BODY["mappings"]["properties"]
+    if all(properties.get(field, {}).get("type") == spec["type"] for field, spec in expected.items()):
+        return
+    
+    index_name = await create_metadata_index()
+    
+    def copy():
+        lines = []
+        for hit in scan(client, index=current, query={"query": {"match_all": {}}}):
+            lines.append(orjson.dumps({"index": {"_index": index_name, "_id": hit["_id"]}}))
+            lines.append(orjson.dumps(hit["_source"]))
+            if len(lines) >= 2 * BULK_BATCH_SIZE:
+                flush(lines)
+                lines = []
+        flush(lines)
+    
+    def flush(lines: List[bytes]):
+        if not lines:
+            return
+        response = client.bulk(body=b"\n".join(lines + [b""]), refresh=True)
+        if response.get("errors"):
+            raise Exception(f"Failed to migrate document metadata: {first_bulk_error(response)}")
+    
+    try:
+        await asyncio.to_thread(copy)
+    except BaseException:
+        await asyncio.to_thread(client.indices.delete, index=index_name)
+        raise
+    await swap_alias(METADATA_INDEX, index_name)
+    logger.info("Migrated document metadata from %s to %s", current, index_name)
+
+async def get_alias_target(alias: str) -> str:
+    """Physical index an alias currently points to (the name itself for a legacy concrete index)"""
+    client = await get_opensearch_client()
+    
+    if await asyncio.to_thread(client.indices.exists_alias, name=alias):
+        response = await asyncio.to_thread(client.indices.get_alias, name=alias)
+        return next(iter(response))
+    return alias
+
+async def get_chunk_index_target() -> str:
+    """Physical index the chunk alias currently points to"""
+    return await get_alias_target(CHUNK_INDEX_ALIAS)
+
+async def list_chunk_indexes() -> List[Dict[str, Any]]:
+    """List physical chunk index versions with their embedding model and size"""
+    client = await get_opensearch_client()
+    
+    response = await asyncio.to_thread(client.indices.get, index=f"{CHUNK_INDEX_ALIAS}*")
+    active = await get_chunk_index_target()
+    indexes = []
+    for index_name, info in response.items():
+        count = await asyncio.to_thread(client.count, index=index_name)
+        indexes.append({
+            "index": index_name,
+            "version": chunk_index_version(index_name),
+            "active": index_name == active,
+            "embedding": info.get("mappings", {}).get("_meta", {}),
+            "chunks": count["count"],
+        })
+    return sorted(indexes, key=lambda index: index["version"])
+
+async def swap_alias(alias: str, new_index: str):
+    """Atomically point an alias at another physical index.
+
+    The previous index is kept for rollback. A legacy concrete index that
+    carries the alias name is removed in the same atomic operation.
+    """
+    client = await get_opensearch_client()
+    
+    actions = [{"add": {"index": new_index, "alias": alias}}]
+    if await asyncio.to_thread(client.indices.exists, index=alias):
+        current = await get_alias_target(alias)
+        if current == alias:
+            actions.append({"remove_index": {"index": alias}})
+        else:
+            actions.insert(0, {"remove": {"index": current, "alias": alias}})
+    
+    await asyncio.to_thread(client.indices.update_aliases, body={"actions": actions})
+
+async def swap_chunk_alias(new_index: str):
+    """Atomically point the chunk alias at another physical index"""
+    await swap_alias(CHUNK_INDEX_ALIAS, new_index)
+
+async def get_index_embedding_spec(index_name: str) -> Dict[str, str]:
+    """Embedding provider and model an index was built with"""
+    cached = _index_spec_cache.get(index_name)
+    if cached and time.monotonic() - cached[0] < INDEX_SPEC_TTL:
+        record_cache("embedding_spec", hit=True)
+        return cached[1]
+    record_cache("embedding_spec", hit=False)
+    
+    client = await get_opensearch_client()
+    response = await asyncio.to_thread(client.indices.get_mapping, index=index_name)
+    meta = next(iter(response.values()))["mappings"].get("_meta", {})
+    if "provider" in meta and "model" in meta:
+        spec = {"provider": meta["provider"], "model": meta["model"]}
+    else:
+        # Indexes created before versioning use the configured model
+        spec = get_embedding_spec()
+    _index_spec_cache[index_name] = (time.monotonic(), spec)
+    return spec
+
+async def get_active_embedding_spec() -> Dict[str, str]:
+    """Embedding provider and model of the index behind the chunk alias.
+
+    Queries and new uploads must be embedded with the same model as the live
+    index. The alias is resolved on every call, so a swap made by any worker
+    is picked up by the next query.
+    """
+    await ensure_indexes()
+    return await get_index_embedding_spec(await get_chunk_index_target())
+
+def embedding_model_key(spec: Dict[str, str]) -> str:
+    """Value of a chunk's embedding_model field"""
+    return f"{spec['provider']}/{spec['model']}"
 
 async def store_document_chunks(document: Document):
     """Store document chunks in OpenSearch"""
     client = await get_opensearch_client()
     
-    # Ensure index exists
-    await create_index_if_not_exists("knowledge_chunks")
+    # Ensure indexes exist
+    await ensure_indexes()
     
-    # Store document metadata
-    client.index(
-        index="document_metadata",
-        id=document.metadata.id,
-        body=document.metadata.model_dump(),
+    with track_stage("index"):
+        # Store document metadata
+        await asyncio.to_thread(
+            client.index,
+            index=METADATA_INDEX,
+            id=document.metadata.id,
+            body=document.metadata.model_dump(),
+        )
+        
+        # Store chunks through the alias
+        await index_chunks(
+            CHUNK_INDEX_ALIAS, document.chunks, document.embeddings, document.embedding_spec, document.metadata.tags,
+        )
+    
+    invalidate_document(document.metadata.id)
+
+async def index_chunks(
+    index_name: str,
+    chunks: List[TextChunk],
+    embeddings: np.ndarray,
+    embedding_spec: Dict[str, str],
+    tags: Optional[List[str]] = None,
+):
+    """Index chunks and their embeddings in batches through the bulk API.
+
+    ``embedding_spec`` is the model the embeddings were made with. An alias
+    is resolved first, and if it now points at an index of another model
+    (it was swapped after the chunks were embedded) they are re-embedded
+    with that model. ``tags`` are the document's tags, copied into every
+    chunk so searches can filter on them.
+    """
+    client = await get_opensearch_client()
+    
+    # Write to the resolved index, so its model is the one checked here
+    index_name = await get_alias_target(index_name)
+    index_spec = await get_index_embedding_spec(index_name)
+    if chunks and index_spec != embedding_spec:
+        embeddings = await get_embeddings([chunk.content for chunk in chunks], **index_spec)
+    embedding_model = embedding_model_key(index_spec)
+    
+    for start in range(0, len(chunks), BULK_BATCH_SIZE):
+        end = start + BULK_BATCH_SIZE
+        body = build_bulk_index_body(index_name, chunks[start:end], embeddings[start:end], embedding_model, tags)
+        response = await asyncio.to_thread(client.bulk, body=body)
+        if response.get("errors"):
+            raise Exception(f"Failed to index chunks: {first_bulk_error(response)}")
+
+def build_bulk_index_body(
+    index_name: str,
+    chunks: List[TextChunk],
+    embeddings: np.ndarray,
+    embedding_model: str,
+    tags: Optional[List[str]] = None,
+) -> bytes:
+    """Serialize chunks and their embedding rows into an NDJSON _bulk body.
+
+    This is the only place embeddings are converted to JSON; orjson writes the
+    float32 rows directly without going through Python float lists.
+    """
+    lines = []
+    for chunk, embedding in zip(chunks, embeddings):
+        source = chunk.to_source()
+        source["embedding"] = embedding
+        source["embedding_model"] = embedding_model
+        if tags is not None:
+            source["tags"] = tags
+        lines.append(orjson.dumps({"index": {"_index": index_name, "_id": chunk.id}}))
+        lines.append(orjson.dumps(source, option=orjson.OPT_SERIALIZE_NUMPY))
+    lines.append(b"")
+    return b"\n".join(lines)
+
+def first_bulk_error(response: Dict[str, Any]) -> Any:
+    """Return the first item error from a _bulk response"""
+    for item in response.get("items", []):
+        for result in item.values():
+            if "error" in result:
+                return result["error"]
+    return None
+
+async def get_document_metadata(doc_id: str) -> Optional[DocumentMetadata]:
+    """Fetch stored document metadata, or None if the document does not exist"""
+    client = await get_opensearch_client()
+    
+    try:
+        response = await asyncio.to_thread(client.get, index=METADATA_INDEX, id=doc_id)
+    except NotFoundError:
+        return None
+    return DocumentMetadata(**response["_source"])
+
+async def list_document_ids() -> List[str]:
+    """List the IDs of all stored documents, except those being deleted"""
+    client = await get_opensearch_client()
+    
+    def collect() -> List[str]:
+        query = {"query": {"bool": {"must_not": [{"term": {"status": "deleting"}}]}}, "_source": False}
+        hits = scan(client, index=METADATA_INDEX, query=query)
+        return [hit["_id"] for hit in hits]
+    
+    return await asyncio.to_thread(collect)
+
+def build_document_filter(
+    search: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    doc_type: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Query matching documents by title words and all of the given tags"""
+    must = []
+    filters = [{"term": {"tags": tag}} for tag in tags or []]
+    if doc_type:
+        filters.append({"term": {"type": doc_type}})
+    if search:
+        # Prefix-match the last word so the search works while typing
+        must.append({"match_bool_prefix": {"title": {"query": search, "operator": "and"}}})
+    # Documents being deleted are already gone as far as users are concerned
+    return {"bool": {"must": must, "filter": filters, "must_not": [{"term": {"status": "deleting"}}]}}
+
+def facet_aggregations() -> Dict[str, Any]:
+    return {
+        "tags": {"terms": {"field": "tags", "size": FACET_SIZE}},
+        "types": {"terms": {"field": "type", "size": FACET_SIZE}},
+    }
+
+def parse_facets(aggregations: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        name: [{"value": bucket["key"], "count": bucket["doc_count"]} for bucket in aggregations[name]["buckets"]]
+        for name in ("tags", "types")
+    }
+
+async def list_documents(
+    search: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    doc_type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    include_facets: bool = True,
+) -> Dict[str, Any]:
+    """List document metadata, newest first, with search_after pagination.
+
+    The cursor is the sort position of the previous page's last document, so
+    deep pages cost the same as the first one. Facet counts for the current
+    filter are returned with the first page and cached for FACET_CACHE_TTL.
+    Raises ValueError for a malformed cursor.
+    """
+    client = await get_opensearch_client()
+    await ensure_indexes()
+    
+    query = build_document_filter(search, tags, doc_type)
+    body = {
+        "size": limit,
+        "query": query,
+        "sort": [{"created_at": {"order": "desc"}}, {"id": {"order": "desc"}}],
+    }
+    if cursor:
+        body["search_after"] = decode_cursor(cursor)
+    
+    facets = None
+    facet_key = (search or "", tuple(sorted(tags or [])), doc_type or "")
+    if include_facets and not cursor:
+        cached = _facet_cache.get(facet_key)
+        if cached and time.monotonic() - cached[0] < FACET_CACHE_TTL:
+            _facet_cache.move_to_end(facet_key)
+            facets = cached[1]
+        else:
+            # Compute the facets in the same round trip as the page
+            body["aggs"] = facet_aggregations()
+        record_cache("document_facets", hit=facets is not None)
+    
+    with track_stage("document_list"):
+        response = await asyncio.to_thread(client.search, index=METADATA_INDEX, body=body)
+    
+    if "aggs" in body:
+        facets = parse_facets(response["aggregations"])
+        _facet_cache[facet_key] = (time.monotonic(), facets)
+        _facet_cache.move_to_end(facet_key)
+        while len(_facet_cache) > FACET_CACHE_SIZE:
+            _facet_cache.popitem(last=False)
+    
+    hits = response["hits"]["hits"]
+    total = response["hits"]["total"]
+    result = {
+        "items": [hit["_source"] for hit in hits],
+        # Counts past 10,000 are reported as a lower bound
+        "total": total["value"],
+        "total_relation": total["relation"],
+        "next_cursor": encode_cursor(*hits[-1]["sort"]) if len(hits) == limit else None,
+    }
+    if facets is not None:
+        result["facets"] = facets
+    return result
+
+def clear_facet_cache(doc_id: Optional[str] = None):
+    """Drop cached facet counts after documents are added, changed or deleted"""
+    _facet_cache.clear()
+
+on_document_change(clear_facet_cache)
+
+async def update_document_metadata(doc_id: str, fields: Dict[str, Any]):
+    """Partially update a document's metadata"""
+    client = await get_opensearch_client()
+    await asyncio.to_thread(
+        client.update,
+        index=METADATA_INDEX,
+        id=doc_id,
+        body={"doc": fields},
+        refresh=True,
     )
+
+async def delete_document_metadata(doc_id: str):
+    """Delete a document's metadata; a missing document is not an error"""
+    client = await get_opensearch_client()
+    try:
+        await asyncio.to_thread(client.delete, index=METADATA_INDEX, id=doc_id, refresh=True)
+    except NotFoundError:
+        pass
+
+async def list_deleting_document_ids() -> List[str]:
+    """IDs of documents whose deletion has started but not finished"""
+    client = await get_opensearch_client()
     
-    # Store chunks
-    for chunk in document.chunks:
-        client.index(
-            index="knowledge_chunks",
-            id=chunk.id,
-            body={
-                "document_id": chunk.document_id,
-                "content": chunk.content,
-                "chunk_num": chunk.chunk_num,
-                "embedding": chunk.embedding,
-                "metadata": chunk.metadata
-            }
+    def collect() -> List[str]:
+        hits = scan(client, index=METADATA_INDEX, query={"query": {"term": {"status": "deleting"}}, "_source": False})
+        return [hit["_id"] for hit in hits]
+    
+    return await asyncio.to_thread(collect)
+
+async def update_chunk_tags(doc_id: str, tags: List[str]) -> int:
+    """Copy a document's tags into its chunks in every index version; returns the chunks updated"""
+    client = await get_opensearch_client()
+    
+    def collect() -> List[Tuple[str, str]]:
+        hits = scan(
+            client,
+            index=CHUNK_INDEX_PATTERN,
+            query={"query": {"term": {"document_id": doc_id}}, "_source": False},
         )
+        return [(hit["_index"], hit["_id"]) for hit in hits]
+    
+    targets = await asyncio.to_thread(collect)
+    tags_line = orjson.dumps({"doc": {"tags": tags}})
+    for start in range(0, len(targets), BULK_BATCH_SIZE):
+        lines = []
+        for index_name, chunk_id in targets[start:start + BULK_BATCH_SIZE]:
+            lines.append(orjson.dumps({"update": {"_index": index_name, "_id": chunk_id}}))
+            lines.append(tags_line)
+        lines.append(b"")
+        response = await asyncio.to_thread(client.bulk, body=b"\n".join(lines))
+        if response.get("errors"):
+            raise Exception(f"Failed to update chunk tags: {first_bulk_error(response)}")
+    return len(targets)
 
-async def vector_search(query_embedding: List[float], k: int = 5, knowledge_base_ids: List[str] = None) -> List[Dict[str, Any]]:
-    """Search for relevant chunks using vector similarity"""
+async def get_task_status(task_id: str) -> Dict[str, Any]:
+    """Progress of a background OpenSearch task such as delete_by_query"""
+    client = await get_opensearch_client()
+    response = await asyncio.to_thread(client.tasks.get, task_id=task_id)
+    status = response.get("task", {}).get("status", {})
+    result = response.get("response") or {}
+    return {
+        "completed": response.get("completed", False),
+        "total": result.get("total", status.get("total", 0)),
+        "deleted": result.get("deleted", status.get("deleted", 0)),
+        "failures": result.get("failures", []),
+    }
+
+async def delete_document_chunks(
+    doc_id: str,
+    keep_ids: Optional[List[str]] = None,
+    index_name: str = CHUNK_INDEX_ALIAS,
+    wait_for_completion: bool = True,
+) -> Optional[str]:
+    """Delete a document's chunks, optionally keeping the given chunk IDs.
+
+    With ``wait_for_completion=False`` the deletion runs as an OpenSearch
+    task and its task ID is returned for get_task_status.
+    """
     client = await get_opensearch_client()
     
-    # Prepare search query
+    query = {"bool": {"filter": [{"term": {"document_id": doc_id}}]}}
+    if keep_ids:
+        query["bool"]["must_not"] = [{"ids": {"values": keep_ids}}]
+    
+    response = await asyncio.to_thread(
+        client.delete_by_query,
+        index=index_name,
+        body={"query": query},
+        conflicts="proceed",
+        wait_for_completion=wait_for_completion,
+    )
+    return None if wait_for_completion else response["task"]
+
+def build_knn_query(
+    query_embedding: Any,
+    k: int,
+    knowledge_base_ids: Optional[List[str]] = None,
+    canonical_chunk_ids: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """Build a kNN search body, optionally restricted to some documents.
+
+    ``canonical_chunk_ids`` are other documents' chunks that stand in for
+    the restricted documents' unindexed near-duplicate chunks.
+    """
     knn_query = {
         "size": k,
+        "_source": {"excludes": ["embedding"]},
         "query": {
             "knn": {
                 "embedding": {
@@ -114,41 +638,173 @@ async def vector_search(query_embedding: List[float], k: int = 5, knowledge_base
     
     # Add filter if knowledge base IDs are specified
     if knowledge_base_ids:
+        document_filter = {"terms": {"document_id": knowledge_base_ids}}
+        canonical_chunk_ids = list(canonical_chunk_ids)
+        if canonical_chunk_ids:
+            document_filter = {
+                "bool": {
+                    "should": [document_filter, {"ids": {"values": canonical_chunk_ids}}],
+                    "minimum_should_match": 1,
+                }
+            }
         knn_query["query"] = {
             "bool": {
                 "must": [
-                    {"terms": {"document_id": knowledge_base_ids}},
+                    document_filter,
                     knn_query["query"]
                 ]
             }
         }
+    return knn_query
+
+def attribute_duplicates(
+    hits: List[Dict[str, Any]], knowledge_base_ids: Optional[List[str]], duplicates: Dict[str, TextChunk]
+) -> List[Dict[str, Any]]:
+    """Report canonical chunks matched on behalf of a restricted document as that document's duplicate chunks"""
+    if not duplicates:
+        return hits
+    requested = set(knowledge_base_ids)
+    for hit in hits:
+        duplicate = duplicates.get(hit["_id"])
+        if duplicate is not None and hit["_source"]["document_id"] not in requested:
+            hit["_id"] = duplicate.id
+            hit["_source"] = {
+                **hit["_source"],
+                "document_id": duplicate.document_id,
+                "chunk_num": duplicate.chunk_num,
+                "content": duplicate.content,
+            }
+    return hits
+
+def is_search_failure(error: BaseException) -> bool:
+    """Whether an error means OpenSearch is unhealthy, as opposed to a bad request"""
+    if isinstance(error, TransportError):
+        # Connection errors carry "N/A" instead of an HTTP status
+        return not isinstance(error.status_code, int) or error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, DeadlineExceededError)
+
+def raise_if_search_overloaded(error: TransportError):
+    """Turn OpenSearch search queue rejections into a retryable overload error"""
+    if error.status_code == 429:
+        raise ServiceOverloadedError("Search capacity exceeded, please retry later", retry_after=1) from error
+
+async def vector_search(query_embedding: List[float], k: int = 5, knowledge_base_ids: List[str] = None) -> List[Dict[str, Any]]:
+    """Search for relevant chunks using vector similarity"""
+    client = await get_opensearch_client()
+    # Chunks of these documents that duplicate another document's were never indexed
+    duplicates = await duplicates_of_documents(knowledge_base_ids or ())
+    knn_query = build_knn_query(query_embedding, k, knowledge_base_ids, duplicates)
     
-    # Execute search
-    response = client.search(index="knowledge_chunks", body=knn_query)
+    # Execute search; kNN searches are read-only, so a slow one is hedged
+    try:
+        with track_stage("vector_search"):
+            response = await hedged_call(
+                "vector_search",
+                get_breaker("opensearch"),
+                lambda: asyncio.to_thread(client.search, index=CHUNK_INDEX_ALIAS, body=knn_query),
+                is_search_failure,
+                cap=settings.SEARCH_TIMEOUT_SECONDS,
+            )
+    except TransportError as e:
+        raise_if_search_overloaded(e)
+        raise
     
-    # Process results
-    results = []
+    hits = attribute_duplicates(response["hits"]["hits"], knowledge_base_ids, duplicates)
+    sources = await get_document_sources({hit["_source"]["document_id"] for hit in hits})
+    return format_search_hits(hits, sources)
+
+async def vector_search_batch(searches: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Run many kNN searches in one _msearch round trip.
+
+    Each search is a dict with ``embedding``, ``k`` and optional
+    ``knowledge_base_ids``. Returns one result list per search, in order.
+    A search that fails on its own raises for the whole batch.
+    """
+    if not searches:
+        return []
+    client = await get_opensearch_client()
+    duplicate_maps = await asyncio.gather(*(
+        duplicates_of_documents(search.get("knowledge_base_ids") or ()) for search in searches
+    ))
+    
+    lines = []
+    for search, duplicates in zip(searches, duplicate_maps):
+        lines.append(orjson.dumps({"index": CHUNK_INDEX_ALIAS}))
+        lines.append(orjson.dumps(
+            build_knn_query(search["embedding"], search["k"], search.get("knowledge_base_ids"), duplicates),
+            option=orjson.OPT_SERIALIZE_NUMPY,
+        ))
+    lines.append(b"")
+    
+    try:
+        with track_stage("vector_search_batch"):
+            response = await get_breaker("opensearch").call(
+                lambda: asyncio.to_thread(client.msearch, body=b"\n".join(lines)),
+                is_search_failure,
+                "vector_search_batch",
+                cap=settings.SEARCH_TIMEOUT_SECONDS,
+            )
+    except TransportError as e:
+        raise_if_search_overloaded(e)
+        raise
     
-    for hit in response["hits"]["hits"]:
-        # Get document metadata for each hit
-        try:
-            doc_metadata = client.get(index="document_metadata", id=hit["_source"]["document_id"])
-            source_title = doc_metadata["_source"]["title"]
-            source_type = doc_metadata["_source"]["type"]
-        except:
-            source_title = "Unknown document"
-            source_type = "unknown"
-            
+    hit_lists = []
+    for search, duplicates, item in zip(searches, duplicate_maps, response["responses"]):
+        if "error" in item:
+            error = item["error"]
+            if item.get("status") == 429:
+                raise ServiceOverloadedError("Search capacity exceeded, please retry later", retry_after=1)
+            raise RuntimeError(f"Batch search failed: {error}")
+        hit_lists.append(attribute_duplicates(item["hits"]["hits"], search.get("knowledge_base_ids"), duplicates))
+    
+    # One metadata lookup covers the documents of every query in the batch
+    sources = await get_document_sources({
+        hit["_source"]["document_id"] for hits in hit_lists for hit in hits
+    })
+    return [format_search_hits(hits, sources) for hits in hit_lists]
+
+async def get_document_sources(doc_ids: Set[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch title and type of many documents with a single _mget"""
+    if not doc_ids:
+        return {}
+    client = await get_opensearch_client()
+    try:
+        with track_stage("metadata_fetch"):
+            response = await get_breaker("opensearch").call(
+                lambda: asyncio.to_thread(
+                    client.mget,
+                    index=METADATA_INDEX,
+                    body={"ids": list(doc_ids)},
+                    _source_includes=["title", "type", "status"],
+                ),
+                is_search_failure,
+                "metadata_fetch",
+                cap=settings.SEARCH_TIMEOUT_SECONDS,
+            )
+    except TransportError:
+        logger.exception("Error fetching document metadata")
+        return {}
+    return {doc["_id"]: doc["_source"] for doc in response["docs"] if doc.get("found")}
+
+def format_search_hits(hits: List[Dict[str, Any]], sources: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Shape kNN hits into retrieval results with their document source"""
+    results = []
+    for hit in hits:
+        document_id = hit["_source"]["document_id"]
+        source = sources.get(document_id, {})
+        if source.get("status") == "deleting":
+            # Its chunks are still being removed
+            continue
         results.append({
+            "id": hit["_id"],
             "content": hit["_source"]["content"],
-            "document_id": hit["_source"]["document_id"],
+            "document_id": document_id,
             "chunk_num": hit["_source"]["chunk_num"],
             "score": hit["_score"],
             "source": {
-                "id": hit["_source"]["document_id"],
-                "title": source_title,
-                "type": source_type
+                "id": document_id,
+                "title": source.get("title", "Unknown document"),
+                "type": source.get("type", "unknown")
             }
         })
-    
     return results
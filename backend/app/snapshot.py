@@ -0,0 +1,90 @@
+"""Export the knowledge base to a snapshot directory, or restore one.
+
+A snapshot holds the document metadata, every chunk's text and metadata in
+columnar files, the chunk embeddings as one contiguous .npy matrix, and the
+near-duplicate index (signatures and the unindexed duplicate chunks).
+Restoring streams the columns straight into bulk requests against a new
+chunk index version, so no embedding model is called.
+
+Usage (from the backend directory):
+
+    python -m app.snapshot export /backups/kb-2024-06
+    python -m app.snapshot export /backups/kb-small --quantize int8
+    python -m app.snapshot import /backups/kb-2024-06 --index-concurrency 8
+    python -m app.snapshot import /backups/kb-2024-06 --replace --register-dedup
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Export or import a DeepTalk knowledge base snapshot")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Write the live knowledge base to a snapshot directory")
+    export.add_argument("directory", help="Snapshot directory to create")
+    export.add_argument("--quantize", choices=["int8"], help="Store embeddings quantized (4x smaller, approximate)")
+
+    restore = commands.add_parser("import", help="Load a snapshot into a new chunk index version")
+    restore.add_argument("directory", help="Snapshot directory written by export")
+    restore.add_argument("--replace", action="store_true", help="Replace the documents of a non-empty knowledge base")
+    restore.add_argument("--register-dedup", action="store_true",
+                         help="Rebuild the near-duplicate index from the chunks of a snapshot "
+                              "exported without it (slower)")
+    restore.add_argument("--index-concurrency", type=int, help="Concurrent bulk requests (INDEX_CONCURRENCY)")
+    return parser.parse_args(argv)
+
+def configure_environment(args: argparse.Namespace):
+    """Apply limits through settings; must run before importing the app"""
+    if getattr(args, "index_concurrency", None) is not None:
+        os.environ["INDEX_CONCURRENCY"] = str(args.index_concurrency)
+
+def report_progress(label: str):
+    """Progress callback printing at most one line per second"""
+    interactive = sys.stderr.isatty()
+    start = time.perf_counter()
+    last = [0.0]
+
+    def report(chunks: int):
+        now = time.perf_counter()
+        if now - last[0] < 1.0:
+            return
+        last[0] = now
+        line = f"{label}: {chunks} chunks | {chunks / (now - start):.0f} chunks/s"
+        print(f"\r{line}" if interactive else line, end="" if interactive else "\n", file=sys.stderr, flush=True)
+
+    return report
+
+async def run(args: argparse.Namespace):
+    from app.services.snapshot import export_snapshot, import_snapshot
+
+    start = time.perf_counter()
+    if args.command == "export":
+        result = await export_snapshot(args.directory, quantize=args.quantize == "int8", progress=report_progress("exported"))
+    else:
+        result = await import_snapshot(
+            args.directory,
+            replace=args.replace,
+            register_dedup=args.register_dedup,
+            progress=report_progress("imported"),
+        )
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    try:
+        result = asyncio.run(run(args))
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+    for name, value in result.items():
+        print(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+from fastapi import Request
+from starlette.requests import HTTPConnection
+from prometheus_client import Counter, Gauge
+
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+ADMISSION_ACTIVE = Gauge(
+    "deeptalk_admission_active",
+    "Requests holding an admission slot",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUED = Gauge(
+    "deeptalk_admission_queued",
+    "Requests waiting for an admission slot",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_REJECTED = Counter(
+    "deeptalk_admission_rejected_total",
+    "Requests rejected by admission control",
+    ["pool", "reason"],
+)
+
+class ServiceOverloadedError(Exception):
+    """Raised when a request is shed because we or a dependency are at capacity.
+
+    Mapped to a 429 or 503 response with a Retry-After header.
+    """
+
+    def __init__(self, message: str, status_code: int = 503, retry_after: int = 1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class AdmissionPool:
+    """Concurrency limiter with global and per-tenant limits and a bounded FIFO wait queue.
+
+    A request runs when both the pool and its tenant are below their limits.
+    Otherwise it waits in the queue until a slot frees up or its deadline
+    passes. Tenants that already fill their own queue share get 429; a full
+    global queue or an expired wait gives 503.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        tenant_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+    ):
+        self.name = name
+        self.limit = limit
+        self.tenant_limit = tenant_limit
+        self.max_queue = max_queue
+        # Each tenant may occupy at most this many queue places
+        self.tenant_max_queue = max(1, max_queue // 4)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.tenant_active: Dict[str, int] = {}
+        self.tenant_queued: Dict[str, int] = {}
+        self.waiters: Deque[Tuple[str, asyncio.Future]] = deque()
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self.avg_hold = 1.0
+
+    def can_run(self, tenant: str) -> bool:
+        return self.active < self.limit and self.tenant_active.get(tenant, 0) < self.tenant_limit
+
+    def admits_now(self, tenant: str) -> bool:
+        """Whether a new request may skip the queue.
+
+        Queued requests go first, except those held back only by their own
+        tenant's limit: they must not stall other tenants while slots are idle.
+        """
+        if not self.can_run(tenant):
+            return False
+        if not self.tenant_queued.get(tenant):
+            return True
+        return not any(self.can_run(waiting_tenant) for waiting_tenant, future in self.waiters if not future.done())
+
+    def retry_after(self) -> int:
+        """Estimated seconds until a new request could be admitted"""
+        backlog = len(self.waiters) + 1
+        return max(1, math.ceil(self.avg_hold * backlog / self.limit))
+
+    def reject(self, reason: str, status_code: int):
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        raise ServiceOverloadedError(
+            f"Server busy ({self.name} capacity: {reason}), please retry later",
+            status_code=status_code,
+            retry_after=self.retry_after(),
+        )
+
+    def grant(self, tenant: str):
+        self.active += 1
+        self.tenant_active[tenant] = self.tenant_active.get(tenant, 0) + 1
+        ADMISSION_ACTIVE.labels(self.name).inc()
+
+    def try_acquire(self, tenant: str) -> Optional[float]:
+        """Take a slot only if one is free right now, without queueing"""
+        if not self.admits_now(tenant):
+            return None
+        self.grant(tenant)
+        return time.monotonic()
+
+    async def acquire(self, tenant: str, timeout: Optional[float] = None) -> float:
+        """Wait for a slot; returns the acquisition time to pass back to release()"""
+        # Serve queued requests first so admission stays FIFO under load
+        if self.admits_now(tenant):
+            self.grant(tenant)
+            return time.monotonic()
+
+        if self.tenant_queued.get(tenant, 0) >= self.tenant_max_queue:
+            self.reject("tenant limit", 429)
+        if len(self.waiters) >= self.max_queue:
+            self.reject("queue full", 503)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (tenant, future)
+        self.waiters.append(entry)
+        self.tenant_queued[tenant] = self.tenant_queued.get(tenant, 0) + 1
+        ADMISSION_QUEUED.labels(self.name).inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout or self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                # The slot was granted just as the deadline passed; keep it
+                return time.monotonic()
+            future.cancel()
+            self.reject("queue timeout", 503)
+        except asyncio.CancelledError:
+            # Client went away; hand a slot we were given straight back
+            if future.done() and not future.cancelled():
+                self.release(tenant, time.monotonic())
+            future.cancel()
+            raise
+        finally:
+            if entry in self.waiters:
+                self.waiters.remove(entry)
+            self.tenant_queued[tenant] -= 1
+            if not self.tenant_queued[tenant]:
+                del self.tenant_queued[tenant]
+            ADMISSION_QUEUED.labels(self.name).dec()
+        return time.monotonic()
+
+    def release(self, tenant: str, acquired_at: float):
+        """Free a slot and admit the first waiters that are now allowed to run"""
+        self.active -= 1
+        self.tenant_active[tenant] -= 1
+        if not self.tenant_active[tenant]:
+            del self.tenant_active[tenant]
+        ADMISSION_ACTIVE.labels(self.name).dec()
+        self.avg_hold = 0.9 * self.avg_hold + 0.1 * (time.monotonic() - acquired_at)
+
+        for entry in list(self.waiters):
+            if self.active >= self.limit:
+                break
+            waiting_tenant, future = entry
+            if future.done():
+                self.waiters.remove(entry)
+            elif self.tenant_active.get(waiting_tenant, 0) < self.tenant_limit:
+                self.waiters.remove(entry)
+                self.grant(waiting_tenant)
+                future.set_result(None)
+
+_pools: Dict[str, AdmissionPool] = {}
+
+def get_pool(name: str) -> AdmissionPool:
+    """Get an admission pool: "interactive" for queries, "bulk" for ingestion"""
+    if name not in _pools:
+        if name == "interactive":
+            _pools[name] = AdmissionPool(
+                name,
+                settings.ADMISSION_INTERACTIVE_CONCURRENCY,
+                settings.ADMISSION_INTERACTIVE_PER_TENANT,
+                settings.ADMISSION_INTERACTIVE_QUEUE,
+                settings.ADMISSION_INTERACTIVE_QUEUE_TIMEOUT,
+            )
+        elif name == "bulk":
+            _pools[name] = AdmissionPool(
+                name,
+                settings.ADMISSION_BULK_CONCURRENCY,
+                settings.ADMISSION_BULK_PER_TENANT,
+                settings.ADMISSION_BULK_QUEUE,
+                settings.ADMISSION_BULK_QUEUE_TIMEOUT,
+            )
+        else:
+            raise ValueError(f"Unknown admission pool: {name}")
+    return _pools[name]
+
+def tenant_of(connection: HTTPConnection) -> str:
+    """Tenant key of a request or websocket: the tenant header, else the client address"""
+    tenant = connection.headers.get(settings.TENANT_HEADER)
+    if tenant:
+        return tenant
+    return connection.client.host if connection.client else "anonymous"
+
+class AdmissionSlot:
+    """A held admission slot; release() is idempotent so it can be guarded twice"""
+    __slots__ = ("pool", "tenant", "acquired_at", "released")
+
+    def __init__(self, pool: AdmissionPool, tenant: str, acquired_at: float):
+        self.pool = pool
+        self.tenant = tenant
+        self.acquired_at = acquired_at
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.pool.release(self.tenant, self.acquired_at)
+
+async def acquire_slot(pool_name: str, connection: HTTPConnection) -> AdmissionSlot:
+    """Acquire a slot in a pool for a request or websocket message"""
+    pool = get_pool(pool_name)
+    tenant = tenant_of(connection)
+    acquired_at = await pool.acquire(tenant)
+    return AdmissionSlot(pool, tenant, acquired_at)
+
+def try_acquire_slot(pool_name: str, connection: HTTPConnection) -> Optional[AdmissionSlot]:
+    """A slot for optional work (such as speculative retrieval), or None if it would have to wait"""
+    pool = get_pool(pool_name)
+    tenant = tenant_of(connection)
+    acquired_at = pool.try_acquire(tenant)
+    return None if acquired_at is None else AdmissionSlot(pool, tenant, acquired_at)
+
+def admit(pool_name: str):
+    """FastAPI dependency that holds an admission slot for the duration of the request"""
+    async def dependency(request: Request):
+        slot = await acquire_slot(pool_name, request)
+        try:
+            yield
+        finally:
+            slot.release()
+    return dependency
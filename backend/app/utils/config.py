@@ -15,6 +15,12 @@ class Settings(BaseSettings):
     # Bedrock Configuration
     BEDROCK_MODEL_ID: str = "anthropic.claude-3-sonnet-20240229-v1:0"
     BEDROCK_EMBEDDING_MODEL: str = "amazon.titan-embed-text-v1"
+    # Generation models clients may request; each gets its own circuit breaker and metric labels
+    BEDROCK_ALLOWED_MODELS: List[str] = [
+        "anthropic.claude-3-sonnet-20240229-v1:0",
+        "anthropic.claude-3-haiku-20240307-v1:0",
+        "amazon.titan-text-express-v1",
+    ]
     
     # OpenSearch Configuration
     OPENSEARCH_SERVICE_ENABLED: bool = True  # Set to True to use AWS OpenSearch Service
@@ -26,12 +32,95 @@ class Settings(BaseSettings):
     
     # Embedding Configuration
     EMBEDDING_PROVIDER: str = "local"  # "bedrock" or "local"
+    LOCAL_EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    EMBEDDING_WARMUP: bool = True  # Load the live embedding model and clients at startup instead of on the first request
+    EMBEDDING_SIDECAR_SOCKET: str = ""  # Unix socket of the shared local model process (embeddings and reranking), empty = load models in each worker
+    EMBEDDING_SIDECAR_MAX_BATCH: int = 64  # Texts the sidecar encodes together
+    EMBEDDING_SIDECAR_MAX_WAIT_MS: float = 5.0  # How long the sidecar waits to fill a batch
+    EMBEDDING_SIDECAR_CONNECTIONS: int = 8  # Sidecar connections per worker
+    
+    # Serving
+    API_HOST: str = "0.0.0.0"
+    API_PORT: int = 8000
+    API_WORKERS: int = 1  # API worker processes started by app.serve
+    BACKGROUND_JOBS_LOCK_PATH: str = "../data/background-jobs.lock"  # Held by the worker that resumes reindex jobs and deletions
+    DELETION_STATUS_PATH: str = "../data/deletions.sqlite3"  # Document deletion progress, shared by all workers
+    
+    # Reindex Configuration
+    REINDEX_MAX_CHUNKS_PER_SEC: float = 200.0  # Throughput cap for background reindex jobs
     
     # Application Settings
     UPLOAD_DIR: str = "../data/uploads"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: List[str] = ["pdf", "docx", "doc", "txt"]
     
+    # Ingestion Concurrency
+    UPLOAD_CONCURRENCY: int = 4  # Files of one upload processed at the same time
+    PROCESS_POOL_WORKERS: int = 0  # Extraction/chunking processes, 0 = CPU count
+    EMBED_CONCURRENCY: int = 2  # Concurrent embedding batches
+    INDEX_CONCURRENCY: int = 4  # Concurrent bulk indexing requests
+    REPROCESS_CONCURRENCY: int = 8  # Documents re-chunked/re-embedded at the same time
+    
+    # Chunking Configuration
+    CHUNK_SIZE: int = 1000
+    CHUNK_OVERLAP: int = 200
+    
+    # Retrieval
+    RETRIEVE_BATCH_MAX_QUERIES: int = 256  # Queries accepted by one batch retrieval request
+    RETRIEVE_MAX_TOP_K: int = 50  # Results one query of a batch retrieval may ask for
+    RERANK_ENABLED: bool = False  # Rescore a wider kNN candidate set with a cross-encoder
+    RERANK_PROVIDER: str = "cross_encoder"
+    RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES: int = 20  # kNN hits scored by the reranker
+    RERANK_TOP_N: int = 3  # Contexts kept for the prompt when the caller does not ask for a number
+    RERANK_BATCH_SIZE: int = 32  # Pairs scored per model forward pass
+    RERANK_MAX_LENGTH: int = 256  # Tokens of query plus chunk the cross-encoder reads
+    RERANK_CACHE_SIZE: int = 20000  # Cached (query, chunk) scores
+    
+    # Near-duplicate Detection
+    DEDUP_ENABLED: bool = True
+    DEDUP_THRESHOLD: float = 0.9  # Estimated Jaccard similarity above which chunks are duplicates
+    DEDUP_INDEX_PATH: str = "../data/dedup.sqlite3"
+    
+    # Conversation Storage
+    CONVERSATION_DB_PATH: str = "../data/conversations.sqlite3"
+    CONVERSATION_WRITE_BATCH_SIZE: int = 100  # Messages written per transaction
+    CONVERSATION_WRITE_INTERVAL: float = 0.2  # Seconds a queued message may wait for a batch
+    HISTORY_TOKEN_BUDGET: int = 2000  # Prompt tokens for conversation history, summary included
+    HISTORY_SUMMARY_MODEL_ID: str = "anthropic.claude-3-haiku-20240307-v1:0"
+    HISTORY_SUMMARY_MAX_TOKENS: int = 400
+    
+    # Deadlines and Failure Handling
+    REQUEST_DEADLINE_SECONDS: float = 30.0  # Retrieval plus generation (first token when streaming) of one query
+    SEARCH_TIMEOUT_SECONDS: float = 5.0  # Longest a single OpenSearch search may take within the deadline
+    BEDROCK_TIMEOUT_SECONDS: float = 25.0  # Longest a generation (its first token when streaming) may take within the deadline
+    STREAM_IDLE_TIMEOUT_SECONDS: float = 30.0  # Longest gap between streamed tokens
+    HEDGE_ENABLED: bool = True  # Send a second kNN search when the first is slower than the recent p95
+    HEDGE_MIN_DELAY_MS: float = 10.0  # Never hedge sooner than this
+    HEDGE_BUDGET_FRACTION: float = 0.05  # Hedges allowed per call, so a slowdown cannot double the load
+    CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures that open a dependency's circuit
+    CIRCUIT_RESET_SECONDS: float = 10.0  # How long an open circuit fails fast before probing again
+    
+    # Streaming
+    STREAM_BUFFER_SIZE: int = 64  # Tokens buffered between Bedrock and a slow client
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+    
+    # Speculative retrieval while the user types (websocket "prefetch" messages)
+    PREFETCH_ENABLED: bool = True
+    PREFETCH_DEBOUNCE_MS: float = 300.0  # Quiet time after the last draft before retrieval starts
+    PREFETCH_TTL_SECONDS: float = 60.0  # How long prefetched contexts stay usable
+    
+    # Admission Control
+    TENANT_HEADER: str = "X-Tenant-ID"
+    ADMISSION_INTERACTIVE_CONCURRENCY: int = 32  # Queries running at once
+    ADMISSION_INTERACTIVE_PER_TENANT: int = 8
+    ADMISSION_INTERACTIVE_QUEUE: int = 64  # Queries waiting for a slot
+    ADMISSION_INTERACTIVE_QUEUE_TIMEOUT: float = 5.0  # Seconds a query may wait
+    ADMISSION_BULK_CONCURRENCY: int = 4  # Uploads/imports running at once
+    ADMISSION_BULK_PER_TENANT: int = 2
+    ADMISSION_BULK_QUEUE: int = 16
+    ADMISSION_BULK_QUEUE_TIMEOUT: float = 30.0
+    
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,93 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+from prometheus_client import Counter, Gauge, Histogram
+
+# Latency buckets from 5ms up to two minutes, covering kNN searches and long generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_LATENCY = Histogram(
+    "deeptalk_stage_duration_seconds",
+    "Time spent in each processing stage",
+    ["stage", "model", "endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_IN_FLIGHT = Gauge(
+    "deeptalk_stage_in_flight",
+    "Stage executions currently in progress",
+    ["stage"],
+    multiprocess_mode="livesum",
+)
+STAGE_ERRORS = Counter(
+    "deeptalk_stage_errors_total",
+    "Stage executions that raised an exception",
+    ["stage", "model", "endpoint"],
+)
+REQUEST_LATENCY = Histogram(
+    "deeptalk_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "deeptalk_requests_in_flight",
+    "HTTP requests currently being handled",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+CACHE_REQUESTS = Counter(
+    "deeptalk_cache_requests_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"],
+)
+BEDROCK_TOKENS = Counter(
+    "deeptalk_bedrock_tokens_total",
+    "Bedrock tokens consumed",
+    ["model", "direction"],
+)
+
+# Endpoint label for the current request; background work is labelled as such
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="background")
+
+# Stage timings of the current request, rendered into the Server-Timing header
+request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+def record_stage(stage: str, seconds: float, model: str = ""):
+    """Record a stage duration measured by the caller"""
+    STAGE_LATENCY.labels(stage, model, current_endpoint.get()).observe(seconds)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+@contextmanager
+def track_stage(stage: str, model: str = ""):
+    """Time a block as a processing stage, counting errors and in-flight executions"""
+    in_flight = STAGE_IN_FLIGHT.labels(stage)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage, model, current_endpoint.get()).inc()
+        raise
+    finally:
+        in_flight.dec()
+        record_stage(stage, time.perf_counter() - start, model)
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+def record_tokens(model: str, input_tokens: int = 0, output_tokens: int = 0):
+    """Count Bedrock token usage"""
+    if input_tokens:
+        BEDROCK_TOKENS.labels(model, "input").inc(input_tokens)
+    if output_tokens:
+        BEDROCK_TOKENS.labels(model, "output").inc(output_tokens)
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """Render stage timings as a Server-Timing header value (durations in ms)"""
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,17 @@
+import json
+import base64
+from typing import Any, List
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort values of the last item of a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a cursor from encode_cursor; raises ValueError if it is malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
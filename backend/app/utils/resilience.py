@@ -0,0 +1,307 @@
+import time
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+from prometheus_client import Counter, Gauge
+
+from app.utils.admission import ServiceOverloadedError
+from app.utils.config import get_settings
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+CIRCUIT_STATE = Gauge(
+    "deeptalk_circuit_state",
+    "Circuit breaker state per dependency: 0 closed, 1 half-open, 2 open",
+    ["dependency"],
+    multiprocess_mode="livemax",
+)
+CIRCUIT_REJECTED = Counter(
+    "deeptalk_circuit_rejected_total",
+    "Calls failed fast because a circuit breaker was open",
+    ["dependency"],
+)
+DEADLINE_EXCEEDED = Counter(
+    "deeptalk_deadline_exceeded_total",
+    "Calls abandoned because the request deadline passed",
+    ["stage"],
+)
+HEDGED_CALLS = Counter(
+    "deeptalk_hedged_calls_total",
+    "Hedged calls by the attempt that answered first",
+    ["operation", "winner"],
+)
+
+# Absolute time.monotonic() by which the current request must be answered
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+class DeadlineExceededError(ServiceOverloadedError):
+    """Raised when the request deadline passes while waiting on a dependency"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded during {stage}", status_code=504, retry_after=1)
+
+class CircuitOpenError(ServiceOverloadedError):
+    """Raised instead of calling a dependency whose circuit breaker is open"""
+
+def set_deadline(seconds: float):
+    """Give the current request (or websocket message) a deadline this many seconds from now"""
+    current_deadline.set(time.monotonic() + seconds)
+
+def clear_deadline():
+    """Detach background work started by a request from that request's deadline"""
+    current_deadline.set(None)
+
+def time_remaining(cap: Optional[float] = None) -> Optional[float]:
+    """Seconds left before the deadline, limited to cap; None when neither is set"""
+    deadline = current_deadline.get()
+    remaining = None if deadline is None else deadline - time.monotonic()
+    if cap is not None and (remaining is None or cap < remaining):
+        return cap
+    return remaining
+
+async def within_timeout(awaitable: Awaitable[T], stage: str, seconds: float) -> T:
+    """Await a call, raising DeadlineExceededError if it takes longer than seconds"""
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError:
+        DEADLINE_EXCEEDED.labels(stage).inc()
+        raise DeadlineExceededError(stage) from None
+
+async def within_deadline(awaitable: Awaitable[T], stage: str, cap: Optional[float] = None) -> T:
+    """Await a call, giving up when the deadline (or the cap) passes"""
+    timeout = time_remaining(cap)
+    if timeout is None:
+        return await awaitable
+    if timeout <= 0:
+        # Do not start work nobody will wait for
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        else:
+            asyncio.ensure_future(awaitable).cancel()
+        DEADLINE_EXCEEDED.labels(stage).inc()
+        raise DeadlineExceededError(stage)
+    return await within_timeout(awaitable, stage, timeout)
+
+class CircuitBreaker:
+    """Fails calls to a dependency fast after repeated failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    raise CircuitOpenError without reaching the dependency. Once
+    reset_timeout has passed, one probe call is let through (half-open): its
+    success closes the circuit, its failure opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.state = self.CLOSED
+        CIRCUIT_STATE.labels(name).set(self.state)
+
+    def set_state(self, state: int):
+        self.state = state
+        CIRCUIT_STATE.labels(self.name).set(state)
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; claims the probe when half-open"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go out now"""
+        if not self.allow():
+            CIRCUIT_REJECTED.labels(self.name).inc()
+            retry_after = max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at)) + 1)
+            raise CircuitOpenError(
+                f"{self.name} is unavailable, please retry later",
+                status_code=503,
+                retry_after=retry_after,
+            )
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        if self.state != self.CLOSED:
+            self.set_state(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.set_state(self.OPEN)
+
+    def release_probe(self):
+        """Give back a probe whose outcome says nothing about the dependency"""
+        self.probing = False
+
+    async def call(
+        self,
+        function: Callable[[], Awaitable[T]],
+        is_failure: Callable[[BaseException], bool],
+        stage: str,
+        cap: Optional[float] = None,
+    ) -> T:
+        """Run one call through the breaker, within the request deadline.
+
+        A call that runs out of time counts as a failure of the dependency,
+        except a call with a cap that the request deadline cut short before
+        its cap: earlier stages may have used that time up. A call that had
+        no time left to begin with never reaches the dependency.
+        """
+        remaining = time_remaining(cap)
+        if remaining is not None and remaining <= 0:
+            DEADLINE_EXCEEDED.labels(stage).inc()
+            raise DeadlineExceededError(stage)
+        # Whether a timeout would be this call's own, not the request's
+        own_timeout = cap is None or remaining == cap
+        self.check()
+        try:
+            result = await within_deadline(function(), stage, cap)
+        except asyncio.CancelledError:
+            self.release_probe()
+            raise
+        except Exception as e:
+            if is_failure(e) and (own_timeout or not isinstance(e, DeadlineExceededError)):
+                self.record_failure()
+            else:
+                self.release_probe()
+            raise
+        self.record_success()
+        return result
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Shared circuit breaker of a dependency, e.g. "opensearch" or "bedrock:<model id>" """
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name, settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_SECONDS)
+    return _breakers[name]
+
+class LatencyTracker:
+    """Recent latencies of an operation, for percentile-based hedge delays"""
+
+    def __init__(self, size: int = 500, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+_trackers: Dict[str, LatencyTracker] = {}
+
+def get_latency_tracker(operation: str) -> LatencyTracker:
+    if operation not in _trackers:
+        _trackers[operation] = LatencyTracker()
+    return _trackers[operation]
+
+class HedgeBudget:
+    """Limits hedges to a fraction of calls.
+
+    Every call earns ``fraction`` of a hedge, banked up to ``burst``; a
+    hedge spends one. When the dependency slows down as a whole, hedging
+    stops once the budget is used up instead of doubling its load.
+    """
+
+    def __init__(self, fraction: float, burst: float = 10.0):
+        self.fraction = fraction
+        self.burst = burst
+        self.tokens = 0.0
+
+    def record_call(self):
+        self.tokens = min(self.burst, self.tokens + self.fraction)
+
+    def try_spend(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+_hedge_budgets: Dict[str, HedgeBudget] = {}
+
+def get_hedge_budget(operation: str) -> HedgeBudget:
+    if operation not in _hedge_budgets:
+        _hedge_budgets[operation] = HedgeBudget(settings.HEDGE_BUDGET_FRACTION)
+    return _hedge_budgets[operation]
+
+def hedge_delay(operation: str) -> Optional[float]:
+    """Seconds to wait before hedging an operation: its recent p95, or None while unknown"""
+    if not settings.HEDGE_ENABLED:
+        return None
+    p95 = get_latency_tracker(operation).percentile(0.95)
+    if p95 is None:
+        return None
+    return max(p95, settings.HEDGE_MIN_DELAY_MS / 1000)
+
+async def hedged_call(
+    operation: str,
+    breaker: CircuitBreaker,
+    function: Callable[[], Awaitable[T]],
+    is_failure: Callable[[BaseException], bool],
+    cap: Optional[float] = None,
+) -> T:
+    """Run an idempotent call, sending a second copy if the first is slower than usual.
+
+    The hedge goes out once the first attempt has taken longer than the
+    operation's recent p95 latency, so about one call in twenty is sent
+    twice, and never more often than HEDGE_BUDGET_FRACTION allows. Whichever
+    attempt answers first wins and the other is abandoned. Only use this
+    for calls that are safe to repeat.
+    """
+    tracker = get_latency_tracker(operation)
+    budget = get_hedge_budget(operation)
+    budget.record_call()
+
+    async def attempt() -> Any:
+        start = time.perf_counter()
+        result = await breaker.call(function, is_failure, operation, cap)
+        tracker.record(time.perf_counter() - start)
+        return result
+
+    delay = hedge_delay(operation)
+    primary = asyncio.ensure_future(attempt())
+    if delay is None:
+        return await primary
+
+    attempts = {primary}
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        # Never hedge while the breaker is probing or open
+        if not done and breaker.state == breaker.CLOSED and budget.try_spend():
+            attempts.add(asyncio.ensure_future(attempt()))
+
+        error: Optional[BaseException] = None
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if len(attempts) > 1:
+                        HEDGED_CALLS.labels(operation, "primary" if task is primary else "hedge").inc()
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
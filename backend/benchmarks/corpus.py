@@ -0,0 +1,130 @@
+"""Synthetic PDF, DOCX and HTML documents for ingestion benchmarks."""
+import os
+import random
+import zipfile
+from typing import List
+from xml.sax.saxutils import escape
+
+WORDS = (
+    "retrieval embedding index vector query latency throughput document chunk model "
+    "context answer search cluster shard replica cache token prompt stream batch "
+    "knowledge source metadata filter score rank semantic similarity neighbour"
+).split()
+
+# Paragraph repeated in every document, standing in for legal footers and boilerplate
+BOILERPLATE = (
+    "This document is provided for internal use only. All rights reserved. "
+    "Redistribution or reproduction in whole or in part is prohibited without "
+    "prior written consent. The information contained herein is subject to change."
+)
+
+def paragraph(rng: random.Random, words: int = 80) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def page_text(rng: random.Random, paragraphs: int = 6) -> List[str]:
+    return [paragraph(rng) for _ in range(paragraphs)] + [BOILERPLATE]
+
+def write_pdf(path: str, pages: int, seed: int):
+    """Write a minimal multi-page PDF with plain Helvetica text lines"""
+    rng = random.Random(seed)
+    objects = []
+
+    def add(content: bytes) -> int:
+        objects.append(content)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")  # Filled in once the page objects exist
+    page_ids = []
+    for _ in range(pages):
+        lines = []
+        for text in page_text(rng):
+            # Wrap long paragraphs so every line fits on the page
+            words = text.split()
+            for start in range(0, len(words), 12):
+                lines.append(" ".join(words[start:start + 12]))
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 780 Td"]
+        for line in lines[:60]:
+            ops.append("(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") '")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font_id, content_id)
+        ))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, content in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + content + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog_id, xref_offset
+    )
+    with open(path, "wb") as f:
+        f.write(output)
+
+def write_docx(path: str, pages: int, seed: int):
+    """Write a minimal DOCX containing ``pages`` pages worth of paragraphs"""
+    rng = random.Random(seed)
+    body = "".join(
+        f"<w:p><w:r><w:t>{escape(text)}</w:t></w:r></w:p>"
+        for _ in range(pages)
+        for text in page_text(rng)
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        "</Types>"
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/></Relationships>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", content_types)
+        archive.writestr("_rels/.rels", rels)
+        archive.writestr("word/document.xml", document)
+
+def html_page(pages: int, seed: int) -> str:
+    """Build an HTML page with ``pages`` pages worth of paragraphs"""
+    rng = random.Random(seed)
+    paragraphs = "".join(f"<p>{escape(text)}</p>" for _ in range(pages) for text in page_text(rng))
+    return (
+        f"<html><head><title>Benchmark page {seed}</title><script>var x = 1;</script></head>"
+        f"<body><nav>Home | About</nav><article>{paragraphs}</article><footer>{BOILERPLATE}</footer></body></html>"
+    )
+
+def build_corpus(directory: str, documents: int, pages: int) -> dict:
+    """Generate ``documents`` PDF and DOCX files of ``pages`` pages each"""
+    os.makedirs(directory, exist_ok=True)
+    corpus = {"pdf": [], "docx": []}
+    for i in range(documents):
+        pdf_path = os.path.join(directory, f"doc_{i}.pdf")
+        write_pdf(pdf_path, pages, seed=i)
+        corpus["pdf"].append(pdf_path)
+
+        docx_path = os.path.join(directory, f"doc_{i}.docx")
+        write_docx(docx_path, pages, seed=10_000 + i)
+        corpus["docx"].append(docx_path)
+    return corpus
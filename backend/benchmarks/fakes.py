@@ -0,0 +1,533 @@
+"""Local stand-ins for AWS Bedrock and OpenSearch used by the benchmarks.
+
+Both fakes implement only the calls the application makes, with the same
+request and response shapes, so the real service code runs unchanged.
+"""
+import io
+import json
+import time
+import random
+import zlib
+import itertools
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class FakeBedrockRuntime:
+    """Bedrock runtime with configurable latency and token streaming.
+
+    Embedding models return deterministic pseudo-random vectors derived from
+    the input text; text models return a canned answer of ``output_tokens``
+    words, streamed one token per event.
+    """
+
+    def __init__(
+        self,
+        generation_latency: float = 0.5,
+        first_token_latency: float = 0.3,
+        token_interval: float = 0.01,
+        embedding_latency: float = 0.0,
+        output_tokens: int = 150,
+        dimension: int = 384,
+    ):
+        self.generation_latency = generation_latency
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.embedding_latency = embedding_latency
+        self.output_tokens = output_tokens
+        self.dimension = dimension
+
+    def embed(self, text: str) -> List[float]:
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        vector = rng.standard_normal(self.dimension).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def invoke_model(self, modelId: str, body: str, **kwargs) -> Dict[str, Any]:
+        request = json.loads(body)
+        if "embed" in modelId:
+            time.sleep(self.embedding_latency)
+            if "texts" in request:
+                payload = {"embeddings": [self.embed(text) for text in request["texts"]]}
+            else:
+                payload = {"embedding": self.embed(request["inputText"]), "inputTextTokenCount": 0}
+        else:
+            time.sleep(self.generation_latency)
+            payload = {
+                "content": [{"type": "text", "text": self.answer()}],
+                "usage": {"input_tokens": self.count_input_tokens(request), "output_tokens": self.output_tokens},
+            }
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+    def invoke_model_with_response_stream(self, modelId: str, body: str, **kwargs) -> Dict[str, Any]:
+        request = json.loads(body)
+        return {"body": self.stream_events(self.count_input_tokens(request))}
+
+    def stream_events(self, input_tokens: int):
+        def event(payload: Dict[str, Any]) -> Dict[str, Any]:
+            return {"chunk": {"bytes": json.dumps(payload).encode("utf-8")}}
+
+        time.sleep(self.first_token_latency)
+        yield event({"type": "message_start", "message": {"usage": {"input_tokens": input_tokens}}})
+        for i in range(self.output_tokens):
+            if i:
+                time.sleep(self.token_interval)
+            yield event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "token "}})
+        yield event({"type": "message_delta", "usage": {"output_tokens": self.output_tokens}})
+        yield event({"type": "message_stop"})
+
+    def answer(self) -> str:
+        return " ".join(["token"] * self.output_tokens)
+
+    @staticmethod
+    def count_input_tokens(request: Dict[str, Any]) -> int:
+        # Rough estimate, four characters per token
+        return len(json.dumps(request)) // 4
+
+
+class FakeIndices:
+    """The ``client.indices`` namespace of the in-memory OpenSearch"""
+
+    def __init__(self, store: "InMemoryOpenSearch"):
+        self.store = store
+
+    def exists(self, index: str, **kwargs) -> bool:
+        return bool(self.store.resolve(index, missing_ok=True))
+
+    def create(self, index: str, body: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        self.store.indexes[index] = FakeIndex(index, (body or {}).get("mappings", {}))
+        return {"acknowledged": True, "index": index}
+
+    def delete(self, index: str, **kwargs) -> Dict[str, Any]:
+        for name in self.store.resolve(index):
+            del self.store.indexes[name]
+            for targets in self.store.aliases.values():
+                targets.discard(name)
+        return {"acknowledged": True}
+
+    def exists_alias(self, name: str, **kwargs) -> bool:
+        return bool(self.store.aliases.get(name))
+
+    def get_alias(self, name: str, **kwargs) -> Dict[str, Any]:
+        return {index: {"aliases": {name: {}}} for index in sorted(self.store.aliases.get(name, ()))}
+
+    def put_alias(self, index: str, name: str, **kwargs) -> Dict[str, Any]:
+        self.store.aliases.setdefault(name, set()).add(index)
+        return {"acknowledged": True}
+
+    def update_aliases(self, body: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        for action in body["actions"]:
+            (kind, spec), = action.items()
+            if kind == "add":
+                self.store.aliases.setdefault(spec["alias"], set()).add(spec["index"])
+            elif kind == "remove":
+                self.store.aliases.get(spec["alias"], set()).discard(spec["index"])
+            elif kind == "remove_index":
+                self.store.indexes.pop(spec["index"], None)
+        return {"acknowledged": True}
+
+    def get(self, index: str, **kwargs) -> Dict[str, Any]:
+        return {name: {"mappings": self.store.indexes[name].mappings} for name in self.store.resolve(index)}
+
+    def get_mapping(self, index: str, **kwargs) -> Dict[str, Any]:
+        return self.get(index)
+
+    def refresh(self, index: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        return {"_shards": {"failed": 0}}
+
+
+class FakeTasks:
+    """The ``client.tasks`` namespace; background tasks finish immediately"""
+
+    def __init__(self):
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, task_id: str, **kwargs) -> Dict[str, Any]:
+        return {"completed": True, "task": {"status": {}}, "response": self.results[task_id]}
+
+class FakeIndex:
+    """Documents and a lazily built embedding matrix for one index"""
+
+    def __init__(self, name: str, mappings: Dict[str, Any]):
+        self.name = name
+        self.mappings = mappings
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self._matrix = None
+        self._matrix_ids: List[str] = []
+
+    def put(self, doc_id: str, source: Dict[str, Any]):
+        self.docs[doc_id] = source
+        self._matrix = None
+
+    def remove(self, doc_id: str) -> bool:
+        self._matrix = None
+        return self.docs.pop(doc_id, None) is not None
+
+    def matrix(self):
+        if self._matrix is None:
+            self._matrix_ids = [doc_id for doc_id, source in self.docs.items() if source.get("embedding") is not None]
+            vectors = [self.docs[doc_id]["embedding"] for doc_id in self._matrix_ids]
+            self._matrix = np.asarray(vectors, dtype=np.float32) if vectors else np.empty((0, 0), dtype=np.float32)
+        return self._matrix, self._matrix_ids
+
+
+class InMemoryOpenSearch:
+    """In-memory subset of the opensearch-py client with brute-force kNN.
+
+    Scores follow the k-NN plugin's l2 space: ``1 / (1 + squared distance)``.
+    """
+
+    def __init__(self, search_latency: float = 0.0, tail_latency: float = 0.0, tail_fraction: float = 0.0):
+        self.search_latency = search_latency
+        # A share of searches that hit a slow replica
+        self.tail_latency = tail_latency
+        self.tail_fraction = tail_fraction
+        self._tail_random = random.Random(0)
+        self.indexes: Dict[str, FakeIndex] = {}
+        self.aliases: Dict[str, set] = {}
+        self.indices = FakeIndices(self)
+        self._scroll_ids = itertools.count()
+        self._task_ids = itertools.count()
+        self.tasks = FakeTasks()
+
+    # Index resolution
+
+    def resolve(self, index: str, missing_ok: bool = False) -> List[str]:
+        names = []
+        for part in index.split(","):
+            if part.endswith("*"):
+                names.extend(name for name in self.indexes if name.startswith(part[:-1]))
+            elif part in self.aliases and self.aliases[part]:
+                names.extend(sorted(self.aliases[part]))
+            elif part in self.indexes:
+                names.append(part)
+            elif not missing_ok:
+                from opensearchpy import NotFoundError
+                raise NotFoundError(404, "index_not_found_exception", {"index": part})
+        return names
+
+    def write_index(self, index: str) -> FakeIndex:
+        names = self.resolve(index, missing_ok=True)
+        if not names:
+            self.indices.create(index)
+            names = [index]
+        return self.indexes[names[0]]
+
+    # Document APIs
+
+    def index(self, index: str, body: Dict[str, Any], id: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        target = self.write_index(index)
+        target.put(id, json.loads(json.dumps(body, default=str)))
+        return {"_index": target.name, "_id": id, "result": "created"}
+
+    def get(self, index: str, id: str, **kwargs) -> Dict[str, Any]:
+        for name in self.resolve(index):
+            source = self.indexes[name].docs.get(id)
+            if source is not None:
+                return {"_index": name, "_id": id, "found": True, "_source": source}
+        from opensearchpy import NotFoundError
+        raise NotFoundError(404, "not_found", {"_id": id})
+
+    def mget(self, body: Dict[str, Any], index: str, _source_includes: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        docs = []
+        for doc_id in body["ids"]:
+            try:
+                hit = self.get(index=index, id=doc_id)
+            except Exception:
+                docs.append({"_index": index, "_id": doc_id, "found": False})
+                continue
+            docs.append(project_source(hit, _source_includes))
+        return {"docs": docs}
+
+    def bulk(self, body: Any, index: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        if isinstance(body, (bytes, bytearray)):
+            body = body.decode("utf-8")
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()] if isinstance(body, str) else body
+        items = []
+        position = 0
+        while position < len(lines):
+            (action, meta), = lines[position].items()
+            target = self.write_index(meta.get("_index") or index)
+            doc_id = meta.get("_id")
+            if action == "delete":
+                target.remove(doc_id)
+                position += 1
+            elif action == "update":
+                target.docs.setdefault(doc_id, {}).update(lines[position + 1].get("doc", {}))
+                position += 2
+            else:
+                target.put(doc_id, lines[position + 1])
+                position += 2
+            items.append({action: {"_index": target.name, "_id": doc_id, "status": 200}})
+        return {"errors": False, "items": items}
+
+    def count(self, index: str, body: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        query = (body or {}).get("query")
+        return {"count": sum(1 for _ in self.iter_matches(index, query))}
+
+    def update(self, index: str, id: str, body: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        for name in self.resolve(index):
+            source = self.indexes[name].docs.get(id)
+            if source is not None:
+                source.update(json.loads(json.dumps(body.get("doc", {}), default=str)))
+                return {"_index": name, "_id": id, "result": "updated"}
+        from opensearchpy import NotFoundError
+        raise NotFoundError(404, "document_missing_exception", {"_id": id})
+
+    def delete(self, index: str, id: str, **kwargs) -> Dict[str, Any]:
+        for name in self.resolve(index):
+            if self.indexes[name].remove(id):
+                return {"_index": name, "_id": id, "result": "deleted"}
+        from opensearchpy import NotFoundError
+        raise NotFoundError(404, "not_found", {"_id": id})
+
+    def delete_by_query(self, index: str, body: Dict[str, Any], wait_for_completion: bool = True, **kwargs):
+        deleted = 0
+        matched = list(self.iter_matches(index, body.get("query")))
+        for name, doc_id, _ in matched:
+            deleted += self.indexes[name].remove(doc_id)
+        response = {"total": len(matched), "deleted": deleted, "failures": []}
+        if wait_for_completion:
+            return response
+        # Runs synchronously; the task is reported as already completed
+        task_id = f"fake:{next(self._task_ids)}"
+        self.tasks.results[task_id] = response
+        return {"task": task_id}
+
+    # Search
+
+    def search(self, index: str, body: Optional[Dict[str, Any]] = None, scroll: Optional[str] = None, **kwargs):
+        if self.search_latency:
+            time.sleep(self.search_latency)
+        if self.tail_fraction and self._tail_random.random() < self.tail_fraction:
+            time.sleep(self.tail_latency)
+        return self.run_search(index, body or {}, scroll)
+
+    def run_search(self, index: str, body: Dict[str, Any], scroll: Optional[str] = None) -> Dict[str, Any]:
+        query = body.get("query")
+        knn = find_knn(query)
+
+        if knn is not None:
+            hits = self.knn_hits(index, query, knn)
+        else:
+            hits = [
+                {"_index": name, "_id": doc_id, "_score": 1.0, "_source": source}
+                for name, doc_id, source in self.iter_matches(index, query)
+            ]
+            hits = apply_sort(hits, body.get("sort"), body.get("search_after"))
+
+        total = len(hits)
+        aggregations = terms_aggregations(hits, body.get("aggs") or body.get("aggregations") or {})
+        if not scroll:
+            hits = hits[body.get("from", 0):body.get("from", 0) + body.get("size", 10)]
+        hits = [project_source(hit, body.get("_source")) for hit in hits]
+        response = {
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": total, "relation": "eq"}, "hits": hits},
+        }
+        if aggregations:
+            response["aggregations"] = aggregations
+        if scroll:
+            response["_scroll_id"] = str(next(self._scroll_ids))
+        return response
+
+    def msearch(self, body: Any, index: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        if isinstance(body, (bytes, bytearray)):
+            body = body.decode("utf-8")
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()] if isinstance(body, str) else body
+        # The cluster fans the searches out in parallel, so latency is paid once
+        if self.search_latency:
+            time.sleep(self.search_latency)
+        responses = []
+        for header, search in zip(lines[0::2], lines[1::2]):
+            try:
+                responses.append({**self.run_search(header.get("index") or index, search), "status": 200})
+            except Exception as e:
+                responses.append({"error": {"type": type(e).__name__, "reason": str(e)}, "status": 500})
+        return {"responses": responses}
+
+    def scroll(self, scroll_id: str = None, body: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        # The first search page already returned every hit
+        return {"_scroll_id": scroll_id, "hits": {"hits": []}}
+
+    def clear_scroll(self, **kwargs) -> Dict[str, Any]:
+        return {"succeeded": True}
+
+    def knn_hits(self, index: str, query: Dict[str, Any], knn: Dict[str, Any]) -> List[Dict[str, Any]]:
+        (field, spec), = knn.items()
+        vector = np.asarray(spec["vector"], dtype=np.float32)
+        candidates = []
+        for name in self.resolve(index):
+            target = self.indexes[name]
+            matrix, ids = target.matrix()
+            if not ids:
+                continue
+            scores = 1.0 / (1.0 + ((matrix - vector) ** 2).sum(axis=1))
+            for position in np.argsort(-scores):
+                source = target.docs[ids[position]]
+                if matches(strip_knn(query), ids[position], source):
+                    candidates.append({
+                        "_index": name,
+                        "_id": ids[position],
+                        "_score": float(scores[position]),
+                        "_source": source,
+                    })
+                    if len(candidates) >= spec["k"] * len(self.indexes):
+                        break
+        candidates.sort(key=lambda hit: -hit["_score"])
+        return candidates[:spec["k"]]
+
+    def iter_matches(self, index: str, query: Optional[Dict[str, Any]]):
+        for name in self.resolve(index, missing_ok=True):
+            for doc_id, source in list(self.indexes[name].docs.items()):
+                if matches(query, doc_id, source):
+                    yield name, doc_id, source
+
+
+# Query evaluation helpers
+
+def find_knn(query: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not query:
+        return None
+    if "knn" in query:
+        return query["knn"]
+    for clause in query.get("bool", {}).get("must", []):
+        knn = find_knn(clause)
+        if knn is not None:
+            return knn
+    return None
+
+def strip_knn(query: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not query or "knn" in query:
+        return None
+    if "bool" in query:
+        bool_query = dict(query["bool"])
+        bool_query["must"] = [clause for clause in bool_query.get("must", []) if "knn" not in clause]
+        return {"bool": bool_query}
+    return query
+
+def field_value(source: Dict[str, Any], field: str) -> Any:
+    if field.endswith(".keyword"):
+        field = field[:-len(".keyword")]
+    value = source
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+def values_of(source: Dict[str, Any], field: str) -> List[Any]:
+    value = field_value(source, field)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def matches(query: Optional[Dict[str, Any]], doc_id: str, source: Dict[str, Any]) -> bool:
+    if not query or "match_all" in query:
+        return True
+    (kind, spec), = query.items()
+    if kind == "bool":
+        return (
+            all(matches(clause, doc_id, source) for clause in spec.get("must", []) + spec.get("filter", []))
+            and not any(matches(clause, doc_id, source) for clause in spec.get("must_not", []))
+            and (not spec.get("should") or any(matches(clause, doc_id, source) for clause in spec["should"]))
+        )
+    if kind == "ids":
+        return doc_id in spec["values"]
+    if kind == "term":
+        (field, value), = spec.items()
+        value = value["value"] if isinstance(value, dict) else value
+        return value in values_of(source, field)
+    if kind == "terms":
+        (field, wanted), = spec.items()
+        return any(value in wanted for value in values_of(source, field))
+    if kind in ("match", "match_phrase_prefix", "match_bool_prefix"):
+        (field, text), = spec.items()
+        text = text["query"] if isinstance(text, dict) else text
+        haystack = " ".join(str(value) for value in values_of(source, field)).lower()
+        return all(word in haystack for word in str(text).lower().split())
+    if kind == "range":
+        (field, bounds), = spec.items()
+        value = field_value(source, field)
+        return value is not None and all(
+            (op == "gt" and value > bound) or (op == "gte" and value >= bound)
+            or (op == "lt" and value < bound) or (op == "lte" and value <= bound)
+            for op, bound in bounds.items() if op in ("gt", "gte", "lt", "lte")
+        )
+    raise NotImplementedError(f"Unsupported query clause in fake OpenSearch: {kind}")
+
+def terms_aggregations(hits: List[Dict[str, Any]], aggs: Dict[str, Any]) -> Dict[str, Any]:
+    """Evaluate ``terms`` aggregations over the matching hits"""
+    results = {}
+    for name, spec in aggs.items():
+        if "terms" not in spec:
+            raise NotImplementedError(f"Unsupported aggregation in fake OpenSearch: {spec}")
+        counts: Dict[Any, int] = {}
+        for hit in hits:
+            for value in set(values_of(hit["_source"], spec["terms"]["field"])):
+                counts[value] = counts.get(value, 0) + 1
+        buckets = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))[:spec["terms"].get("size", 10)]
+        results[name] = {"buckets": [{"key": key, "doc_count": count} for key, count in buckets]}
+    return results
+
+def apply_sort(hits, sort, search_after):
+    if not sort:
+        return hits
+    fields = []
+    for spec in sort:
+        if isinstance(spec, str):
+            fields.append((spec, "asc"))
+        else:
+            (field, order), = spec.items()
+            fields.append((field, order if isinstance(order, str) else order.get("order", "asc")))
+
+    for hit in hits:
+        hit["sort"] = [
+            hit["_id"] if field == "_id" else
+            hit["_score"] if field == "_score" else
+            field_value(hit["_source"], field)
+            for field, _ in fields
+        ]
+
+    def key(hit):
+        parts = []
+        for (field, order), value in zip(fields, hit["sort"]):
+            parts.append(SortKey(value, order == "desc"))
+        return parts
+
+    hits.sort(key=key)
+    if search_after:
+        after = [SortKey(value, order == "desc") for (_, order), value in zip(fields, search_after)]
+        hits = [hit for hit in hits if key(hit) > after]
+    return hits
+
+class SortKey:
+    """Comparable wrapper that handles descending order and missing values"""
+    __slots__ = ("value", "descending")
+
+    def __init__(self, value, descending):
+        self.value = "" if value is None else value
+        self.descending = descending
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        if self.descending:
+            return self.value > other.value
+        return self.value < other.value
+
+    def __gt__(self, other):
+        return other < self
+
+def project_source(hit: Dict[str, Any], spec: Any) -> Dict[str, Any]:
+    if spec is None or spec is True:
+        return dict(hit)
+    hit = dict(hit)
+    if spec is False:
+        hit.pop("_source", None)
+        return hit
+    if isinstance(spec, list):
+        hit["_source"] = {field: hit["_source"].get(field) for field in spec if field in hit["_source"]}
+    elif isinstance(spec, dict):
+        excludes = set(spec.get("excludes", []))
+        hit["_source"] = {field: value for field, value in hit["_source"].items() if field not in excludes}
+    return hit
@@ -0,0 +1,281 @@
+"""Offline end-to-end benchmarks for ingestion and query latency.
+
+Runs the real service code against local stand-ins for Bedrock and
+OpenSearch (see ``fakes.py``) and writes machine-readable JSON results.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --compare baseline.json
+
+Cold-start import time and memory are measured by ``startup.py``.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from benchmarks.corpus import WORDS, build_corpus, html_page
+from benchmarks.startup import measure_startup
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="DeepTalk offline benchmarks")
+    parser.add_argument("--documents", type=int, default=10, help="Documents per source type")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per document")
+    parser.add_argument("--ingest-concurrency", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200, help="Queries per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64],
+                        help="Queries per batch retrieval call")
+    parser.add_argument("--embeddings", choices=["fake", "local"], default="fake",
+                        help="fake: deterministic vectors from the fake Bedrock; local: SentenceTransformer")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0)
+    parser.add_argument("--generation-latency-ms", type=float, default=500.0)
+    parser.add_argument("--first-token-latency-ms", type=float, default=300.0)
+    parser.add_argument("--token-interval-ms", type=float, default=10.0)
+    parser.add_argument("--output-tokens", type=int, default=150)
+    parser.add_argument("--search-latency-ms", type=float, default=0.0)
+    parser.add_argument("--search-tail-latency-ms", type=float, default=0.0,
+                        help="Extra latency of searches that hit a slow replica")
+    parser.add_argument("--search-tail-fraction", type=float, default=0.0,
+                        help="Share of searches that hit a slow replica")
+    parser.add_argument("--output", help="Write results JSON to this file instead of stdout")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    return parser.parse_args(argv)
+
+def configure_environment(args: argparse.Namespace, workdir: str):
+    """Point settings at the scratch directory; must run before importing the app"""
+    os.environ["UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+    os.environ["DEDUP_INDEX_PATH"] = os.path.join(workdir, "dedup.sqlite3")
+    os.environ["CONVERSATION_DB_PATH"] = os.path.join(workdir, "conversations.sqlite3")
+    os.environ["BACKGROUND_JOBS_LOCK_PATH"] = os.path.join(workdir, "background-jobs.lock")
+    os.environ["EMBEDDING_PROVIDER"] = "bedrock" if args.embeddings == "fake" else "local"
+    os.environ["OPENSEARCH_SERVICE_ENABLED"] = "false"
+    os.makedirs(os.environ["UPLOAD_DIR"], exist_ok=True)
+
+def install_fakes(args: argparse.Namespace):
+    """Swap the shared Bedrock and OpenSearch clients for local stand-ins"""
+    from benchmarks.fakes import FakeBedrockRuntime, InMemoryOpenSearch
+    from app.services import bedrock_client, vector_store, url_processor
+
+    store = InMemoryOpenSearch(
+        search_latency=args.search_latency_ms / 1000,
+        tail_latency=args.search_tail_latency_ms / 1000,
+        tail_fraction=args.search_tail_fraction,
+    )
+    vector_store._client = store
+    bedrock_client._bedrock_runtime = FakeBedrockRuntime(
+        generation_latency=args.generation_latency_ms / 1000,
+        first_token_latency=args.first_token_latency_ms / 1000,
+        token_interval=args.token_interval_ms / 1000,
+        embedding_latency=args.embedding_latency_ms / 1000,
+        output_tokens=args.output_tokens,
+    )
+
+    class FakeResponse:
+        def __init__(self, text: str):
+            self.text = text
+
+        def raise_for_status(self):
+            pass
+
+    class FakeRequests:
+        @staticmethod
+        def get(url: str, timeout: float = None) -> FakeResponse:
+            return FakeResponse(html_page(args.pages, seed=int(url.rsplit("/", 1)[-1])))
+
+    url_processor.requests = FakeRequests
+    return store
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+
+    def pick(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {
+        "p50_ms": pick(0.50) * 1000,
+        "p95_ms": pick(0.95) * 1000,
+        "p99_ms": pick(0.99) * 1000,
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+async def bench_ingest(args: argparse.Namespace, store, corpus: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Measure ingest throughput per source type"""
+    from app.services.document_processor import process_document
+    from app.services.url_processor import extract_from_url
+
+    sources = {
+        "pdf": [lambda path=path: process_document(path, os.path.basename(path)) for path in corpus["pdf"]],
+        "docx": [lambda path=path: process_document(path, os.path.basename(path)) for path in corpus["docx"]],
+        "url": [lambda i=i: extract_from_url(f"https://bench.local/page/{i}") for i in range(args.documents)],
+    }
+
+    results = {}
+    for source, jobs in sources.items():
+        semaphore = asyncio.Semaphore(args.ingest_concurrency)
+
+        async def run(job):
+            async with semaphore:
+                return await job()
+
+        start = time.perf_counter()
+        doc_ids = await asyncio.gather(*(run(job) for job in jobs))
+        elapsed = time.perf_counter() - start
+
+        chunks = duplicates = 0
+        for doc_id in doc_ids:
+            metadata = store.get(index="document_metadata", id=doc_id)["_source"]
+            chunks += metadata.get("chunk_count") or 0
+            duplicates += metadata.get("duplicate_chunk_count") or 0
+        pages = args.pages * len(doc_ids)
+        results[source] = {
+            "documents": len(doc_ids),
+            "pages": pages,
+            "chunks": chunks,
+            "duplicate_chunks": duplicates,
+            "seconds": elapsed,
+            "documents_per_sec": len(doc_ids) / elapsed,
+            "pages_per_sec": pages / elapsed,
+            "chunks_per_sec": chunks / elapsed,
+        }
+    return results
+
+async def bench_queries(args: argparse.Namespace) -> Dict[str, Any]:
+    """Measure /api/conversation/query latency percentiles at each concurrency level"""
+    import httpx
+    from app.main import app
+
+    rng = random.Random(7)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrency in args.concurrency:
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies: List[float] = []
+            stage_totals: Dict[str, float] = {}
+            errors = 0
+
+            async def one_query():
+                nonlocal errors
+                query = " ".join(rng.choice(WORDS) for _ in range(8))
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/api/conversation/query", json={"query": query})
+                    latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+                for entry in filter(None, response.headers.get("server-timing", "").split(",")):
+                    name, _, duration = entry.strip().partition(";dur=")
+                    stage_totals[name] = stage_totals.get(name, 0.0) + float(duration or 0)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one_query() for _ in range(args.queries)))
+            elapsed = time.perf_counter() - start
+
+            results[str(concurrency)] = {
+                "requests": args.queries,
+                "errors": errors,
+                "requests_per_sec": args.queries / elapsed,
+                **percentiles(latencies),
+                "stage_mean_ms": {name: total / args.queries for name, total in sorted(stage_totals.items())},
+            }
+    return results
+
+async def bench_batch_retrieval(args: argparse.Namespace) -> Dict[str, Any]:
+    """Measure batch retrieval throughput at each batch size"""
+    from app.services.retrieval import retrieve_relevant_chunks_batch
+
+    rng = random.Random(11)
+    results = {}
+    for batch_size in args.batch_sizes:
+        batches = max(1, args.queries // batch_size)
+        latencies: List[float] = []
+        start = time.perf_counter()
+        for _ in range(batches):
+            queries = [{"query": " ".join(rng.choice(WORDS) for _ in range(8))} for _ in range(batch_size)]
+            batch_start = time.perf_counter()
+            await retrieve_relevant_chunks_batch(queries)
+            latencies.append(time.perf_counter() - batch_start)
+        elapsed = time.perf_counter() - start
+        results[str(batch_size)] = {
+            "batches": batches,
+            "queries_per_sec": batches * batch_size / elapsed,
+            **percentiles(latencies),
+        }
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+def flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    if isinstance(data, dict):
+        flat = {}
+        for key, value in data.items():
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else key))
+        return flat
+    return {prefix: data} if isinstance(data, (int, float)) and not isinstance(data, bool) else {}
+
+def print_comparison(baseline: Dict[str, Any], current: Dict[str, Any]):
+    """Print relative change of every numeric result against a baseline run"""
+    before = flatten(baseline["results"])
+    after = flatten(current["results"])
+    print(f"{'metric':60} {'baseline':>12} {'current':>12} {'change':>8}", file=sys.stderr)
+    for key in sorted(before.keys() & after.keys()):
+        change = (after[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+        print(f"{key:60} {before[key]:12.2f} {after[key]:12.2f} {change:+7.1f}%", file=sys.stderr)
+
+async def main_async(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    store = install_fakes(args)
+    corpus = build_corpus(os.path.join(workdir, "corpus"), args.documents, args.pages)
+
+    ingest = await bench_ingest(args, store, corpus)
+    queries = await bench_queries(args)
+    batch_retrieval = await bench_batch_retrieval(args)
+
+    from app.services import document_processor
+    if document_processor._process_pool is not None:
+        document_processor._process_pool.shutdown()
+
+    return {
+        "git_commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": {"ingest": ingest, "query": queries, "batch_retrieval": batch_retrieval},
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="deeptalk-bench-") as workdir:
+        configure_environment(args, workdir)
+        # Measured in fresh interpreters, before this one imports the app
+        startup = measure_startup()
+        report = asyncio.run(main_async(args, workdir))
+        report["results"]["startup"] = startup
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
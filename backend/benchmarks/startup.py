@@ -0,0 +1,102 @@
+"""Cold-start benchmark: import time and memory of the API process.
+
+Imports ``app.main`` in fresh interpreters and reports how long the import
+took, the peak resident memory and which heavy optional dependencies got
+loaded. Exits non-zero when a budget is exceeded, so it can gate CI.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.startup --runs 5 --max-import-seconds 1.5 --max-rss-mb 200
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Any, Dict, List, Optional
+
+# Dependencies that should only load when their backend is actually used
+HEAVY_MODULES = ["sentence_transformers", "torch", "PyPDF2", "docx2txt", "bs4", "boto3"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+peak_kb = None
+try:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                peak_kb = int(line.split()[1])
+except OSError:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    peak_kb = peak // 1024 if sys.platform == "darwin" else peak
+modules = json.loads(sys.argv[1])
+print(json.dumps({
+    "import_seconds": elapsed,
+    "peak_rss_mb": peak_kb / 1024,
+    "loaded": [name for name in modules if name in sys.modules],
+}))
+"""
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="DeepTalk startup benchmark")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to measure")
+    parser.add_argument("--max-import-seconds", type=float, help="Fail when the median import time exceeds this")
+    parser.add_argument("--max-rss-mb", type=float, help="Fail when the median peak RSS exceeds this")
+    parser.add_argument("--output", help="Write results JSON to this file instead of stdout")
+    return parser.parse_args(argv)
+
+def measure_once() -> Dict[str, Any]:
+    """Import the app in a new interpreter and read back its measurements"""
+    # Keep the probe from warming up models or touching real services
+    env = {**os.environ, "EMBEDDING_WARMUP": "false"}
+    output = subprocess.check_output(
+        [sys.executable, "-c", PROBE, json.dumps(HEAVY_MODULES)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        text=True,
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_startup(runs: int = 3) -> Dict[str, Any]:
+    samples: List[Dict[str, Any]] = [measure_once() for _ in range(runs)]
+    return {
+        "import_seconds": statistics.median(sample["import_seconds"] for sample in samples),
+        "peak_rss_mb": statistics.median(sample["peak_rss_mb"] for sample in samples),
+        "heavy_modules_loaded": sorted({name for sample in samples for name in sample["loaded"]}),
+    }
+
+def check_budgets(result: Dict[str, Any], max_import_seconds: Optional[float], max_rss_mb: Optional[float]) -> List[str]:
+    """Describe every budget the measurement exceeds"""
+    failures = []
+    if max_import_seconds is not None and result["import_seconds"] > max_import_seconds:
+        failures.append(f"import took {result['import_seconds']:.2f}s, budget {max_import_seconds:.2f}s")
+    if max_rss_mb is not None and result["peak_rss_mb"] > max_rss_mb:
+        failures.append(f"peak RSS {result['peak_rss_mb']:.1f} MB, budget {max_rss_mb:.1f} MB")
+    return failures
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = measure_startup(args.runs)
+    failures = check_budgets(result, args.max_import_seconds, args.max_rss_mb)
+    result["budget_failures"] = failures
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for failure in failures:
+        print(f"Startup budget exceeded: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
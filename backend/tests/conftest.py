@@ -0,0 +1,75 @@
+"""Shared fixtures: the real service code against the in-memory OpenSearch and Bedrock fakes."""
+import os
+import sys
+import shutil
+import asyncio
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Settings are read once, so the environment is set before the app is imported
+WORKDIR = tempfile.mkdtemp(prefix="deeptalk-tests-")
+os.environ.update(
+    UPLOAD_DIR=os.path.join(WORKDIR, "uploads"),
+    DEDUP_INDEX_PATH=os.path.join(WORKDIR, "dedup.sqlite3"),
+    CONVERSATION_DB_PATH=os.path.join(WORKDIR, "conversations.sqlite3"),
+    BACKGROUND_JOBS_LOCK_PATH=os.path.join(WORKDIR, "background-jobs.lock"),
+    DELETION_STATUS_PATH=os.path.join(WORKDIR, "deletions.sqlite3"),
+    EMBEDDING_PROVIDER="bedrock",
+    OPENSEARCH_SERVICE_ENABLED="false",
+    PROCESS_POOL_WORKERS="2",
+)
+os.makedirs(os.environ["UPLOAD_DIR"], exist_ok=True)
+
+from benchmarks.fakes import FakeBedrockRuntime, InMemoryOpenSearch  # noqa: E402
+
+@pytest.fixture(scope="session")
+def loop():
+    """One event loop for the session, since module-level locks and semaphores bind to a loop"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    from app.services import document_processor
+    if document_processor._process_pool is not None:
+        document_processor._process_pool.shutdown()
+        document_processor._process_pool = None
+    loop.close()
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+@pytest.fixture
+def run(loop):
+    """Run a coroutine to completion on the session loop"""
+    return loop.run_until_complete
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A fresh in-memory OpenSearch and fake Bedrock, with every process-level cache reset"""
+    from app.services import bedrock_client, dedup, reindex, vector_store
+
+    opensearch = InMemoryOpenSearch()
+    monkeypatch.setattr(vector_store, "_client", opensearch)
+    monkeypatch.setattr(vector_store, "_indexes_ready", False)
+    monkeypatch.setattr(bedrock_client, "_bedrock_runtime", FakeBedrockRuntime(
+        generation_latency=0, first_token_latency=0, token_interval=0, embedding_latency=0, output_tokens=5,
+    ))
+    vector_store._index_spec_cache.clear()
+    vector_store._facet_cache.clear()
+
+    settings = vector_store.settings
+    monkeypatch.setattr(settings, "DEDUP_INDEX_PATH", str(tmp_path / "dedup.sqlite3"))
+    monkeypatch.setattr(dedup, "_index", None)
+    shutil.rmtree(reindex.get_job_dir(), ignore_errors=True)
+    yield opensearch
+    if dedup._index is not None:
+        dedup._index.conn.close()
+
+@pytest.fixture
+def write_document(tmp_path):
+    """Write a text file to ingest; returns its path"""
+    def write(name: str, text: str) -> str:
+        path = tmp_path / name
+        path.write_text(text)
+        return str(path)
+    return write
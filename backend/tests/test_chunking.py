@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.services.extraction import check_chunking, split_text
+
+def test_split_text_advances_when_overlap_reaches_chunk_size():
+    text = "word " * 200
+    chunks = split_text(text, "doc", chunk_size=100, overlap=100)
+    assert chunks
+    assert len(chunks) <= len(text)
+
+@pytest.mark.parametrize("chunk_size, overlap", [(0, None), (-5, None), (None, -1), (100, 50), (100, 60)])
+def test_check_chunking_rejects(chunk_size, overlap):
+    with pytest.raises(ValueError):
+        check_chunking(chunk_size, overlap)
+
+@pytest.mark.parametrize("chunk_size, overlap", [(None, None), (1000, 0), (100, 49)])
+def test_check_chunking_accepts(chunk_size, overlap):
+    check_chunking(chunk_size, overlap)
+
+def test_reprocess_request_validation():
+    from pydantic import ValidationError
+    from app.api.knowledge_base import ReprocessRequest
+
+    with pytest.raises(ValidationError):
+        ReprocessRequest(document_ids=["a"], chunk_size=150)
+    with pytest.raises(ValidationError):
+        ReprocessRequest(document_ids=["a"], chunk_size=1000, overlap=-1)
+    ReprocessRequest(document_ids=["a"], chunk_size=1000, overlap=100)
+
+def test_reprocess_without_ids_starts_a_background_job(store, run, write_document):
+    import httpx
+    from app.main import app
+    from app.services import reindex
+    from app.services.document_processor import process_document
+
+    run(process_document(write_document("a.txt", "alpha beta gamma " * 300), "a.txt"))
+
+    async def request():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/kb/reprocess", json={"chunk_size": 800, "overlap": 100})
+
+    response = run(request())
+    assert response.status_code == 200
+    job = response.json()["job"]
+    assert job["chunk_size"] == 800
+
+    async def wait():
+        while reindex._running_jobs:
+            await asyncio.sleep(0.01)
+
+    run(wait())
+    assert reindex.load_job(job["id"]).status == "completed"
@@ -0,0 +1,10 @@
+from app.services.conversation_store import ConversationStore, store_messages
+from app.utils.config import get_settings
+
+def test_stored_turn_is_visible_to_other_workers(store, run):
+    run(store_messages("shared-conversation", "question", "answer"))
+
+    # Another worker has its own connection and an empty write-behind queue
+    other_worker = ConversationStore(get_settings().CONVERSATION_DB_PATH)
+    window = other_worker.history_window("shared-conversation", 1000)
+    assert [message["content"] for message in window.messages] == ["question", "answer"]
@@ -0,0 +1,42 @@
+import random
+
+import numpy as np
+
+from app.services.dedup import minhash_signature
+from app.services.document_processor import process_document
+from app.services.retrieval import retrieve_relevant_chunks, retrieve_relevant_chunks_batch
+
+def varied_text(seed: int, words: int = 1500) -> str:
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(400)]
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+def test_minhash_signature_stays_below_the_prime():
+    signature = minhash_signature(varied_text(1, 50))
+    assert signature.dtype == np.uint64
+    assert int(signature.max()) < 4294967311
+
+def test_duplicate_only_document_is_searchable(store, run, write_document):
+    text = varied_text(7)
+    canonical_id = run(process_document(write_document("original.txt", text), "original.txt"))
+    duplicate_id = run(process_document(write_document("copy.txt", text), "copy.txt"))
+
+    indexed = {
+        source["document_id"]
+        for name, index in store.indexes.items()
+        if name.startswith("knowledge_chunks")
+        for source in index.docs.values()
+    }
+    assert duplicate_id not in indexed
+
+    results = run(retrieve_relevant_chunks(text[:200], knowledge_base_ids=[duplicate_id]))
+    assert results
+    assert {result["document_id"] for result in results} == {duplicate_id}
+    assert {result["source"]["title"] for result in results} == {"copy.txt"}
+
+    # Searching both documents keeps the canonical attribution
+    both = run(retrieve_relevant_chunks(text[:200], knowledge_base_ids=[canonical_id, duplicate_id]))
+    assert {result["document_id"] for result in both} == {canonical_id}
+
+    [batch] = run(retrieve_relevant_chunks_batch([{"query": text[:200], "knowledge_base_ids": [duplicate_id]}]))
+    assert batch and {result["document_id"] for result in batch} == {duplicate_id}
@@ -0,0 +1,55 @@
+import asyncio
+
+from app.services import document_lifecycle
+from app.services.document_processor import process_document, reprocess_documents
+from app.services.vector_store import list_document_ids, update_document_metadata
+
+def chunk_count(store, doc_id: str) -> int:
+    """Chunks of a document in any chunk index version"""
+    return sum(
+        1
+        for name, index in store.indexes.items()
+        if name.startswith("knowledge_chunks")
+        for source in index.docs.values()
+        if source["document_id"] == doc_id
+    )
+
+async def wait_for_deletions():
+    while document_lifecycle._running_deletions:
+        await asyncio.sleep(0.01)
+
+def test_deleting_document_is_not_listed_or_reprocessed(store, run, write_document):
+    doc_id = run(process_document(write_document("a.txt", "alpha beta gamma " * 300), "a.txt"))
+    run(update_document_metadata(doc_id, {"status": "deleting"}))
+
+    assert doc_id not in run(list_document_ids())
+    [result] = run(reprocess_documents([doc_id], chunk_size=800, overlap=100))
+    assert not result["success"]
+    assert "being deleted" in result["error"]
+
+def test_reprocess_racing_a_deletion_leaves_no_chunks(store, run, write_document):
+    doc_id = run(process_document(write_document("a.txt", "alpha beta gamma " * 300), "a.txt"))
+
+    async def race():
+        reprocess = asyncio.ensure_future(reprocess_documents([doc_id], chunk_size=800, overlap=100))
+        # Let the reprocess get past its first status check before the delete
+        await asyncio.sleep(0)
+        await document_lifecycle.delete_document(doc_id)
+        await reprocess
+        await wait_for_deletions()
+
+    run(race())
+    assert run(document_lifecycle.get_deletion_status(doc_id))["status"] == "deleted"
+    assert chunk_count(store, doc_id) == 0
+
+def test_deletion_status_is_shared_between_workers(store, run, write_document):
+    from app.utils.config import get_settings
+
+    doc_id = run(process_document(write_document("a.txt", "alpha beta gamma " * 300), "a.txt"))
+    run(document_lifecycle.delete_document(doc_id))
+    run(wait_for_deletions())
+
+    # A worker that did not run the deletion reads the same file
+    other_worker = document_lifecycle.DeletionStatusStore(get_settings().DELETION_STATUS_PATH)
+    assert other_worker.get(doc_id)["status"] == "deleted"
+    assert other_worker.get("never-deleted") is None
@@ -0,0 +1,72 @@
+from app.models.knowledge_base import Document, DocumentMetadata
+from app.services import reindex, vector_store
+from app.services.document_processor import embed_chunks, process_document
+from app.services.embedding import get_embedding_spec
+from app.services.extraction import split_text
+from app.services.vector_store import (
+    CHUNK_INDEX_ALIAS,
+    embedding_model_key,
+    get_active_embedding_spec,
+    store_document_chunks,
+)
+from tests.test_dedup import varied_text
+
+NEW_MODEL = "amazon.titan-embed-text-v2"
+
+async def run_reindex(**kwargs):
+    job = await reindex.start_reindex(embedding_provider="bedrock", embedding_model=NEW_MODEL, **kwargs)
+    await reindex._running_jobs[job.id]
+    return reindex.load_job(job.id)
+
+def chunk_models(store, index_name: str, doc_id: str):
+    return [
+        source.get("embedding_model")
+        for source in store.indexes[index_name].docs.values()
+        if source["document_id"] == doc_id
+    ]
+
+def test_upload_embedded_before_the_swap_is_re_embedded(store, run, write_document):
+    run(process_document(write_document("a.txt", varied_text(1)), "a.txt"))
+    old_spec = run(get_active_embedding_spec())
+
+    # Embedded with the old model, written once the alias points at the new index
+    document = Document(DocumentMetadata(id="late", title="late.txt", type="txt"), split_text(varied_text(2), "late"))
+    run(embed_chunks(document))
+    assert document.embedding_spec == old_spec
+
+    job = run(run_reindex())
+    assert job.status == "completed"
+    run(store_document_chunks(document))
+
+    models = chunk_models(store, job.target_index, "late")
+    assert models and set(models) == {embedding_model_key({"provider": "bedrock", "model": NEW_MODEL})}
+
+def test_catch_up_re_embeds_chunks_of_the_previous_model(store, run, write_document):
+    doc_id = run(process_document(write_document("a.txt", varied_text(3)), "a.txt"))
+    job = run(run_reindex())
+    target = store.indexes[job.target_index]
+
+    # Chunks written through the alias by a worker still on the previous model
+    old_model = embedding_model_key(get_embedding_spec())
+    for chunk_id, source in list(target.docs.items()):
+        if source["document_id"] == doc_id:
+            target.put(chunk_id, {**source, "embedding_model": old_model})
+
+    job.cursor = None
+    run(reindex.copy_documents(job, catch_up=True))
+    assert set(chunk_models(store, job.target_index, doc_id)) == {
+        embedding_model_key({"provider": "bedrock", "model": NEW_MODEL})
+    }
+
+def test_active_spec_follows_a_swap_made_elsewhere(store, run, write_document):
+    run(process_document(write_document("a.txt", varied_text(4)), "a.txt"))
+    source_index = run(vector_store.get_chunk_index_target())
+    job = run(run_reindex())
+    assert run(get_active_embedding_spec())["model"] == NEW_MODEL
+
+    # Another worker rolls the alias back; this one has the new spec cached
+    store.indices.update_aliases(body={"actions": [
+        {"remove": {"index": job.target_index, "alias": CHUNK_INDEX_ALIAS}},
+        {"add": {"index": source_index, "alias": CHUNK_INDEX_ALIAS}},
+    ]})
+    assert run(get_active_embedding_spec()) == get_embedding_spec()
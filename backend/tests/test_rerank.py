@@ -0,0 +1,58 @@
+import os
+import sys
+import types
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from app.services import embedding_sidecar, rerank  # noqa: E402
+from app.services.providers import register_provider  # noqa: E402
+
+@pytest.fixture
+def fake_cross_encoder(monkeypatch):
+    """A cross-encoder provider scoring a pair by the passage length"""
+    module = types.ModuleType("fake_cross_encoder")
+    module.calls = 0
+
+    async def score(pairs, model):
+        module.calls += 1
+        return np.asarray([len(passage) for _, passage in pairs], dtype=np.float32)
+
+    async def warmup(model):
+        await score([("warmup", "warmup")], model)
+
+    module.score, module.warmup = score, warmup
+    monkeypatch.setitem(sys.modules, "fake_cross_encoder", module)
+    register_provider("reranker", "cross_encoder", "fake_cross_encoder")
+    yield module
+    register_provider("reranker", "cross_encoder", "app.services.rerank_local")
+
+def test_reranking_is_served_by_the_sidecar(fake_cross_encoder, run, tmp_path, monkeypatch):
+    from app.services.embedding_server import serve
+
+    path = str(tmp_path / "sidecar.sock")
+    monkeypatch.setattr(embedding_sidecar.settings, "EMBEDDING_SIDECAR_SOCKET", path)
+    monkeypatch.setattr(embedding_sidecar.settings, "EMBEDDING_WARMUP", False)
+    monkeypatch.setattr(embedding_sidecar, "_pool", None)
+
+    async def scenario():
+        server = asyncio.ensure_future(serve(path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        try:
+            backend = rerank.get_rerank_backend()
+            assert backend.__name__ == "app.services.rerank_sidecar"
+            return await backend.score([("q", "short"), ("q", "a longer passage")], "model")
+        finally:
+            for _, writer in embedding_sidecar.get_pool().idle:
+                writer.close()
+                await writer.wait_closed()
+            server.cancel()
+            await asyncio.gather(server, return_exceptions=True)
+
+    scores = run(scenario())
+    assert scores.tolist() == [5.0, 16.0]
+    assert fake_cross_encoder.calls == 1
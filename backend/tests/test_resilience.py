@@ -0,0 +1,49 @@
+import pytest
+
+from app.services import bedrock_client
+from app.services.bedrock_client import BedrockClient
+from app.utils import resilience
+from app.utils.resilience import CircuitBreaker, DeadlineExceededError, get_breaker, set_deadline
+
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+@pytest.fixture
+def slow_bedrock(store, monkeypatch):
+    """Fresh breakers and a Bedrock fake that answers after 0.2s"""
+    monkeypatch.setattr(resilience, "_breakers", {})
+    runtime = bedrock_client._bedrock_runtime
+    runtime.generation_latency = runtime.first_token_latency = 0.2
+    return runtime
+
+async def generate(deadline=None):
+    if deadline is not None:
+        set_deadline(deadline)
+    return await BedrockClient({}).generate_response("question", [])
+
+async def stream(deadline):
+    set_deadline(deadline)
+    return [token async for token in BedrockClient({}).generate_response_stream("question", [])]
+
+def test_exhausted_request_deadline_does_not_open_the_circuit(slow_bedrock, run):
+    breaker = get_breaker(f"bedrock:{MODEL_ID}")
+    for _ in range(breaker.failure_threshold + 1):
+        with pytest.raises(DeadlineExceededError):
+            run(generate(deadline=0.05))
+        with pytest.raises(DeadlineExceededError):
+            run(stream(deadline=0.05))
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+def test_generation_over_its_own_cap_opens_the_circuit(slow_bedrock, run, monkeypatch):
+    monkeypatch.setattr(bedrock_client.settings, "BEDROCK_TIMEOUT_SECONDS", 0.05)
+    breaker = get_breaker(f"bedrock:{MODEL_ID}")
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(DeadlineExceededError):
+            run(generate())
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_unknown_models_are_rejected_without_a_breaker(store, monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    with pytest.raises(ValueError):
+        BedrockClient({"modelId": "anthropic.claude-made-up"})
+    assert resilience._breakers == {}
@@ -0,0 +1,27 @@
+from app.services import dedup, document_lifecycle
+from app.services.document_processor import process_document
+from app.services.snapshot import export_snapshot, import_snapshot
+from tests.test_dedup import varied_text
+from tests.test_document_lifecycle import chunk_count, wait_for_deletions
+
+def test_snapshot_round_trip_keeps_duplicate_links(store, run, write_document, tmp_path):
+    text = varied_text(11)
+    canonical_id = run(process_document(write_document("original.txt", text), "original.txt"))
+    duplicate_id = run(process_document(write_document("copy.txt", text), "copy.txt"))
+    index = dedup.get_dedup_index()
+    links = sorted(index.iter_duplicates())
+    signatures = sorted(index.iter_signatures())
+    assert links and chunk_count(store, duplicate_id) == 0
+
+    manifest = run(export_snapshot(str(tmp_path / "snapshot")))
+    assert manifest["dedup"] == {"signatures": len(signatures), "duplicates": len(links)}
+
+    run(import_snapshot(str(tmp_path / "snapshot"), replace=True))
+    assert sorted(index.iter_duplicates()) == links
+    assert sorted(index.iter_signatures()) == signatures
+
+    # The restored links still promote the duplicates when their canonical document goes
+    run(document_lifecycle.delete_document(canonical_id))
+    run(wait_for_deletions())
+    assert chunk_count(store, canonical_id) == 0
+    assert chunk_count(store, duplicate_id) == len(links)
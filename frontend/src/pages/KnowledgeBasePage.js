@@ -26,7 +26,6 @@ export default function KnowledgeBasePage() {
         params: {
           search: searchQuery || undefined,
           tags: selectedTags.length ? selectedTags : undefined,
-          skip: 0,
           limit: 100
         }
       });